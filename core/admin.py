@@ -1,5 +1,7 @@
-from django.contrib import admin
-from .models import Restaurant, Review, Reservation
+from django.contrib import admin, messages
+from . import availability
+from .models import Restaurant, Review, Reservation, ArchivedReservation, EnrichmentJob
+from .services import ReservationService
 
 @admin.register(Restaurant)
 class RestaurantAdmin(admin.ModelAdmin):
@@ -25,9 +27,32 @@ class ReservationAdmin(admin.ModelAdmin):
     date_hierarchy = 'reservation_time'
 
     def confirm_reservations(self, request, queryset):
-        queryset.update(status='confirmed')
+        # Save one by one so the occupancy signals see the change
+        for reservation in queryset:
+            reservation.status = 'confirmed'
+            try:
+                reservation.save(update_fields=['status', 'updated_at'])
+            except availability.SlotFull:
+                self.message_user(request, f"{reservation} no longer fits its slot", messages.ERROR)
     confirm_reservations.short_description = "Mark selected reservations as confirmed"
 
     def cancel_reservations(self, request, queryset):
-        queryset.update(status='cancelled')
+        for reservation in queryset:
+            ReservationService.cancel_reservation(reservation)
     cancel_reservations.short_description = "Mark selected reservations as cancelled"
+
+
+@admin.register(ArchivedReservation)
+class ArchivedReservationAdmin(admin.ModelAdmin):
+    list_display = ('id', 'restaurant', 'user', 'party_size', 'reservation_time', 'status', 'archived_at')
+    list_filter = ('status',)
+    search_fields = ('restaurant__name', 'user__username')
+    date_hierarchy = 'reservation_time'
+
+
+@admin.register(EnrichmentJob)
+class EnrichmentJobAdmin(admin.ModelAdmin):
+    list_display = ('key', 'status', 'attempts', 'created_count', 'started_at', 'updated_at')
+    list_filter = ('status',)
+    search_fields = ('key',)
+    readonly_fields = ('created_at', 'updated_at')
@@ -0,0 +1,193 @@
+import logging
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+
+from . import telemetry
+
+logger = logging.getLogger(__name__)
+
+queue_depth = telemetry.registry.gauge(
+    'llm_admission_queue_depth', "LLM calls waiting for admission")
+in_flight = telemetry.registry.gauge(
+    'llm_admission_in_flight', "LLM calls currently admitted")
+shed_total = telemetry.registry.counter(
+    'llm_admission_shed_total', "LLM calls rejected by admission control", ('reason',))
+wait_seconds = telemetry.registry.histogram(
+    'llm_admission_wait_seconds', "Time spent waiting for LLM admission",
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+
+
+class LLMOverloaded(Exception):
+    """Raised when an LLM call is shed instead of queued; callers should degrade"""
+
+    def __init__(self, reason):
+        super().__init__(f"LLM call shed: {reason}")
+        self.reason = reason
+
+
+class _Ticket:
+    __slots__ = ('client', 'tokens', 'granted')
+
+    def __init__(self, client, tokens):
+        self.client = client
+        self.tokens = tokens
+        self.granted = False
+
+
+class AdmissionController:
+    """
+    Process-wide gate for outbound LLM calls.
+
+    Admits at most max_concurrency calls at once and spends from a token
+    bucket refilled at tokens_per_minute. Waiting calls are kept in one queue
+    per client and served round-robin, so a single busy user cannot starve
+    the others. When the wait queue (or a client's share of it) is full, or a
+    call waits longer than max_wait, it is shed with LLMOverloaded.
+    """
+
+    def __init__(self, max_concurrency=8, tokens_per_minute=90000, max_queue=32,
+                 max_queue_per_client=4, max_wait=2.0):
+        self.max_concurrency = max_concurrency
+        self.tokens_per_minute = tokens_per_minute
+        self.max_queue = max_queue
+        self.max_queue_per_client = max_queue_per_client
+        self.max_wait = max_wait
+        self._cond = threading.Condition()
+        self._queues = {}
+        self._rotation = deque()
+        self._waiting = 0
+        self._in_flight = 0
+        self._bucket = float(tokens_per_minute)
+        self._refilled_at = time.monotonic()
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            max_concurrency=getattr(settings, 'LLM_MAX_CONCURRENCY', 8),
+            tokens_per_minute=getattr(settings, 'LLM_TOKENS_PER_MINUTE', 90000),
+            max_queue=getattr(settings, 'LLM_ADMISSION_QUEUE_SIZE', 32),
+            max_queue_per_client=getattr(settings, 'LLM_ADMISSION_QUEUE_PER_CLIENT', 4),
+            max_wait=getattr(settings, 'LLM_ADMISSION_TIMEOUT', 2.0),
+        )
+
+    def _refill(self):
+        now = time.monotonic()
+        rate = self.tokens_per_minute / 60.0
+        self._bucket = min(float(self.tokens_per_minute), self._bucket + (now - self._refilled_at) * rate)
+        self._refilled_at = now
+
+    def _dispatch(self):
+        """Grant queued tickets round-robin while slots and tokens allow. Caller holds the lock."""
+        self._refill()
+        granted = False
+        while self._in_flight < self.max_concurrency and self._rotation:
+            client = self._rotation[0]
+            ticket = self._queues[client][0]
+            need = min(ticket.tokens, self.tokens_per_minute)
+            if self._bucket < need:
+                break
+            self._bucket -= need
+            self._in_flight += 1
+            self._waiting -= 1
+            ticket.granted = True
+            granted = True
+            self._queues[client].popleft()
+            self._rotation.popleft()
+            if self._queues[client]:
+                self._rotation.append(client)
+            else:
+                del self._queues[client]
+        if granted:
+            self._cond.notify_all()
+        self._publish()
+
+    def _publish(self):
+        queue_depth.set(self._waiting)
+        in_flight.set(self._in_flight)
+
+    def _token_wait(self, tokens):
+        """Seconds until the bucket holds enough tokens for the next ticket"""
+        rate = self.tokens_per_minute / 60.0
+        missing = min(tokens, self.tokens_per_minute) - self._bucket
+        return max(0.01, missing / rate) if missing > 0 and rate > 0 else 0.05
+
+    def _shed(self, reason):
+        shed_total.inc(reason=reason)
+        logger.warning(f"Shedding LLM call: {reason}")
+        raise LLMOverloaded(reason)
+
+    def acquire(self, client='anonymous', tokens=0):
+        """Block until admitted or raise LLMOverloaded. Pair with release()."""
+        started = time.monotonic()
+        with self._cond:
+            # Fast path: nobody waiting and capacity available
+            self._refill()
+            need = min(tokens, self.tokens_per_minute)
+            if not self._rotation and self._in_flight < self.max_concurrency and self._bucket >= need:
+                self._bucket -= need
+                self._in_flight += 1
+                self._publish()
+                wait_seconds.observe(0.0)
+                return
+
+            if self._waiting >= self.max_queue:
+                self._shed('queue_full')
+            if len(self._queues.get(client, ())) >= self.max_queue_per_client:
+                self._shed('client_queue_full')
+
+            ticket = _Ticket(client, tokens)
+            if client not in self._queues:
+                self._queues[client] = deque()
+                self._rotation.append(client)
+            self._queues[client].append(ticket)
+            self._waiting += 1
+            self._dispatch()
+
+            deadline = started + self.max_wait
+            while not ticket.granted:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._queues[client].remove(ticket)
+                    if not self._queues[client]:
+                        del self._queues[client]
+                        self._rotation.remove(client)
+                    self._waiting -= 1
+                    self._publish()
+                    self._shed('timeout')
+                head = self._queues[self._rotation[0]][0] if self._rotation else ticket
+                self._cond.wait(min(remaining, self._token_wait(head.tokens)))
+                self._dispatch()
+
+        wait_seconds.observe(time.monotonic() - started)
+
+    def release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._dispatch()
+
+    def snapshot(self):
+        with self._cond:
+            self._refill()
+            return {
+                'in_flight': self._in_flight,
+                'waiting': self._waiting,
+                'clients_waiting': len(self._queues),
+                'tokens_available': int(self._bucket),
+            }
+
+
+_controller = None
+_controller_lock = threading.Lock()
+
+
+def get_controller():
+    """Lazily built process-wide controller (settings may change under tests)"""
+    global _controller
+    if _controller is None:
+        with _controller_lock:
+            if _controller is None:
+                _controller = AdmissionController.from_settings()
+    return _controller
@@ -8,6 +8,12 @@ class CoreConfig(AppConfig):
         """
         Initialize app settings and signal handlers
         """
-        # Import signal handlers if needed
-        # from . import signals
-        pass
+        from django.db.backends.signals import connection_created
+
+        from .db import configure_sqlite
+
+        # WAL, busy timeout and cache pragmas on every new SQLite connection
+        connection_created.connect(configure_sqlite, dispatch_uid='core.db.configure_sqlite')
+
+        # Keep slot occupancy in step with reservations
+        from . import signals  # noqa: F401
@@ -0,0 +1,335 @@
+"""
+Capacity-aware availability on a per-restaurant, per-day occupancy array.
+
+The day is cut into AVAILABILITY_SLOT_MINUTES buckets and SlotOccupancy holds
+the seats taken in each bucket by active reservations. A seating of
+average_dining_time minutes covers every bucket it overlaps, so a party fits
+when capacity minus the busiest covered bucket leaves room for it. Bookings
+and cancellations add or subtract their party size from the covered buckets
+(see core.signals), so a check reads one day's buckets and never scans
+reservations.
+"""
+import logging
+import math
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import hours
+from .lazy import lazy_import
+from .models import Reservation, SlotOccupancy
+
+logger = logging.getLogger(__name__)
+
+np = lazy_import('numpy')
+
+
+def slot_minutes():
+    return getattr(settings, 'AVAILABILITY_SLOT_MINUTES', 15)
+
+
+def slots_per_day():
+    return 24 * 60 // slot_minutes()
+
+
+def local_datetime(value):
+    """Wall-clock time at the restaurant (the project time zone)"""
+    if timezone.is_aware(value):
+        return timezone.localtime(value)
+    return value
+
+
+def seating_slots(start, dining_minutes):
+    """(date, slot) buckets covered by a seating; late seatings spill into the next day"""
+    start = local_datetime(start)
+    size = slot_minutes()
+    per_day = slots_per_day()
+    minute = start.hour * 60 + start.minute
+    first = minute // size
+    last = max(first + 1, math.ceil((minute + dining_minutes) / size))
+    day = start.date()
+    return [(day + timedelta(days=index // per_day), index % per_day) for index in range(first, last)]
+
+
+def _by_date(slots):
+    grouped = defaultdict(list)
+    for day, slot in slots:
+        grouped[day].append(slot)
+    return grouped
+
+
+def held_seats(restaurant_id, slots):
+    """{(date, slot): seats} for the given buckets; buckets without a row hold none"""
+    grouped = _by_date(slots)
+    rows = SlotOccupancy.objects.filter(
+        restaurant_id=restaurant_id, date__in=list(grouped), slot__in={slot for _, slot in slots},
+    ).values_list('date', 'slot', 'seats')
+    held = {(day, slot): seats for day, slot, seats in rows}
+    return {key: held.get(key, 0) for key in slots}
+
+
+def day_occupancy(restaurant_id, day):
+    """Seats held in every bucket of one day, as a list indexed by slot"""
+    occupancy = [0] * slots_per_day()
+    rows = SlotOccupancy.objects.filter(restaurant_id=restaurant_id, date=day).values_list('slot', 'seats')
+    for slot, seats in rows:
+        occupancy[slot] = seats
+    return occupancy
+
+
+def seats_left(restaurant, start):
+    """Seats free for the whole of a seating starting at start"""
+    slots = seating_slots(start, restaurant.average_dining_time)
+    return restaurant.capacity - max(held_seats(restaurant.id, slots).values())
+
+
+def is_available(restaurant, start, party_size):
+    return 0 < party_size <= seats_left(restaurant, start)
+
+
+def seating_width(dining_minutes):
+    """Buckets covered by a seating that starts on a bucket boundary"""
+    return max(1, math.ceil(dining_minutes / slot_minutes()))
+
+
+def bulk_seats_left(restaurants, start_date, days):
+    """
+    {restaurant id: days x slots_per_day array} of seats free for a seating
+    starting in each bucket. One query loads the range (plus the day after,
+    for seatings that run past midnight) for every restaurant into a matrix
+    of flat timelines; a sliding-window maximum over each seating width gives
+    the busiest bucket every start would cover. Starts outside opening hours
+    have no seats.
+    """
+    restaurants = list(restaurants)
+    if not restaurants:
+        return {}
+    per_day = slots_per_day()
+    index = {restaurant.id: row for row, restaurant in enumerate(restaurants)}
+    timeline = np.zeros((len(restaurants), (days + 1) * per_day), dtype=np.int32)
+    rows = SlotOccupancy.objects.filter(
+        restaurant_id__in=list(index), date__gte=start_date, date__lte=start_date + timedelta(days=days),
+    ).values_list('restaurant_id', 'date', 'slot', 'seats')
+    for restaurant_id, day, slot, seats in rows:
+        timeline[index[restaurant_id], (day - start_date).days * per_day + slot] = seats
+
+    capacity = np.array([restaurant.capacity for restaurant in restaurants], dtype=np.int32)[:, None]
+    widths = np.array([seating_width(restaurant.average_dining_time) for restaurant in restaurants])
+    seats = np.empty((len(restaurants), days * per_day), dtype=np.int32)
+    # Restaurants sharing a dining time share one vectorized pass
+    for width in np.unique(widths):
+        group = widths == width
+        windows = np.lib.stride_tricks.sliding_window_view(timeline[group], int(width), axis=1)
+        seats[group] = capacity[group] - windows.max(axis=2)[:, :days * per_day]
+    seats = seats.reshape(len(restaurants), days, per_day)
+
+    # No seatings may start while the restaurant is closed
+    weekdays = [(start_date + timedelta(days=d)).weekday() for d in range(days)]
+    open_slots = np.stack([hours.weekly_slot_mask(r.hours_bitmap, slot_minutes()) for r in restaurants])
+    seats[~open_slots[:, weekdays, :]] = 0
+    seats = np.maximum(seats, 0)
+    return {restaurant.id: seats[row] for row, restaurant in enumerate(restaurants)}
+
+
+def seats_left_matrix(restaurant, start_date, days):
+    """days x slots_per_day array of seats free for one restaurant"""
+    return bulk_seats_left([restaurant], start_date, days)[restaurant.id]
+
+
+def slot_time(slot):
+    minute = slot * slot_minutes()
+    return f"{minute // 60:02d}:{minute % 60:02d}"
+
+
+def find_tables(restaurants, start, party_size, flexibility_minutes=30, limit=10):
+    """
+    Restaurants with a bookable start within flexibility_minutes of start,
+    as [(restaurant, open_times)], nearest open time first, then by rating.
+    """
+    start = local_datetime(start)
+    size = slot_minutes()
+    requested = (start.hour * 60 + start.minute) // size
+    reach = flexibility_minutes // size
+    first = max(0, requested - reach)
+    last = min(slots_per_day() - 1, requested + reach)
+
+    restaurants = [restaurant for restaurant in restaurants if restaurant.capacity >= party_size]
+    seats = bulk_seats_left(restaurants, start.date(), 1)
+    window = np.arange(first, last + 1)
+    matches = []
+    for restaurant in restaurants:
+        open_slots = window[seats[restaurant.id][0, first:last + 1] >= party_size]
+        if open_slots.size:
+            distance = int(np.abs(open_slots - requested).min())
+            matches.append((distance, -float(restaurant.rating), restaurant, open_slots))
+    matches.sort(key=lambda match: match[:2])
+    return [
+        (restaurant, [slot_time(int(slot)) for slot in open_slots])
+        for _, _, restaurant, open_slots in matches[:limit]
+    ]
+
+
+def availability_grid(restaurant, start_date, days, window_start, window_end, party_size):
+    """
+    Seats free and bookability for each day in [start_date, start_date + days)
+    and each bucket start between window_start and window_end (times, inclusive).
+    """
+    size = slot_minutes()
+    first = (window_start.hour * 60 + window_start.minute) // size
+    last = (window_end.hour * 60 + window_end.minute) // size
+    seats = seats_left_matrix(restaurant, start_date, days)[:, first:last + 1]
+    bookable = seats >= party_size
+    times = [slot_time(s) for s in range(first, last + 1)]
+    return {
+        'times': times,
+        'days': [
+            {
+                'date': (start_date + timedelta(days=d)).isoformat(),
+                'seats_left': seats[d].tolist(),
+                'available': bookable[d].tolist(),
+            }
+            for d in range(days)
+        ],
+    }
+
+
+def nearest_open_slots(restaurant, start, party_size, limit=4):
+    """
+    Bookable start times on the same day, nearest to start first (earlier
+    wins a tie). Past times are skipped.
+    """
+    start = local_datetime(start)
+    size = slot_minutes()
+    requested = (start.hour * 60 + start.minute) / size
+    seats = seats_left_matrix(restaurant, start.date(), 1)[0]
+    candidates = np.flatnonzero(seats >= party_size)
+    candidates = candidates[candidates != requested]
+    order = np.lexsort((candidates, np.abs(candidates - requested)))
+
+    now = local_datetime(timezone.now())
+    found = []
+    for slot in candidates[order]:
+        minute = int(slot) * size
+        moment = datetime.combine(start.date(), datetime.min.time()) + timedelta(minutes=minute)
+        if start.tzinfo is not None:
+            moment = moment.replace(tzinfo=start.tzinfo)
+            if moment <= now:
+                continue
+        found.append(moment.strftime('%H:%M'))
+        if len(found) >= limit:
+            break
+    return found
+
+
+def _apply(restaurant_id, start, dining_minutes, delta):
+    slots = seating_slots(start, dining_minutes)
+    with transaction.atomic():
+        # Releases only touch existing rows; buckets of archived days are gone
+        if delta > 0:
+            SlotOccupancy.objects.bulk_create(
+                [SlotOccupancy(restaurant_id=restaurant_id, date=day, slot=slot) for day, slot in slots],
+                ignore_conflicts=True,
+            )
+        for day, day_slots in _by_date(slots).items():
+            SlotOccupancy.objects.filter(
+                restaurant_id=restaurant_id, date=day, slot__in=day_slots,
+            ).update(seats=F('seats') + delta)
+
+
+class SlotFull(Exception):
+    """A seating does not fit: a bucket it covers has fewer free seats than the party"""
+
+
+def try_hold(restaurant, start, party_size):
+    """
+    Take party_size seats in every bucket the seating covers, or none at all.
+    Each bucket is claimed with a conditional UPDATE (seats <= capacity -
+    party_size), so concurrent bookings can never push a bucket past capacity
+    and no table lock is needed. Returns False when any bucket is full.
+    """
+    limit = restaurant.capacity - party_size
+    if party_size < 1 or limit < 0:
+        return False
+    slots = seating_slots(start, restaurant.average_dining_time)
+    try:
+        with transaction.atomic():
+            SlotOccupancy.objects.bulk_create(
+                [SlotOccupancy(restaurant_id=restaurant.id, date=day, slot=slot) for day, slot in slots],
+                ignore_conflicts=True,
+            )
+            for day, day_slots in _by_date(slots).items():
+                claimed = SlotOccupancy.objects.filter(
+                    restaurant_id=restaurant.id, date=day, slot__in=day_slots, seats__lte=limit,
+                ).update(seats=F('seats') + party_size)
+                if claimed != len(day_slots):
+                    raise SlotFull()
+    except SlotFull:
+        return False
+    return True
+
+
+def hold(restaurant_id, start, party_size, dining_minutes):
+    """Add a seating to the occupancy array"""
+    _apply(restaurant_id, start, dining_minutes, party_size)
+
+
+def release(restaurant_id, start, party_size, dining_minutes):
+    """Remove a seating from the occupancy array"""
+    _apply(restaurant_id, start, dining_minutes, -party_size)
+
+
+def prune(before):
+    """
+    Drop the buckets of days before the date `before`, except those still
+    held by an active reservation (a stale pending or confirmed one).
+    Returns the number of buckets deleted.
+    """
+    midnight = datetime.combine(before, datetime.min.time())
+    if settings.USE_TZ:
+        midnight = timezone.make_aware(midnight)
+    held_days = defaultdict(set)
+    rows = Reservation.objects.filter(
+        status__in=Reservation.ACTIVE_STATUSES, reservation_time__lt=midnight,
+    ).values_list('restaurant_id', 'reservation_time', 'restaurant__average_dining_time')
+    for restaurant_id, start, dining_minutes in rows.iterator():
+        held_days[restaurant_id].update(day for day, _ in seating_slots(start, dining_minutes) if day < before)
+
+    old = SlotOccupancy.objects.filter(date__lt=before)
+    with transaction.atomic():
+        deleted, _ = old.exclude(restaurant_id__in=list(held_days)).delete()
+        for restaurant_id, days in held_days.items():
+            deleted += old.filter(restaurant_id=restaurant_id).exclude(date__in=days).delete()[0]
+    return deleted
+
+
+def rebuild(restaurant_ids=None):
+    """
+    Recompute occupancy from active reservations. Needed after changing
+    AVAILABILITY_SLOT_MINUTES or editing reservations with queryset.update().
+    """
+    reservations = Reservation.objects.filter(status__in=Reservation.ACTIVE_STATUSES)
+    occupancy = SlotOccupancy.objects.all()
+    if restaurant_ids is not None:
+        reservations = reservations.filter(restaurant_id__in=restaurant_ids)
+        occupancy = occupancy.filter(restaurant_id__in=restaurant_ids)
+
+    totals = defaultdict(int)
+    rows = reservations.values_list('restaurant_id', 'reservation_time', 'party_size',
+                                    'restaurant__average_dining_time')
+    for restaurant_id, start, party_size, dining_minutes in rows.iterator():
+        for day, slot in seating_slots(start, dining_minutes):
+            totals[(restaurant_id, day, slot)] += party_size
+
+    with transaction.atomic():
+        occupancy.delete()
+        SlotOccupancy.objects.bulk_create(
+            [SlotOccupancy(restaurant_id=r, date=day, slot=slot, seats=seats)
+             for (r, day, slot), seats in totals.items() if seats],
+            batch_size=1000,
+        )
+    logger.info(f"Rebuilt occupancy from {reservations.count()} reservations ({len(totals)} buckets)")
+    return len(totals)
@@ -0,0 +1,292 @@
+"""
+Offline catalog enrichment through batch-style JSONL files.
+
+Restaurants are written as chat-completion requests in the OpenAI Batch API
+input format, handed to a pluggable executor, and the results are applied
+back with bulk_update. A checkpoint file records the progress of every
+batch so an interrupted run resumes where it stopped, and the restaurants
+whose result failed or did not parse so the next run asks for them again.
+"""
+import json
+import logging
+import os
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Restaurant
+from .services import RestaurantCatalogService
+
+logger = logging.getLogger(__name__)
+
+ENRICHMENT_MODEL = "gpt-3.5-turbo-0125"
+ENRICHMENT_FIELDS = ['description', 'atmosphere', 'noise_level']
+ATMOSPHERES = [value for value, _ in Restaurant.ATMOSPHERE_CHOICES]
+NOISE_LEVELS = [value for value, _ in Restaurant._meta.get_field('noise_level').choices]
+
+SYSTEM_PROMPT = (
+    "You write short restaurant catalog entries. Reply with a JSON object with keys "
+    f"description (one or two sentences), atmosphere (one of: {', '.join(ATMOSPHERES)}) "
+    f"and noise_level (one of: {', '.join(NOISE_LEVELS)})."
+)
+
+
+def custom_id(restaurant_id):
+    return f"restaurant-{restaurant_id}"
+
+
+def restaurant_id_from(custom_id_value):
+    return int(custom_id_value.rsplit('-', 1)[1])
+
+
+def build_request(restaurant):
+    """One Batch API request line for a restaurant"""
+    return {
+        'custom_id': custom_id(restaurant.id),
+        'method': 'POST',
+        'url': '/v1/chat/completions',
+        'body': {
+            'model': ENRICHMENT_MODEL,
+            'messages': [
+                {'role': 'system', 'content': SYSTEM_PROMPT},
+                {'role': 'user', 'content': (
+                    f"{restaurant.name}, {restaurant.cuisine_type} ({restaurant.price_range}), "
+                    f"{restaurant.address}. Rated {restaurant.rating}/5."
+                )},
+            ],
+            'response_format': {'type': 'json_object'},
+            'max_tokens': 150,
+        },
+    }
+
+
+def parse_result(line):
+    """(restaurant_id, fields) from an output line, or None if it failed or is invalid"""
+    if line.get('error') or (line.get('response') or {}).get('status_code') != 200:
+        return None
+    try:
+        content = line['response']['body']['choices'][0]['message']['content']
+        data = json.loads(content)
+    except (KeyError, IndexError, TypeError, ValueError):
+        return None
+    fields = {}
+    if isinstance(data.get('description'), str) and data['description'].strip():
+        fields['description'] = data['description'].strip()
+    if data.get('atmosphere') in ATMOSPHERES:
+        fields['atmosphere'] = data['atmosphere']
+    if data.get('noise_level') in NOISE_LEVELS:
+        fields['noise_level'] = data['noise_level']
+    if not fields:
+        return None
+    return restaurant_id_from(line['custom_id']), fields
+
+
+class LocalBatchExecutor:
+    """
+    Runs a batch in-process by answering each request with respond(body),
+    which returns the assistant message content. Used in tests and for dry runs.
+    """
+
+    def __init__(self, respond):
+        self.respond = respond
+
+    def submit(self, input_path):
+        return str(input_path)
+
+    def wait(self, batch_id, output_path):
+        with open(batch_id) as src, open(output_path, 'w') as out:
+            for raw in src:
+                request = json.loads(raw)
+                try:
+                    content = self.respond(request['body'])
+                    line = {
+                        'custom_id': request['custom_id'],
+                        'response': {'status_code': 200, 'body': {
+                            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}}],
+                        }},
+                        'error': None,
+                    }
+                except Exception as e:
+                    line = {'custom_id': request['custom_id'], 'response': None,
+                            'error': {'message': str(e)}}
+                out.write(json.dumps(line) + '\n')
+        return output_path
+
+
+class OpenAIBatchExecutor:
+    """Submits input files to the OpenAI Batch API and downloads the output"""
+
+    def __init__(self, client=None, poll_interval=30.0):
+        if client is None:
+            from openai import OpenAI
+            client = OpenAI(api_key=settings.OPENAI_API_KEY, base_url=settings.OPENAI_BASE_URL)
+        self.client = client
+        self.poll_interval = poll_interval
+
+    def submit(self, input_path):
+        with open(input_path, 'rb') as f:
+            uploaded = self.client.files.create(file=f, purpose='batch')
+        batch = self.client.batches.create(
+            input_file_id=uploaded.id,
+            endpoint='/v1/chat/completions',
+            completion_window='24h',
+        )
+        return batch.id
+
+    def wait(self, batch_id, output_path):
+        while True:
+            batch = self.client.batches.retrieve(batch_id)
+            if batch.status == 'completed':
+                break
+            if batch.status in ('failed', 'expired', 'cancelled'):
+                raise RuntimeError(f"Batch {batch_id} ended with status {batch.status}")
+            time.sleep(self.poll_interval)
+        content = self.client.files.content(batch.output_file_id)
+        with open(output_path, 'wb') as out:
+            out.write(content.read())
+        return output_path
+
+
+class BatchEnrichmentPipeline:
+    """
+    write -> submit -> wait -> apply, one batch file at a time, with a
+    checkpoint after every step. Re-running with the same work_dir resumes.
+    """
+
+    def __init__(self, work_dir, executor, batch_size=1000, update_chunk_size=500):
+        self.work_dir = Path(work_dir)
+        self.executor = executor
+        self.batch_size = batch_size
+        self.update_chunk_size = update_chunk_size
+        self.checkpoint_path = self.work_dir / 'checkpoint.json'
+        self.checkpoint = {'batches': []}
+
+    def _load_checkpoint(self):
+        if self.checkpoint_path.exists():
+            with open(self.checkpoint_path) as f:
+                self.checkpoint = json.load(f)
+
+    def _save_checkpoint(self):
+        # Write-then-rename so a crash never leaves a torn checkpoint
+        tmp_path = self.checkpoint_path.with_suffix('.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(self.checkpoint, f, indent=2)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def write_batches(self, queryset):
+        """
+        Write request files for restaurants not covered by an earlier run, and
+        for those an earlier run got no usable result for
+        """
+        covered_until = max((b['last_id'] for b in self.checkpoint['batches']), default=0)
+        self._write_batches(queryset.filter(id__gt=covered_until).order_by('id').iterator(chunk_size=self.batch_size))
+
+        retried = [entry for entry in self.checkpoint['batches'] if entry.get('failed')]
+        if retried:
+            failed = sorted({restaurant_id for entry in retried for restaurant_id in entry['failed']})
+            # Bounded id lists: SQLite caps the variables of one statement
+            chunks = (failed[start:start + self.batch_size] for start in range(0, len(failed), self.batch_size))
+            self._write_batches(restaurant for chunk in chunks
+                                for restaurant in queryset.filter(id__in=chunk).order_by('id'))
+            for entry in retried:
+                entry['failed'] = []
+            self._save_checkpoint()
+
+    def _write_batches(self, restaurants):
+        batch = []
+        for restaurant in restaurants:
+            batch.append(restaurant)
+            if len(batch) >= self.batch_size:
+                self._write_batch(batch)
+                batch = []
+        if batch:
+            self._write_batch(batch)
+
+    def _write_batch(self, restaurants):
+        index = len(self.checkpoint['batches'])
+        input_path = self.work_dir / f"batch-{index:04d}.jsonl"
+        with open(input_path, 'w') as f:
+            for restaurant in restaurants:
+                f.write(json.dumps(build_request(restaurant)) + '\n')
+        self.checkpoint['batches'].append({
+            'input': input_path.name,
+            'first_id': restaurants[0].id,
+            'last_id': restaurants[-1].id,
+            'count': len(restaurants),
+            'status': 'written',
+            'batch_id': None,
+            'applied': 0,
+            'failed': [],
+        })
+        self._save_checkpoint()
+
+    def run(self, queryset):
+        """Process every pending batch. Returns the number of restaurants updated."""
+        self.work_dir.mkdir(parents=True, exist_ok=True)
+        self._load_checkpoint()
+        self.write_batches(queryset)
+
+        updated = 0
+        for entry in self.checkpoint['batches']:
+            if entry['status'] == 'applied':
+                continue
+            if entry['status'] == 'written':
+                entry['batch_id'] = self.executor.submit(self.work_dir / entry['input'])
+                entry['status'] = 'submitted'
+                self._save_checkpoint()
+            output_name = entry['input'].replace('batch-', 'output-')
+            if entry['status'] == 'submitted':
+                self.executor.wait(entry['batch_id'], self.work_dir / output_name)
+                entry['status'] = 'completed'
+                self._save_checkpoint()
+            if entry['status'] == 'completed':
+                entry['applied'] = self.apply_results(self.work_dir / output_name)
+                entry['failed'] = self.failed_ids(self.work_dir / entry['input'], self.work_dir / output_name)
+                entry['status'] = 'applied'
+                self._save_checkpoint()
+                updated += entry['applied']
+            logger.info(f"Batch {entry['input']}: {entry['applied']}/{entry['count']} restaurants enriched")
+        return updated
+
+    @staticmethod
+    def failed_ids(input_path, output_path):
+        """Ids requested in input_path that have no usable result in output_path"""
+        with open(input_path) as f:
+            requested = {restaurant_id_from(json.loads(raw)['custom_id']) for raw in f}
+        with open(output_path) as f:
+            for raw in f:
+                parsed = parse_result(json.loads(raw))
+                if parsed:
+                    requested.discard(parsed[0])
+        return sorted(requested)
+
+    def apply_results(self, output_path):
+        """bulk_update parsed results in chunks; returns rows updated"""
+        results = {}
+        with open(output_path) as f:
+            for raw in f:
+                parsed = parse_result(json.loads(raw))
+                if parsed:
+                    results[parsed[0]] = parsed[1]
+
+        ids = sorted(results)
+        updated = 0
+        for start in range(0, len(ids), self.update_chunk_size):
+            chunk_ids = ids[start:start + self.update_chunk_size]
+            restaurants = list(Restaurant.objects.filter(id__in=chunk_ids).only('id', *ENRICHMENT_FIELDS))
+            now = timezone.now()
+            for restaurant in restaurants:
+                for field, value in results[restaurant.id].items():
+                    setattr(restaurant, field, value)
+                # bulk_update skips auto_now; catalog snapshots compare updated_at
+                restaurant.updated_at = now
+            with transaction.atomic():
+                Restaurant.objects.bulk_update(restaurants, [*ENRICHMENT_FIELDS, 'updated_at'])
+            updated += len(restaurants)
+            if restaurants:
+                # bulk_update sends no post_save, so drop cached catalog results here
+                RestaurantCatalogService.invalidate_cache()
+        return updated
@@ -0,0 +1,132 @@
+import logging
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+
+from . import telemetry
+from .admission import LLMOverloaded
+
+logger = logging.getLogger(__name__)
+
+CLOSED, HALF_OPEN, OPEN = 'closed', 'half_open', 'open'
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+circuit_state = telemetry.registry.gauge(
+    'llm_circuit_state', "LLM circuit breaker state (0 closed, 1 half-open, 2 open)")
+circuit_transitions = telemetry.registry.counter(
+    'llm_circuit_transitions_total', "LLM circuit breaker state changes", ('state',))
+
+
+class CircuitOpen(LLMOverloaded):
+    """Raised without calling upstream while the breaker is open"""
+
+    def __init__(self):
+        super().__init__('circuit_open')
+
+
+class CircuitBreaker:
+    """
+    Trips when, over the last window_seconds and at least min_calls calls,
+    the share of failed calls reaches error_threshold or the share of calls
+    slower than slow_call_seconds reaches slow_threshold. After open_seconds
+    it lets half_open_probes calls through; a healthy probe closes the
+    circuit, a failed or slow one opens it again.
+    """
+
+    def __init__(self, window_seconds=30.0, min_calls=10, error_threshold=0.5,
+                 slow_call_seconds=10.0, slow_threshold=0.5, open_seconds=30.0, half_open_probes=1):
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.error_threshold = error_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_threshold = slow_threshold
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self._lock = threading.Lock()
+        self._calls = deque()  # (timestamp, failed, slow)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probes = 0
+        circuit_state.set(_STATE_VALUES[CLOSED])
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            window_seconds=getattr(settings, 'LLM_CIRCUIT_WINDOW', 30.0),
+            min_calls=getattr(settings, 'LLM_CIRCUIT_MIN_CALLS', 10),
+            error_threshold=getattr(settings, 'LLM_CIRCUIT_ERROR_THRESHOLD', 0.5),
+            slow_call_seconds=getattr(settings, 'LLM_CIRCUIT_SLOW_CALL', 10.0),
+            slow_threshold=getattr(settings, 'LLM_CIRCUIT_SLOW_THRESHOLD', 0.5),
+            open_seconds=getattr(settings, 'LLM_CIRCUIT_OPEN_SECONDS', 30.0),
+        )
+
+    @property
+    def state(self):
+        return self._state
+
+    def _transition(self, state):
+        if state != self._state:
+            logger.warning(f"LLM circuit {self._state} -> {state}")
+            self._state = state
+            circuit_state.set(_STATE_VALUES[state])
+            circuit_transitions.inc(state=state)
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+            self._probes = 0
+        elif state == CLOSED:
+            self._calls.clear()
+            self._probes = 0
+
+    def before_call(self):
+        """Raise CircuitOpen unless this call may go upstream"""
+        with self._lock:
+            if self._state == OPEN:
+                if time.monotonic() - self._opened_at < self.open_seconds:
+                    raise CircuitOpen()
+                self._transition(HALF_OPEN)
+            if self._state == HALF_OPEN:
+                if self._probes >= self.half_open_probes:
+                    raise CircuitOpen()
+                self._probes += 1
+
+    def abandon(self):
+        """The call was admitted here but never made it upstream"""
+        with self._lock:
+            if self._state == HALF_OPEN and self._probes:
+                self._probes -= 1
+
+    def record(self, failed, duration):
+        slow = duration >= self.slow_call_seconds
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._transition(OPEN if failed or slow else CLOSED)
+                return
+            if self._state == OPEN:
+                return
+
+            now = time.monotonic()
+            self._calls.append((now, failed, slow))
+            while self._calls and now - self._calls[0][0] > self.window_seconds:
+                self._calls.popleft()
+            total = len(self._calls)
+            if total < self.min_calls:
+                return
+            failures = sum(1 for _, f, _ in self._calls if f)
+            slow_calls = sum(1 for _, _, s in self._calls if s)
+            if failures / total >= self.error_threshold or slow_calls / total >= self.slow_threshold:
+                self._transition(OPEN)
+
+
+_breaker = None
+_breaker_lock = threading.Lock()
+
+
+def get_breaker():
+    global _breaker
+    if _breaker is None:
+        with _breaker_lock:
+            if _breaker is None:
+                _breaker = CircuitBreaker.from_settings()
+    return _breaker
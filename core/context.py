@@ -0,0 +1,122 @@
+import logging
+import math
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+try:
+    import tiktoken
+except ImportError:  # optional: fall back to a character-based estimate
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# Columns of the compact row format, in order
+ROW_HEADER = "id|name|cuisine|price|rating|address"
+ROW_FIELDS = ('id', 'name', 'cuisine_type', 'price_range', 'rating', 'address', 'updated_at')
+
+_encoding = None
+
+
+def estimate_tokens(text):
+    """Token count for text, exact with tiktoken installed and approximate otherwise"""
+    global _encoding
+    if tiktoken is not None:
+        if _encoding is None:
+            _encoding = tiktoken.get_encoding('cl100k_base')
+        return len(_encoding.encode(text))
+    # ~4 characters per token for English text
+    return math.ceil(len(text) / 4)
+
+
+def _clean(value):
+    return ' '.join(str(value or '').replace('|', '/').split())
+
+
+class RowCache:
+    """LRU of encoded restaurant rows keyed by (id, updated_at)"""
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self._rows = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, restaurant):
+        key = (restaurant.id, restaurant.updated_at)
+        with self._lock:
+            entry = self._rows.get(key)
+            if entry is not None:
+                self._rows.move_to_end(key)
+                return entry
+        row = '|'.join([
+            str(restaurant.id),
+            _clean(restaurant.name),
+            _clean(restaurant.cuisine_type),
+            restaurant.price_range,
+            f"{float(restaurant.rating):.1f}",
+            _clean(restaurant.address),
+        ])
+        entry = (row, estimate_tokens(row) + 1)  # +1 for the newline
+        with self._lock:
+            self._rows[key] = entry
+            while len(self._rows) > self.maxsize:
+                self._rows.popitem(last=False)
+        return entry
+
+
+row_cache = RowCache(getattr(settings, 'CONTEXT_ROW_CACHE_SIZE', 10000))
+
+
+def score_restaurant(restaurant, criteria, position):
+    """Relevance score: criteria matches first, then rating, then service order"""
+    score = 0.0
+    cuisine = (criteria.get('cuisine_type') or criteria.get('cuisine') or '').lower()
+    if cuisine and cuisine in restaurant.cuisine_type.lower():
+        score += 3
+    location = (criteria.get('location') or '').lower()
+    if location and location in restaurant.address.lower():
+        score += 2
+    if criteria.get('price_range') and criteria['price_range'] == restaurant.price_range:
+        score += 1
+    score += float(restaurant.rating) / 5
+    # Small tie-breaker keeps the upstream ordering among equals
+    score -= position * 1e-6
+    return score
+
+
+def build_restaurant_context(restaurants, criteria=None, token_budget=None, max_candidates=None):
+    """
+    Pack the most relevant restaurants into at most token_budget tokens.
+
+    Only the first max_candidates rows of the queryset are considered, so the
+    work and the prompt size stay bounded however large the catalog grows.
+    Returns (context_text, included_count).
+    """
+    criteria = criteria or {}
+    token_budget = token_budget or getattr(settings, 'CONTEXT_TOKEN_BUDGET', 600)
+    max_candidates = max_candidates or getattr(settings, 'CONTEXT_MAX_CANDIDATES', 200)
+
+    if hasattr(restaurants, 'only'):
+        restaurants = restaurants.only(*ROW_FIELDS)
+    candidates = list(restaurants[:max_candidates])
+    ranked = sorted(
+        enumerate(candidates),
+        key=lambda item: score_restaurant(item[1], criteria, item[0]),
+        reverse=True
+    )
+
+    lines = [ROW_HEADER]
+    used = estimate_tokens(ROW_HEADER) + 1
+    for _, restaurant in ranked:
+        row, tokens = row_cache.get(restaurant)
+        if used + tokens > token_budget:
+            continue
+        lines.append(row)
+        used += tokens
+
+    included = len(lines) - 1
+    logger.debug(f"Restaurant context: {included}/{len(candidates)} rows, ~{used} tokens")
+    if not included:
+        return '', 0
+    return '\n'.join(lines), included
@@ -0,0 +1,78 @@
+"""
+SQLite connection profile and the read-only catalog alias.
+
+Every new SQLite connection gets the pragmas in SQLITE_PRAGMAS (WAL so
+readers never block the writer, a busy timeout instead of immediate
+"database is locked" errors, relaxed fsync, memory-mapped reads and a larger
+page cache) and the hours_open() function. Connections to CATALOG_DATABASE
+are additionally query_only.
+
+CatalogRouter sends reads of catalog models to that alias so search and
+recommendation traffic runs on its own connections, except inside a
+transaction on the default database, where reads must see its own writes.
+All writes go to the default database.
+"""
+import logging
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .hours import sql_hours_open
+
+logger = logging.getLogger(__name__)
+
+CATALOG_MODELS = {'restaurant', 'review'}
+
+
+def catalog_alias():
+    """The read-only alias if configured, else the default database"""
+    alias = getattr(settings, 'CATALOG_DATABASE', None)
+    return alias if alias in settings.DATABASES else DEFAULT_DB_ALIAS
+
+
+def sqlite_pragmas(read_only=False):
+    """PRAGMA statements for a new connection, in the order they must run"""
+    pragmas = dict(getattr(settings, 'SQLITE_PRAGMAS', {}))
+    if read_only:
+        # Changing the journal mode is a write; the writer side sets it
+        pragmas.pop('journal_mode', None)
+        pragmas['query_only'] = 'ON'
+    return [f"PRAGMA {name}={value}" for name, value in pragmas.items()]
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """connection_created handler"""
+    if connection.vendor != 'sqlite':
+        return
+    read_only = connection.alias != DEFAULT_DB_ALIAS and connection.alias == catalog_alias()
+    with connection.cursor() as cursor:
+        for statement in sqlite_pragmas(read_only):
+            cursor.execute(statement)
+    # Backs HoursIndex.filter_open on catalogs too large for id lists
+    connection.connection.create_function('hours_open', 3, sql_hours_open, deterministic=True)
+
+
+class CatalogRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label != 'core' or model._meta.model_name not in CATALOG_MODELS:
+            return None
+        # Inside a write transaction, reads must see its uncommitted rows
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return catalog_alias()
+
+    def db_for_write(self, model, **hints):
+        # Instances read from the catalog alias are still saved through default
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases are the same database
+        aliases = {DEFAULT_DB_ALIAS, catalog_alias()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db != DEFAULT_DB_ALIAS and db == catalog_alias():
+            return False
+        return None
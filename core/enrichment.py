@@ -0,0 +1,224 @@
+import json
+import logging
+import re
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .llm import chat_completion
+from .models import Restaurant, EnrichmentJob
+from .services import RestaurantCatalogService
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_OPERATING_HOURS = {
+    'monday': '11:00-22:00',
+    'tuesday': '11:00-22:00',
+    'wednesday': '11:00-22:00',
+    'thursday': '11:00-22:00',
+    'friday': '11:00-23:00',
+    'saturday': '11:00-23:00',
+    'sunday': '11:00-22:00'
+}
+
+
+def normalize_text(value):
+    """Lowercase, strip punctuation and collapse whitespace for dedupe keys"""
+    value = re.sub(r'[^\w\s]', ' ', str(value or '').casefold())
+    return ' '.join(value.split())
+
+
+def job_key(search_args):
+    """Stable key for a search so repeated queries share one job"""
+    return f"{normalize_text(search_args.get('cuisine_type'))}|{normalize_text(search_args.get('location'))}"
+
+
+def generate_restaurants_with_openai(search_args):
+    """Ask the LLM for restaurant entries matching the search. Returns a list of dicts."""
+    # Imported lazily: utils imports this module
+    from .utils import get_client
+    client = get_client()
+
+    prompt = f"Generate 5 realistic restaurant entries for {search_args.get('cuisine_type', 'various')} cuisine "
+    prompt += f"in {search_args.get('location', 'the area')}. Include name, address, price range ($-$$$$), "
+    prompt += "rating (1-5), cuisine type, and dietary options. Format as JSON."
+
+    response = chat_completion(
+        client,
+        model="gpt-3.5-turbo-0125",
+        messages=[
+            {"role": "system", "content": "You are a restaurant database expert. Provide realistic restaurant data in JSON format."},
+            {"role": "user", "content": prompt}
+        ],
+        response_format={"type": "json_object"},
+        cacheable=True
+    )
+    return json.loads(response.choices[0].message.content).get('restaurants', [])
+
+
+def save_generated_restaurants(restaurants_data, search_args):
+    """
+    Insert generated restaurants, skipping any whose (normalized name, address)
+    already exists in the catalog or appears twice in the batch.
+    """
+    candidates = {}
+    for data in restaurants_data:
+        if not data.get('name') or not data.get('address'):
+            continue
+        key = (normalize_text(data['name']), normalize_text(data['address']))
+        candidates.setdefault(key, data)
+
+    if not candidates:
+        return []
+
+    # One query for every existing row sharing a name with the batch
+    name_filter = Q()
+    for data in candidates.values():
+        name_filter |= Q(name__iexact=data['name'].strip())
+    existing = {
+        (normalize_text(name), normalize_text(address))
+        for name, address in Restaurant.objects.filter(name_filter).values_list('name', 'address')
+    }
+
+    new_restaurants = [
+        Restaurant(
+            name=data['name'].strip(),
+            address=data['address'].strip(),
+            cuisine_type=data.get('cuisine_type', search_args.get('cuisine_type', '')),
+            price_range=data.get('price_range', '$$'),
+            rating=float(data.get('rating', 4.0)),
+            dietary_options=data.get('dietary_options', []),
+            operating_hours=data.get('operating_hours', DEFAULT_OPERATING_HOURS),
+            capacity=data.get('capacity', 50)
+        )
+        for key, data in candidates.items() if key not in existing
+    ]
+    # bulk_create skips save(), so compile the hours here
+    for restaurant in new_restaurants:
+        restaurant.compile_hours()
+    created = Restaurant.objects.bulk_create(new_restaurants)
+    if created:
+        # bulk_create sends no post_save either
+        RestaurantCatalogService.invalidate_cache()
+    return created
+
+
+class EnrichmentQueue:
+    """
+    In-process worker pool over the EnrichmentJob table. Jobs survive restarts
+    because the table is the queue; the threads only claim and execute them.
+    """
+
+    def __init__(self, generator=None, num_workers=None, poll_interval=5.0):
+        self.generator = generator or generate_restaurants_with_openai
+        self.num_workers = num_workers
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def enqueue(self, search_args):
+        """Record a job for these search arguments unless one is already waiting"""
+        key = job_key(search_args)
+        job = EnrichmentJob.objects.filter(key=key, status__in=EnrichmentJob.ACTIVE_STATUSES).first()
+        while job is None:
+            try:
+                # The unique index on active keys settles concurrent enqueues
+                with transaction.atomic():
+                    job = EnrichmentJob.objects.create(key=key, search_args=search_args)
+                logger.info(f"Queued enrichment job {job.id} for {key}")
+            except IntegrityError:
+                job = EnrichmentJob.objects.filter(key=key, status__in=EnrichmentJob.ACTIVE_STATUSES).first()
+        self.ensure_started()
+        self._wakeup.set()
+        return job
+
+    def ensure_started(self):
+        """Start the worker threads on first use"""
+        num_workers = self.num_workers
+        if num_workers is None:
+            num_workers = getattr(settings, 'ENRICHMENT_WORKERS', 1)
+        with self._lock:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            while len(self._threads) < num_workers:
+                thread = threading.Thread(
+                    target=self._worker_loop,
+                    name=f"enrichment-{len(self._threads)}",
+                    daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+
+    def _worker_loop(self):
+        while not self._stop.is_set():
+            try:
+                processed = self.process_next_job()
+            except Exception as e:
+                logger.error(f"Error in enrichment worker: {str(e)}", exc_info=True)
+                processed = False
+            finally:
+                connections.close_all()
+            if not processed:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    def claim_next_job(self):
+        """
+        Atomically move the oldest pending job to running. A running job whose
+        lease (ENRICHMENT_LEASE_SECONDS) ran out lost its worker and is claimed
+        again, or failed once it used up its attempts. Returns None when idle.
+        """
+        now = timezone.now()
+        lease = timedelta(seconds=getattr(settings, 'ENRICHMENT_LEASE_SECONDS', 300))
+        expired = Q(status='running', started_at__lt=now - lease)
+        max_attempts = getattr(settings, 'ENRICHMENT_MAX_ATTEMPTS', 3)
+        EnrichmentJob.objects.filter(expired, attempts__gte=max_attempts).update(
+            status='failed', error='Worker lost while running the job', updated_at=now)
+        claimable = Q(status='pending') | expired
+        for job_id in EnrichmentJob.objects.filter(claimable).order_by('created_at').values_list('id', flat=True)[:5]:
+            # Conditional update: only one worker wins the row
+            if EnrichmentJob.objects.filter(claimable, id=job_id).update(
+                    status='running', started_at=now, attempts=F('attempts') + 1, updated_at=now):
+                return EnrichmentJob.objects.get(id=job_id)
+        return None
+
+    def process_next_job(self):
+        """Run one job to completion. Returns False when nothing was pending."""
+        job = self.claim_next_job()
+        if job is None:
+            return False
+
+        try:
+            restaurants_data = self.generator(job.search_args)
+            with transaction.atomic():
+                created = save_generated_restaurants(restaurants_data, job.search_args)
+            job.status = 'done'
+            job.created_count = len(created)
+            job.error = ''
+            logger.info(f"Enrichment job {job.id} added {len(created)} restaurants")
+        except Exception as e:
+            logger.error(f"Error in enrichment job {job.id}: {str(e)}")
+            max_attempts = getattr(settings, 'ENRICHMENT_MAX_ATTEMPTS', 3)
+            job.status = 'pending' if job.attempts < max_attempts else 'failed'
+            job.error = str(e)
+        job.save(update_fields=['status', 'created_count', 'error', 'updated_at'])
+        return True
+
+    def run_pending(self):
+        """Drain the queue on the calling thread. Returns the number of jobs processed."""
+        count = 0
+        while self.process_next_job():
+            count += 1
+        return count
+
+
+enrichment_queue = EnrichmentQueue()
@@ -0,0 +1,90 @@
+import logging
+import re
+import time
+
+from .models import Restaurant
+from .services import RecommendationService
+
+logger = logging.getLogger(__name__)
+
+_PRICE_PATTERN = re.compile(r'(?<!\$)(\${1,4})(?!\$)')
+_CHEAP_WORDS = ('cheap', 'budget', 'inexpensive', 'affordable')
+_FANCY_WORDS = ('fancy', 'upscale', 'fine dining', 'expensive', 'luxury')
+
+# Distinct cuisine names, refreshed at most once a minute
+_cuisines = {'values': [], 'loaded_at': 0.0}
+
+
+def _known_cuisines():
+    if time.monotonic() - _cuisines['loaded_at'] > 60:
+        values = set()
+        for cuisine_type in Restaurant.objects.values_list('cuisine_type', flat=True).distinct():
+            values.update(part.strip().lower() for part in cuisine_type.split(',') if part.strip())
+        # Longest first so "vegetarian friendly" wins over "vegetarian"
+        _cuisines['values'] = sorted(values, key=len, reverse=True)
+        _cuisines['loaded_at'] = time.monotonic()
+    return _cuisines['values']
+
+
+def extract_local_criteria(message):
+    """Cheap keyword matching of cuisine and price; no LLM involved"""
+    text = (message or '').lower()
+    criteria = {}
+    for cuisine in _known_cuisines():
+        if re.search(rf'\b{re.escape(cuisine)}\b', text):
+            criteria['cuisine_type'] = cuisine
+            break
+    price = _PRICE_PATTERN.search(message or '')
+    if price:
+        criteria['price_range'] = price.group(1)
+    elif any(word in text for word in _CHEAP_WORDS):
+        criteria['price_range'] = '$'
+    elif any(word in text for word in _FANCY_WORDS):
+        criteria['price_range'] = '$$$$'
+    return criteria
+
+
+# Opening line of a fallback answer, by why the LLM was skipped
+INTRO_TEMPLATES = {
+    'busy': "Our assistant is very busy right now, so here is a quick answer from our catalog.",
+    'unavailable': "Our assistant is temporarily unavailable, so here is a quick answer from our catalog.",
+}
+BOOKING_HINT = ("I can't check tables or book through chat at the moment, but you can check "
+                "availability and reserve from any restaurant's page.")
+_BOOKING_WORDS = ('book', 'reserve', 'reservation', 'table for', 'available', 'availability')
+
+
+def catalog_only_response(message, user=None, limit=5, reason='busy'):
+    """
+    Template answer from the local catalog alone, for when the LLM is
+    overloaded (reason from admission control) or down (circuit open).
+    Relaxes the price filter before giving up on matches.
+    """
+    intro_line = INTRO_TEMPLATES['unavailable' if reason == 'circuit_open' else 'busy']
+    criteria = {}
+    try:
+        criteria = extract_local_criteria(message)
+        restaurants = list(RecommendationService.get_recommendations(criteria, user)[:limit])
+        if not restaurants and 'price_range' in criteria:
+            criteria.pop('price_range')
+            restaurants = list(RecommendationService.get_recommendations(criteria, user)[:limit])
+        if not restaurants:
+            restaurants = list(Restaurant.objects.order_by('-rating')[:limit])
+    except Exception as e:
+        logger.error(f"Error in catalog_only_response: {str(e)}")
+        restaurants = []
+
+    if not restaurants:
+        return f"{intro_line.split(',')[0]} and I couldn't look anything up. Please try again in a moment."
+
+    what = criteria.get('cuisine_type', '').title()
+    heading = f"Top-rated {what} restaurants" if what else "Some top-rated restaurants"
+    result = f"{intro_line} {heading}:\n\n"
+    for restaurant in restaurants:
+        result += f"- {restaurant.name} ({restaurant.price_range})\n"
+        result += f"  Cuisine: {restaurant.cuisine_type}\n"
+        result += f"  Address: {restaurant.address}\n"
+        result += f"  Rating: {restaurant.rating}/5.0\n\n"
+    if any(word in (message or '').lower() for word in _BOOKING_WORDS):
+        result += BOOKING_HINT
+    return result
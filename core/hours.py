@@ -0,0 +1,257 @@
+"""
+Operating hours compiled to a weekly minute bitmap.
+
+Restaurant.operating_hours is free-form JSON keyed by day, e.g.
+{"monday": "11:00-22:00", "friday": "11:00-15:00, 18:00-02:00"}. On save it
+is compiled to 7 * 1440 bits (Monday 00:00 first, little-endian within each
+byte) where a set bit means open during that minute. Spans that end at or
+before their start run past midnight into the next day, and Sunday wraps to
+Monday. Hours that cannot be parsed compile to None, meaning "unknown",
+which never blocks a booking but does not match an "open at" filter.
+"""
+import json
+import logging
+import re
+import threading
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import BooleanField, Func, Value
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+
+from .lazy import lazy_import
+
+np = lazy_import('numpy')
+
+logger = logging.getLogger(__name__)
+
+DAYS = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+BITMAP_BYTES = MINUTES_PER_WEEK // 8
+# Longer id lists go to SQLite as one JSON parameter: binding each id would
+# pass SQLITE_MAX_VARIABLE_NUMBER (32766) on large catalogs
+MAX_BOUND_IDS = 1000
+
+_ALL_DAY = ('24 hours', '24h', '24/7', 'open 24 hours', 'all day')
+_CLOSED = ('', 'closed', 'none', '-')
+_SPAN = re.compile(
+    r'(\d{1,2})(?::(\d{2}))?\s*([ap]\.?m\.?)?\s*(?:-|–|to)\s*(\d{1,2})(?::(\d{2}))?\s*([ap]\.?m\.?)?',
+    re.IGNORECASE,
+)
+
+
+class InvalidHours(ValueError):
+    pass
+
+
+def _day_index(name):
+    name = name.strip().lower()
+    for index, day in enumerate(DAYS):
+        if name == day or (len(name) >= 3 and day.startswith(name)):
+            return index
+    raise InvalidHours(f"Unknown day {name!r}")
+
+
+def parse_days(key):
+    """Day indexes (Monday = 0) for a key like "monday", "Mon-Fri", "weekends" or "daily" """
+    key = key.strip().lower()
+    if key in ('daily', 'everyday', 'every day', 'all'):
+        return list(range(7))
+    if key in ('weekdays',):
+        return list(range(5))
+    if key in ('weekends', 'weekend'):
+        return [5, 6]
+    if '-' in key:
+        first, last = (_day_index(part) for part in key.split('-', 1))
+        return [(first + offset) % 7 for offset in range((last - first) % 7 + 1)]
+    return [_day_index(key)]
+
+
+def _minute(hour, minute, meridiem):
+    hour, minute = int(hour), int(minute or 0)
+    if meridiem:
+        meridiem = meridiem[0].lower()
+        if not 1 <= hour <= 12:
+            raise InvalidHours(f"Bad 12-hour time {hour}")
+        hour = hour % 12 + (12 if meridiem == 'p' else 0)
+    if hour > 24 or minute > 59 or (hour == 24 and minute):
+        raise InvalidHours(f"Bad time {hour}:{minute:02d}")
+    return hour * 60 + minute
+
+
+def parse_spans(value):
+    """[(start, end)] in minutes from the day's midnight; end may pass 1440 for overnight spans"""
+    if isinstance(value, (list, tuple)):
+        return [span for part in value for span in parse_spans(part)]
+    if not isinstance(value, str):
+        raise InvalidHours(f"Unsupported hours value {value!r}")
+    text = value.strip().lower()
+    if text in _CLOSED:
+        return []
+    if text in _ALL_DAY:
+        return [(0, MINUTES_PER_DAY)]
+
+    spans = []
+    for part in re.split(r'[,;/]|\band\b', text):
+        if not part.strip():
+            continue
+        match = _SPAN.fullmatch(part.strip())
+        if not match:
+            raise InvalidHours(f"Cannot parse hours {part.strip()!r}")
+        start_hour, start_minute, start_meridiem, end_hour, end_minute, end_meridiem = match.groups()
+        start = _minute(start_hour, start_minute, start_meridiem or end_meridiem)
+        end = _minute(end_hour, end_minute, end_meridiem)
+        if end <= start:
+            end += MINUTES_PER_DAY
+        spans.append((start, end))
+    return spans
+
+
+def compile_hours(operating_hours):
+    """Weekly minute bitmap (bytes) for operating_hours, or None when unknown"""
+    if not operating_hours or not isinstance(operating_hours, dict):
+        return None
+    mask = 0
+    try:
+        for key, value in operating_hours.items():
+            for day in parse_days(key):
+                for start, end in parse_spans(value):
+                    start += day * MINUTES_PER_DAY
+                    end += day * MINUTES_PER_DAY
+                    mask |= ((1 << (end - start)) - 1) << start
+    except InvalidHours as e:
+        logger.warning(f"Ignoring operating hours {operating_hours!r}: {str(e)}")
+        return None
+    # Overnight spans from Sunday wrap around to Monday morning
+    mask = (mask | (mask >> MINUTES_PER_WEEK)) & ((1 << MINUTES_PER_WEEK) - 1)
+    return mask.to_bytes(BITMAP_BYTES, 'little')
+
+
+def minute_of_week(moment):
+    """Minutes since Monday 00:00, in the project time zone"""
+    if timezone.is_aware(moment):
+        moment = timezone.localtime(moment)
+    return moment.weekday() * MINUTES_PER_DAY + moment.hour * 60 + moment.minute
+
+
+def bitmap_bits(bitmap):
+    """The bitmap as a bool array of MINUTES_PER_WEEK entries"""
+    return np.unpackbits(np.frombuffer(bytes(bitmap), dtype=np.uint8), bitorder='little').astype(bool)
+
+
+def is_open_at(restaurant, moment):
+    """True, False, or True when the hours are unknown"""
+    bitmap = restaurant.hours_bitmap
+    if bitmap is None:
+        return True
+    minute = minute_of_week(moment)
+    return bool(bytes(bitmap)[minute >> 3] >> (minute & 7) & 1)
+
+
+def weekly_slot_mask(bitmap, slot_minutes):
+    """7 x slots-per-day bool array: open at the start of each slot (all True when unknown)"""
+    per_day = MINUTES_PER_DAY // slot_minutes
+    if bitmap is None:
+        return np.ones((7, per_day), dtype=bool)
+    return bitmap_bits(bitmap)[::slot_minutes].reshape(7, per_day)
+
+
+class HoursIndex:
+    """
+    All restaurants' bitmaps as one (restaurants x bytes) array, so "open at T"
+    over the whole catalog is a column lookup and a bit test. Reloaded when
+    the catalog version (RestaurantCatalogService.catalog_version, a cache
+    read) or the published snapshot changes. While the catalog snapshot
+    (core.snapshot) matches the catalog, the array is a view of its shared
+    mapping rather than a copy in this process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Arrays are built on first use so importing this module stays cheap
+        self._version = None
+        self._ids = None
+        self._bitmaps = None
+        self._known = None
+
+    def _refresh(self):
+        from .models import Restaurant
+        from .services import RestaurantCatalogService
+        from .snapshot import catalog_state, get_snapshot
+
+        snapshot = get_snapshot()
+        version = (RestaurantCatalogService.catalog_version(), snapshot)
+        if version == self._version:
+            return
+        with self._lock:
+            if version == self._version:
+                return
+            # Only a new version pays for the full-table state query
+            if snapshot is not None and snapshot.matches(catalog_state()):
+                self._ids = snapshot.array('id')
+                self._known = snapshot.array('hours_known')
+                self._bitmaps = snapshot.array('hours')
+            else:
+                rows = list(Restaurant.objects.order_by('id').values_list('id', 'hours_bitmap'))
+                empty = bytes(BITMAP_BYTES)
+                self._ids = np.array([row[0] for row in rows], dtype=np.int64)
+                self._known = np.array([row[1] is not None for row in rows], dtype=bool)
+                self._bitmaps = np.frombuffer(
+                    b''.join(bytes(row[1]) if row[1] is not None else empty for row in rows), dtype=np.uint8
+                ).reshape(len(rows), BITMAP_BYTES)
+            self._version = version
+
+    def open_mask(self, moment, duration_minutes=0):
+        """(ids, mask): restaurants with known hours open at moment (for duration_minutes)"""
+        self._refresh()
+        start = minute_of_week(moment)
+        minutes = (start + np.arange(max(1, duration_minutes))) % MINUTES_PER_WEEK
+        bits = (self._bitmaps[:, minutes >> 3] >> (minutes & 7).astype(np.uint8)) & 1
+        return self._ids, bits.all(axis=1) & self._known
+
+    def filter_open(self, queryset, moment, duration_minutes=0):
+        """
+        Narrow a Restaurant queryset to those open at moment, using the smaller
+        id list. When even that passes HOURS_FILTER_MAX_IDS, SQLite tests the
+        bitmaps itself through hours_open() rather than receive a huge list.
+        """
+        ids, mask = self.open_mask(moment, duration_minutes)
+        open_count = int(mask.sum())
+        smaller = min(open_count, len(ids) - open_count)
+        if smaller > getattr(settings, 'HOURS_FILTER_MAX_IDS', 5000) and connections[queryset.db].vendor == 'sqlite':
+            return queryset.filter(HoursOpen('hours_bitmap', minute_of_week(moment), max(1, duration_minutes)))
+        if open_count == smaller:
+            return queryset.filter(id__in=_id_list(ids[mask].tolist(), queryset.db))
+        return queryset.exclude(id__in=_id_list(ids[~mask].tolist(), queryset.db))
+
+
+class HoursOpen(Func):
+    """SQL hours_open(bitmap, start, minutes), registered on SQLite connections by core.db"""
+    function = 'hours_open'
+    output_field = BooleanField()
+
+    def __init__(self, bitmap, start, minutes):
+        super().__init__(bitmap, Value(start), Value(minutes))
+
+
+def sql_hours_open(bitmap, start, minutes):
+    """hours_open(): 1 when bitmap is open for minutes from minute of week start, else 0"""
+    if bitmap is None:
+        return 0
+    for minute in range(start, start + minutes):
+        minute %= MINUTES_PER_WEEK
+        if not bitmap[minute >> 3] >> (minute & 7) & 1:
+            return 0
+    return 1
+
+
+def _id_list(ids, alias):
+    """ids for an id__in lookup; long lists become one json_each() parameter on SQLite"""
+    if len(ids) <= MAX_BOUND_IDS or connections[alias].vendor != 'sqlite':
+        return ids
+    return RawSQL('SELECT value FROM json_each(%s)', (json.dumps(ids),))
+
+
+hours_index = HoursIndex()
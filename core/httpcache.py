@@ -0,0 +1,149 @@
+"""
+Validators and compression for the JSON API.
+
+Catalog views tag their responses with a strong ETag made of the catalog
+version and the normalized query, and answer a matching If-None-Match with
+304 before searching or serializing anything. CompressionMiddleware then
+encodes /api/ responses of at least API_COMPRESSION_MIN_SIZE bytes with
+brotli (when installed) or gzip, whichever the client accepts. An encoded
+response is a different representation, so its ETag gets the coding as a
+suffix ("…-gzip", "…-br"); not_modified() accepts either form.
+"""
+import gzip
+
+from django.conf import settings
+from django.http import HttpResponseNotModified, JsonResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+
+from . import telemetry
+from .singleflight import request_key
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+API_PREFIX = '/api/'
+CODING_SUFFIXES = {'br': '-br', 'gzip': '-gzip'}
+
+not_modified_total = telemetry.registry.counter(
+    'api_not_modified_total', "Conditional API requests answered with 304", ('namespace',))
+compressed_total = telemetry.registry.counter(
+    'api_compressed_responses_total', "API responses sent compressed, by content coding", ('encoding',))
+compressed_bytes = telemetry.registry.counter(
+    'api_compressed_bytes_total', "API response bytes before and after compression", ('encoding', 'stage'))
+
+
+def catalog_etag(namespace, params):
+    """Strong ETag for a catalog result: changes with the catalog version and the query"""
+    from .services import RestaurantCatalogService
+
+    version = RestaurantCatalogService.catalog_version()
+    return f'"{namespace}-{version}-{request_key(namespace, **params)[:20]}"'
+
+
+def _base_etag(tag):
+    """tag without the W/ prefix and content-coding suffix added by CompressionMiddleware"""
+    if tag.startswith('W/'):
+        tag = tag[2:]
+    for suffix in CODING_SUFFIXES.values():
+        if tag.endswith(f'{suffix}"'):
+            return tag[:-len(suffix) - 1] + '"'
+    return tag
+
+
+def not_modified(request, etag, namespace, cache_control='no-cache'):
+    """304 response if the client's If-None-Match covers etag, else None"""
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return None
+    for tag in parse_etags(header):
+        if tag == '*' or _base_etag(tag) == etag:
+            response = HttpResponseNotModified()
+            # Echo the client's tag, it names the representation the client holds
+            response['ETag'] = etag if tag == '*' else tag.removeprefix('W/')
+            response['Cache-Control'] = cache_control
+            patch_vary_headers(response, ('Accept-Encoding',))
+            not_modified_total.inc(namespace=namespace)
+            return response
+    return None
+
+
+def catalog_response(data, etag, cache_control='no-cache'):
+    """JsonResponse carrying etag; no-cache lets clients keep it but revalidate every use"""
+    response = JsonResponse(data)
+    response['ETag'] = etag
+    response['Cache-Control'] = cache_control
+    return response
+
+
+def _accepted_codings(header):
+    """{coding: q} from an Accept-Encoding header"""
+    codings = {}
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        codings[coding.strip().lower()] = q
+    return codings
+
+
+def choose_coding(header):
+    """Best content coding we can produce for an Accept-Encoding header, or None"""
+    codings = _accepted_codings(header or '')
+    wildcard = codings.get('*', 0.0)
+    for coding in ('br', 'gzip'):
+        if coding == 'br' and brotli is None:
+            continue
+        if codings.get(coding, wildcard) > 0:
+            return coding
+    return None
+
+
+def compress(body, coding):
+    if coding == 'br':
+        return brotli.compress(body, quality=getattr(settings, 'API_BROTLI_QUALITY', 5))
+    # mtime=0 so the same body always compresses to the same bytes, as a strong ETag promises
+    return gzip.compress(body, compresslevel=getattr(settings, 'API_GZIP_LEVEL', 6), mtime=0)
+
+
+class CompressionMiddleware:
+    """Compresses /api/ responses above API_COMPRESSION_MIN_SIZE bytes"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.min_size = getattr(settings, 'API_COMPRESSION_MIN_SIZE', 1024)
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if (not request.path.startswith(API_PREFIX) or response.streaming
+                or response.has_header('Content-Encoding') or len(response.content) < self.min_size):
+            return response
+        # Whether or not this client gets it compressed, the body depends on Accept-Encoding
+        patch_vary_headers(response, ('Accept-Encoding',))
+        coding = choose_coding(request.headers.get('Accept-Encoding'))
+        if coding is None:
+            return response
+
+        body = response.content
+        encoded = compress(body, coding)
+        if len(encoded) >= len(body):
+            return response
+        response.content = encoded
+        response['Content-Length'] = str(len(encoded))
+        response['Content-Encoding'] = coding
+        etag = response.get('ETag')
+        if etag and not etag.startswith('W/'):
+            response['ETag'] = etag[:-1] + CODING_SUFFIXES[coding] + '"'
+        compressed_total.inc(encoding=coding)
+        compressed_bytes.inc(len(body), encoding=coding, stage='before')
+        compressed_bytes.inc(len(encoded), encoding=coding, stage='after')
+        return response
@@ -0,0 +1,30 @@
+import importlib
+
+
+class LazyModule:
+    """
+    Stand-in for a heavy module that is imported on first attribute access,
+    so `np = lazy_import('numpy')` at module level costs nothing until a
+    function actually uses np.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            # importlib holds the import lock, so concurrent first uses are safe
+            self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return f"<lazy module {self._name!r} ({state})>"
+
+
+def lazy_import(name):
+    return LazyModule(name)
@@ -0,0 +1,235 @@
+import asyncio
+import json
+import logging
+import sys
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import profiling, telemetry
+from .admission import LLMOverloaded, get_controller
+from .circuit import OPEN, CircuitOpen, get_breaker
+from .context import estimate_tokens
+from .singleflight import SingleFlight, StreamFlights, request_key
+
+logger = logging.getLogger(__name__)
+
+# Process-wide in-flight maps for request coalescing
+_flights = SingleFlight()
+_stream_flights = StreamFlights()
+
+
+def _retryable_errors():
+    """Errors worth another attempt; anything else is raised immediately"""
+    # Imported here so loading the gateway does not pull in the openai package
+    from openai import APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+    return (APIConnectionError, APITimeoutError, InternalServerError, RateLimitError)
+
+
+def _caller_name(depth=2):
+    """Name of the function that called into the gateway"""
+    try:
+        return sys._getframe(depth).f_code.co_name
+    except ValueError:
+        return 'unknown'
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens):
+    """Dollar cost from LLM_PRICING (USD per million input/output tokens)"""
+    pricing = getattr(settings, 'LLM_PRICING', {})
+    # Longest matching prefix so dated snapshots use their family's price
+    matches = [name for name in pricing if model.startswith(name)]
+    if not matches:
+        return 0.0
+    input_price, output_price = pricing[max(matches, key=len)]
+    return (prompt_tokens * input_price + completion_tokens * output_price) / 1_000_000
+
+
+def _record(labels, started, usage, status, cache_status):
+    elapsed = time.perf_counter() - started
+    telemetry.llm_latency.observe(elapsed, **labels)
+    telemetry.llm_requests.inc(status=status, cache=cache_status, **labels)
+    profiling.record_span(f"llm:{labels['caller']}", elapsed)
+    if usage is not None:
+        prompt_tokens = getattr(usage, 'prompt_tokens', 0) or 0
+        completion_tokens = getattr(usage, 'completion_tokens', 0) or 0
+        telemetry.llm_prompt_tokens.inc(prompt_tokens, **labels)
+        telemetry.llm_completion_tokens.inc(completion_tokens, **labels)
+        telemetry.llm_cost.inc(estimate_cost(labels['model'], prompt_tokens, completion_tokens), **labels)
+    logger.debug(f"LLM call {labels} {status} in {elapsed * 1000:.1f}ms")
+
+
+class InstrumentedStream:
+    """Wraps a streaming response and records usage and latency when it ends"""
+
+    def __init__(self, stream, labels, started, cache_status, on_finish=None):
+        self._stream = stream
+        self._labels = labels
+        self._started = started
+        self._cache_status = cache_status
+        self._on_finish = on_finish
+        self._usage = None
+        self._recorded = False
+
+    def __iter__(self):
+        status = 'ok'
+        try:
+            for chunk in self._stream:
+                # With include_usage the final chunk carries the token counts
+                if getattr(chunk, 'usage', None) is not None:
+                    self._usage = chunk.usage
+                yield chunk
+        except GeneratorExit:
+            status = 'cancelled'
+            raise
+        except Exception:
+            status = 'error'
+            raise
+        finally:
+            self._finish(status)
+
+    def _finish(self, status):
+        if not self._recorded:
+            self._recorded = True
+            _record(self._labels, self._started, self._usage, status, self._cache_status)
+            if self._on_finish:
+                self._on_finish()
+
+    def close(self):
+        self._finish('cancelled')
+        close = getattr(self._stream, 'close', None)
+        if close:
+            close()
+
+
+def _estimate_call_tokens(kwargs):
+    """Prompt plus maximum completion tokens, for the admission token bucket"""
+    prompt = estimate_tokens(json.dumps(kwargs.get('messages', []), default=str))
+    return prompt + (kwargs.get('max_tokens') or 256)
+
+
+def _create(client, labels, cache_status, kwargs):
+    """One upstream call with circuit breaking, admission control, retries and telemetry"""
+    breaker = get_breaker() if getattr(settings, 'LLM_CIRCUIT_ENABLED', True) else None
+    controller = get_controller() if getattr(settings, 'LLM_ADMISSION_ENABLED', True) else None
+    started = time.perf_counter()
+    try:
+        if breaker is not None:
+            # Fails in microseconds while the upstream is known to be down
+            breaker.before_call()
+        if controller is not None:
+            try:
+                controller.acquire(telemetry.current_client.get(), _estimate_call_tokens(kwargs))
+            except LLMOverloaded:
+                if breaker is not None:
+                    breaker.abandon()
+                raise
+    except LLMOverloaded as e:
+        _record(labels, started, None, 'circuit_open' if isinstance(e, CircuitOpen) else 'shed', cache_status)
+        raise
+
+    max_retries = getattr(settings, 'LLM_MAX_RETRIES', 2)
+    backoff = getattr(settings, 'LLM_RETRY_BACKOFF', 0.5)
+    attempt = 0
+    try:
+        while True:
+            attempt_started = time.perf_counter()
+            try:
+                response = client.chat.completions.create(**kwargs)
+                if breaker is not None:
+                    breaker.record(False, time.perf_counter() - attempt_started)
+                break
+            except _retryable_errors() as e:
+                if breaker is not None:
+                    breaker.record(True, time.perf_counter() - attempt_started)
+                # No point retrying into a circuit that just opened
+                if attempt >= max_retries or (breaker is not None and breaker.state == OPEN):
+                    _record(labels, started, None, 'error', cache_status)
+                    raise
+                attempt += 1
+                telemetry.llm_retries.inc(**labels)
+                logger.warning(f"Retrying LLM call from {labels['caller']} ({attempt}/{max_retries}): {str(e)}")
+                time.sleep(backoff * 2 ** (attempt - 1))
+            except Exception:
+                # Client errors (bad request, auth) say nothing about upstream health
+                if breaker is not None:
+                    breaker.abandon()
+                _record(labels, started, None, 'error', cache_status)
+                raise
+    except BaseException:
+        if controller is not None:
+            controller.release()
+        raise
+
+    if kwargs.get('stream'):
+        # The admission slot is held until the stream is drained or closed
+        return InstrumentedStream(response, labels, started, cache_status,
+                                  on_finish=controller.release if controller is not None else None)
+
+    if controller is not None:
+        controller.release()
+    _record(labels, started, getattr(response, 'usage', None), 'ok', cache_status)
+    return response
+
+
+def chat_completion(client, caller=None, cache_status='miss', coalesce=True, cacheable=False, **kwargs):
+    """
+    Call client.chat.completions.create with retries and telemetry.
+
+    Every LLM call in the app goes through here so latency, tokens, retries
+    and cost are attributed to the model, the serving view and the caller.
+    Identical calls already in flight are coalesced: non-streaming callers
+    share the leader's response, streaming callers replay the chunks sent so
+    far and then follow the live stream.
+
+    cacheable=True marks a non-streaming call whose answer may be reused:
+    it is kept in the shared cache for LLM_RESPONSE_CACHE_SECONDS and
+    identical calls in any worker are served from there.
+    """
+    labels = {
+        'model': kwargs.get('model', ''),
+        'endpoint': telemetry.current_endpoint.get(),
+        'caller': caller or _caller_name(),
+    }
+    if kwargs.get('stream'):
+        kwargs.setdefault('stream_options', {'include_usage': True})
+
+    key = request_key(str(getattr(client, 'base_url', '')), **kwargs)
+    cache_seconds = getattr(settings, 'LLM_RESPONSE_CACHE_SECONDS', 0) if cacheable and not kwargs.get('stream') else 0
+    if cache_seconds:
+        started = time.perf_counter()
+        response = cache.get(f"llm:{key}")
+        if response is not None:
+            _record(labels, started, None, 'ok', 'hit')
+            return response
+
+    if not (coalesce and getattr(settings, 'LLM_COALESCE', True)):
+        response = _create(client, labels, cache_status, kwargs)
+    else:
+        started = time.perf_counter()
+        if kwargs.get('stream'):
+            response, shared = _stream_flights.subscribe(key, lambda: _create(client, labels, cache_status, kwargs))
+        else:
+            response, shared = _flights.do(key, lambda: _create(client, labels, cache_status, kwargs))
+        if shared:
+            # Joiners cost nothing upstream; count them with their wait time only
+            _record(labels, started, None, 'ok', 'coalesced')
+
+    if cache_seconds:
+        try:
+            cache.set(f"llm:{key}", response, cache_seconds)
+        except Exception as e:
+            logger.warning(f"Could not cache LLM response from {labels['caller']}: {str(e)}")
+    return response
+
+
+async def achat_completion(client, caller=None, cache_status='miss', coalesce=True, **kwargs):
+    """
+    chat_completion for async callers. The sync client runs on a worker
+    thread, so async tasks coalesce with threads through the same flight map.
+    """
+    return await asyncio.to_thread(
+        chat_completion, client, caller=caller or _caller_name(), cache_status=cache_status,
+        coalesce=coalesce, **kwargs
+    )
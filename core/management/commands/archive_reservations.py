@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.services import ReservationHistoryService
+
+
+class Command(BaseCommand):
+    help = "Move old completed and cancelled reservations into the archive table"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=getattr(settings, 'RESERVATION_ARCHIVE_DAYS', 90),
+                            help="Archive reservations older than this many days")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Rows moved per transaction")
+
+    def handle(self, *args, **options):
+        moved = ReservationHistoryService.archive(options['days'], options['batch_size'])
+        self.stdout.write(f"Archived {moved} reservation(s) older than {options['days']} days")
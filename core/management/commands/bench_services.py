@@ -0,0 +1,315 @@
+import itertools
+import json
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+from contextlib import ExitStack
+from datetime import datetime, timedelta, timezone
+from urllib.parse import parse_qs, urlsplit
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils import timezone as django_timezone
+from django.test.utils import setup_databases, teardown_databases
+
+from core import availability
+from core.models import Reservation
+from core.services import LocationService, RecommendationService, ReservationService, RestaurantCatalogService
+from core.synthetic import CatalogGenerator, CatalogModel, load_catalog, read_query_log
+
+from .loadtest_chat import percentile
+
+# Latency and memory changes smaller than these are noise, whatever the ratio
+MIN_LATENCY_CHANGE_MS = 1.0
+MIN_MEMORY_CHANGE_KB = 16
+# Queries per call are deterministic for a given seed; more than this is a regression
+MAX_QUERY_INCREASE = 0.05
+
+
+def benchmark_base_date():
+    """
+    The Monday after tomorrow: bookings in the query log are then never in the
+    past and fall on the same weekdays in every run, so queries per call only
+    change when the code does.
+    """
+    start = django_timezone.localdate() + timedelta(days=2)
+    return start + timedelta(days=-start.weekday() % 7)
+
+
+def _search(params, user):
+    filters = {
+        'cuisine_type': params.get('cuisine', ''),
+        'location': params.get('location', ''),
+        'price_range': params.get('price', ''),
+        'rating_min': params.get('rating_min'),
+    }
+    # Evaluated in full, as the search API does
+    return list(RestaurantCatalogService.search_restaurants(filters))
+
+
+def _details(params, user):
+    return RestaurantCatalogService.get_restaurant_details(params['restaurant_id'])
+
+
+def _nearby(params, user):
+    return LocationService.find_nearby_restaurants(float(params['lat']), float(params['lng']),
+                                                   float(params.get('radius', 5.0)))
+
+
+def _availability(params, user):
+    return ReservationService.check_availability(params['restaurant_id'], params['date'], params['time'],
+                                                 params['party_size'])
+
+
+def _reservation(params, user):
+    return ReservationService.create_reservation(params['restaurant_id'], user, params['date'], params['time'],
+                                                 params['party_size'])
+
+
+def _recommendations(params, user):
+    filters = {
+        'occasion': params.get('occasion', ''),
+        'cuisine_preferences': params.getlist('cuisine[]'),
+        'location': params.get('location', ''),
+    }
+    return list(RecommendationService.get_recommendations(filters, user))
+
+
+# name -> (query log endpoint its arguments come from, call)
+HOT_PATHS = {
+    'search_restaurants': ('search', _search),
+    'get_restaurant_details': ('detail', _details),
+    'find_nearby_restaurants': ('nearby', _nearby),
+    'check_availability': ('availability', _availability),
+    'create_reservation': ('availability', _reservation),
+    'get_recommendations': ('recommendations', _recommendations),
+}
+
+
+class _Params(dict):
+    """Query string parameters with QueryDict's get/getlist"""
+
+    def __init__(self, query):
+        self.lists = parse_qs(query)
+        super().__init__((key, values[-1]) for key, values in self.lists.items())
+
+    def getlist(self, key):
+        return self.lists.get(key, [])
+
+
+def query_log_cases(entries):
+    """{endpoint: [params]} from a generated query log"""
+    cases = {}
+    for entry in entries:
+        url = urlsplit(entry['path'])
+        params = _Params(url.query)
+        if entry['endpoint'] == 'detail':
+            params['restaurant_id'] = int(url.path.rstrip('/').rsplit('/', 1)[-1])
+        cases.setdefault(entry['endpoint'], []).append(params)
+    return cases
+
+
+class _QueryCounter:
+    """execute_wrapper counting statements and their time across connections"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+
+
+def measure(call, arguments, iterations, warmup=3, memory_iterations=5):
+    """
+    Latency percentiles and SQL per call over iterations calls, then peak
+    Python memory per call in a separate pass under tracemalloc, which
+    slows allocation too much to share with the timed pass.
+    """
+    for args in itertools.islice(itertools.cycle(arguments), warmup):
+        call(*args)
+
+    counter = _QueryCounter()
+    latencies = []
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(counter))
+        for args in itertools.islice(itertools.cycle(arguments), iterations):
+            started = time.perf_counter()
+            call(*args)
+            latencies.append(time.perf_counter() - started)
+
+    peaks = []
+    tracemalloc.start()
+    try:
+        for args in itertools.islice(itertools.cycle(arguments), memory_iterations):
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            call(*args)
+            peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    finally:
+        tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        'calls': len(latencies),
+        'latency_ms': {
+            **{f"p{p}": round(percentile(latencies, p) * 1000, 3) for p in (50, 90, 99)},
+            'mean': round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+        },
+        'queries_per_call': round(counter.count / len(latencies), 2) if latencies else 0.0,
+        'sql_ms_per_call': round(counter.seconds / len(latencies) * 1000, 3) if latencies else 0.0,
+        'peak_memory_kb': round(max(peaks, default=0) / 1024, 1),
+    }
+
+
+def run_hot_paths(cases, iterations, warmup=3, memory_iterations=5, paths=None):
+    """Benchmark the hot paths against the catalog in the default database"""
+    # Users with booking history, so recommendations take the personalised branch
+    user_ids = list(Reservation.objects.values_list('user_id', flat=True).distinct().order_by('user_id')[:50])
+    users = list(User.objects.filter(id__in=user_ids)) or [None]
+    results = {}
+    for name in paths or HOT_PATHS:
+        endpoint, call = HOT_PATHS[name]
+        if not cases.get(endpoint):
+            raise ValueError(f"The query log has no {endpoint} entries for {name}")
+        arguments = [(params, users[i % len(users)]) for i, params in enumerate(cases[endpoint])]
+        results[name] = measure(call, arguments, iterations, warmup, memory_iterations)
+    return results
+
+
+def compare(baseline, report, tolerance):
+    """Regressions of report against baseline, as a list of dicts"""
+    regressions = []
+    for size, paths in report['sizes'].items():
+        for name, current in paths.items():
+            previous = baseline.get('sizes', {}).get(size, {}).get(name)
+            if previous is None:
+                continue
+            # The tail percentiles of a few dozen calls are too noisy to gate on
+            checks = [
+                ('latency p50', previous['latency_ms']['p50'], current['latency_ms']['p50'], MIN_LATENCY_CHANGE_MS),
+                ('peak memory kb', previous['peak_memory_kb'], current['peak_memory_kb'], MIN_MEMORY_CHANGE_KB),
+            ]
+            for metric, before, after, floor in checks:
+                if after - before > floor and after > before * (1 + tolerance):
+                    regressions.append({'size': size, 'path': name, 'metric': metric, 'baseline': before,
+                                        'current': after})
+            if current['queries_per_call'] - previous['queries_per_call'] > MAX_QUERY_INCREASE:
+                regressions.append({'size': size, 'path': name, 'metric': 'queries per call',
+                                    'baseline': previous['queries_per_call'], 'current': current['queries_per_call']})
+    return regressions
+
+
+class Command(BaseCommand):
+    help = "Benchmark the service-layer hot paths on synthetic catalogs of several sizes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000,10000', help="Comma-separated catalog sizes (restaurants)")
+        parser.add_argument('--iterations', type=int, default=50, help="Timed calls per hot path and size")
+        parser.add_argument('--warmup', type=int, default=3, help="Untimed calls before the timed ones")
+        parser.add_argument('--memory-iterations', type=int, default=5,
+                            help="Calls traced for peak memory, after the timed ones")
+        parser.add_argument('--paths', default=','.join(HOT_PATHS),
+                            help=f"Comma-separated subset of: {', '.join(HOT_PATHS)}")
+        parser.add_argument('--seed', type=int, default=0, help="Seed of the synthetic catalogs")
+        parser.add_argument('--save', nargs='?', const=settings.BENCHMARK_BASELINE, default=None,
+                            help="Write the report as a baseline (default path: BENCHMARK_BASELINE)")
+        parser.add_argument('--compare', nargs='?', const=settings.BENCHMARK_BASELINE, default=None,
+                            help="Fail on regressions against a baseline (default path: BENCHMARK_BASELINE)")
+        parser.add_argument('--tolerance', type=float, default=0.3,
+                            help="Allowed relative increase of median latency and peak memory")
+        parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+
+    def handle(self, *args, **options):
+        if settings.DATABASES[DEFAULT_DB_ALIAS]['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError("bench_services needs an SQLite default database")
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',') if size.strip()]
+        except ValueError:
+            raise CommandError("--sizes must be comma-separated integers")
+        paths = [p.strip() for p in options['paths'].split(',') if p.strip()]
+        unknown = set(paths) - set(HOT_PATHS)
+        if unknown:
+            raise CommandError(f"Unknown hot paths: {', '.join(sorted(unknown))}")
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare']) as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Cannot read baseline {options['compare']}: {e}")
+
+        model = CatalogModel.fit()
+        base_date = benchmark_base_date()
+        report = {
+            'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'seed': options['seed'],
+            'iterations': options['iterations'],
+            'catalogs': {},
+            'sizes': {},
+        }
+        with tempfile.TemporaryDirectory() as work_dir:
+            for size in sizes:
+                catalog_dir = os.path.join(work_dir, str(size))
+                self.stderr.write(f"Generating and loading {size} restaurants")
+                manifest = CatalogGenerator(model, seed=options['seed'], base_date=base_date).generate(
+                    catalog_dir, size, queries=max(200, options['iterations'] * 10))
+                report['catalogs'][str(size)] = manifest['counts']
+                report['sizes'][str(size)] = self.run_size(catalog_dir, work_dir, size, paths, options)
+
+        if options['save']:
+            os.makedirs(os.path.dirname(os.path.abspath(options['save'])), exist_ok=True)
+            with open(options['save'], 'w') as f:
+                json.dump(report, f, indent=2)
+                f.write('\n')
+            self.stderr.write(f"Saved baseline to {options['save']}")
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self.stdout.write(f"{'size':>9}  {'hot path':<26}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}"
+                              f"{'queries':>9}{'sql ms':>9}{'peak KB':>10}")
+            for size, results in report['sizes'].items():
+                for name, stats in results.items():
+                    latency = stats['latency_ms']
+                    self.stdout.write(
+                        f"{size:>9}  {name:<26}{latency['p50']:>9.2f}{latency['p90']:>9.2f}{latency['p99']:>9.2f}"
+                        f"{stats['queries_per_call']:>9.2f}{stats['sql_ms_per_call']:>9.2f}"
+                        f"{stats['peak_memory_kb']:>10.1f}"
+                    )
+
+        if baseline is not None:
+            regressions = compare(baseline, report, options['tolerance'])
+            if regressions:
+                lines = [f"{r['size']} {r['path']} {r['metric']}: {r['baseline']} -> {r['current']}"
+                         for r in regressions]
+                raise CommandError("Regressions against the baseline:\n" + '\n'.join(lines))
+            self.stderr.write(f"No regressions against {options['compare']}")
+
+    def run_size(self, catalog_dir, work_dir, size, paths, options):
+        # A scratch database per size, created and migrated like a test database
+        test_settings = connections[DEFAULT_DB_ALIAS].settings_dict['TEST']
+        original_name = test_settings.get('NAME')
+        test_settings['NAME'] = os.path.join(work_dir, f'bench_{size}.sqlite3')
+        old_config = setup_databases(verbosity=0, interactive=False, serialized_aliases=set())
+        try:
+            load_catalog(catalog_dir)
+            availability.rebuild()
+            self.stderr.write(f"Benchmarking {len(paths)} hot paths on {size} restaurants")
+            return run_hot_paths(query_log_cases(read_query_log(os.path.join(catalog_dir, 'queries.jsonl'))),
+                                 options['iterations'], options['warmup'], options['memory_iterations'], paths)
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            test_settings['NAME'] = original_name
@@ -0,0 +1,161 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from http.client import HTTPConnection
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.synthetic import read_query_log
+
+from .loadtest_chat import percentile
+
+DEFAULT_PATHS = [
+    '/api/restaurants/search/?cuisine=italian',
+    '/api/restaurants/search/?price=%24%24',
+    '/api/recommendations/?occasion=date',
+    '/api/restaurants/nearby/?lat=40.7&lng=-74.0',
+]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_up(port, process, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise CommandError(f"Server on port {port} exited with {process.returncode}")
+        try:
+            conn = HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', '/metrics/')
+            conn.getresponse().read()
+            conn.close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise CommandError(f"Server on port {port} did not start within {timeout}s")
+
+
+def run_load(port, paths, concurrency, duration, timeout=30.0):
+    """GET paths round-robin over keep-alive connections; returns throughput and latency"""
+    deadline = time.perf_counter() + duration
+    latencies, errors = [], defaultdict(int)
+    lock = threading.Lock()
+
+    def worker(offset):
+        conn = HTTPConnection('127.0.0.1', port, timeout=timeout)
+        index = offset
+        while time.perf_counter() < deadline:
+            path = paths[index % len(paths)]
+            index += 1
+            started = time.perf_counter()
+            try:
+                conn.request('GET', path, headers={'Host': 'localhost'})
+                response = conn.getresponse()
+                response.read()
+                error = None if 200 <= response.status < 300 else f"http_{response.status}"
+                if response.getheader('Connection', '').lower() == 'close':
+                    conn.close()
+            except Exception as e:
+                error = type(e).__name__
+                conn.close()
+                conn = HTTPConnection('127.0.0.1', port, timeout=timeout)
+            elapsed = time.perf_counter() - started
+            with lock:
+                if error:
+                    errors[error] += 1
+                else:
+                    latencies.append(elapsed)
+        conn.close()
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    total = len(latencies) + sum(errors.values())
+    return {
+        'requests': total,
+        'throughput_rps': round(len(latencies) / wall, 1) if wall else 0.0,
+        'error_rate': round(sum(errors.values()) / total, 4) if total else 0.0,
+        'errors': dict(errors),
+        'latency_ms': {f"p{p}": round(percentile(latencies, p) * 1000, 1) for p in (50, 90, 99)},
+    }
+
+
+class Command(BaseCommand):
+    help = "Compare catalog API throughput of runserver against the gunicorn production profile"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--servers', default='runserver,gunicorn',
+                            help="Comma-separated subset of: runserver, gunicorn")
+        parser.add_argument('--workers', type=int, default=4, help="gunicorn sync workers")
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--duration', type=float, default=10.0, help="Seconds per server")
+        parser.add_argument('--warmup', type=float, default=2.0, help="Unmeasured seconds before each run")
+        parser.add_argument('--paths', help="Comma-separated request paths (default: catalog APIs)")
+        parser.add_argument('--query-log', help="Replay the paths of a generate_catalog queries.jsonl instead")
+        parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+
+    def _start(self, name, port, workers):
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'restaurant.settings')}
+        if name == 'runserver':
+            command = [sys.executable, 'manage.py', 'runserver', f'127.0.0.1:{port}', '--noreload']
+        else:
+            env.update(SERVER_ROLE='api', GUNICORN_BIND=f'127.0.0.1:{port}', WEB_CONCURRENCY=str(workers),
+                       GUNICORN_ACCESS_LOG='')
+            command = [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py']
+        return subprocess.Popen(command, cwd=settings.BASE_DIR, env=env,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def handle(self, *args, **options):
+        names = [n.strip() for n in options['servers'].split(',') if n.strip()]
+        unknown = set(names) - {'runserver', 'gunicorn'}
+        if unknown:
+            raise CommandError(f"Unknown servers: {', '.join(sorted(unknown))}")
+        paths = options['paths'].split(',') if options['paths'] else DEFAULT_PATHS
+        if options['query_log']:
+            paths = [entry['path'] for entry in read_query_log(options['query_log'])]
+
+        report = {}
+        for name in names:
+            port = free_port()
+            process = self._start(name, port, options['workers'])
+            try:
+                wait_until_up(port, process)
+                if options['warmup']:
+                    run_load(port, paths, options['concurrency'], options['warmup'])
+                self.stderr.write(f"Benchmarking {name} for {options['duration']}s at concurrency {options['concurrency']}")
+                report[name] = run_load(port, paths, options['concurrency'], options['duration'])
+            finally:
+                process.terminate()
+                try:
+                    process.wait(timeout=30)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        self.stdout.write(f"{'server':<12}{'reqs':>8}{'rps':>9}{'err%':>7}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}")
+        for name, stats in report.items():
+            self.stdout.write(
+                f"{name:<12}{stats['requests']:>8}{stats['throughput_rps']:>9.1f}{stats['error_rate'] * 100:>7.1f}"
+                f"{stats['latency_ms']['p50']:>9.0f}{stats['latency_ms']['p90']:>9.0f}{stats['latency_ms']['p99']:>9.0f}"
+            )
+        if 'runserver' in report and 'gunicorn' in report and report['runserver']['throughput_rps']:
+            speedup = report['gunicorn']['throughput_rps'] / report['runserver']['throughput_rps']
+            self.stdout.write(f"gunicorn/runserver throughput: {speedup:.2f}x")
@@ -0,0 +1,183 @@
+import json
+import os
+import random
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from core.db import sqlite_pragmas
+from core.models import Restaurant, SlotOccupancy
+from core.services import RestaurantCatalogService
+
+from .loadtest_chat import percentile
+
+# baseline: Django's SQLite defaults (rollback journal, deferred transactions,
+# a new connection per request). tuned: the SQLITE_PRAGMAS profile with
+# BEGIN IMMEDIATE and one persistent connection per thread.
+PROFILES = ('baseline', 'tuned')
+SEARCHES = ['Italian', 'Chinese', 'Mexican', 'Indian', 'Thai', 'Japanese', 'American', 'French']
+
+
+def catalog_queries():
+    """(sql, params) of the catalog search the API runs, for a few cuisines"""
+    queries = []
+    for cuisine in SEARCHES:
+        queryset = RestaurantCatalogService.search_restaurants({'cuisine_type': cuisine})[:20]
+        sql, params = queryset.query.get_compiler(using=DEFAULT_DB_ALIAS).as_sql()
+        # Django's format-style placeholders to sqlite3's qmark style
+        queries.append((re.sub(r'(?<!%)%s', '?', sql).replace('%%', '%'), params))
+    return queries
+
+
+def booking_statements():
+    """The statements of one seat hold (see availability.try_hold)"""
+    restaurants = Restaurant._meta.db_table
+    occupancy = SlotOccupancy._meta.db_table
+    return [
+        f'SELECT "capacity" FROM "{restaurants}" WHERE "id" = ?',
+        f'INSERT OR IGNORE INTO "{occupancy}" ("restaurant_id", "date", "slot", "seats") VALUES (?, ?, ?, 0)',
+        f'UPDATE "{occupancy}" SET "seats" = "seats" + 1 WHERE "restaurant_id" = ? AND "date" = ? AND "slot" = ?',
+    ]
+
+
+def copy_database(source, target):
+    with sqlite3.connect(source) as src, sqlite3.connect(target) as dst:
+        src.backup(dst)
+    with sqlite3.connect(target) as conn:
+        conn.execute('PRAGMA journal_mode=DELETE')
+
+
+def run_profile(profile, path, readers, writers, duration, restaurant_ids):
+    tuned = profile == 'tuned'
+    reads, books = catalog_queries(), booking_statements()
+    deadline = time.perf_counter() + duration
+    latencies, errors = defaultdict(list), defaultdict(int)
+    lock = threading.Lock()
+
+    def connect():
+        # isolation_level=None: transactions are issued explicitly below
+        conn = sqlite3.connect(path, timeout=5.0, isolation_level=None, check_same_thread=False)
+        for statement in (sqlite_pragmas() if tuned else ['PRAGMA synchronous=FULL']):
+            conn.execute(statement)
+        return conn
+
+    def read(conn, rng):
+        sql, params = rng.choice(reads)
+        conn.execute(sql, params).fetchall()
+
+    def write(conn, rng):
+        restaurant_id = rng.choice(restaurant_ids)
+        key = (restaurant_id, f'2030-01-{rng.randint(1, 28):02d}', rng.randrange(96))
+        conn.execute('BEGIN IMMEDIATE' if tuned else 'BEGIN')
+        try:
+            conn.execute(books[0], (restaurant_id,)).fetchone()
+            conn.execute(books[1], key)
+            conn.execute(books[2], key)
+            conn.execute('COMMIT')
+        except sqlite3.Error:
+            conn.execute('ROLLBACK')
+            raise
+
+    def worker(kind, operation, seed):
+        rng = random.Random(seed)
+        conn = connect() if tuned else None
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                if not tuned:
+                    conn = connect()
+                operation(conn, rng)
+                error = None
+            except sqlite3.OperationalError as e:
+                error = str(e)
+            finally:
+                if not tuned and conn is not None:
+                    conn.close()
+                    conn = None
+            elapsed = time.perf_counter() - started
+            with lock:
+                if error:
+                    errors[f"{kind}: {error}"] += 1
+                else:
+                    latencies[kind].append(elapsed)
+        if conn is not None:
+            conn.close()
+
+    threads = [threading.Thread(target=worker, args=('read', read, i)) for i in range(readers)]
+    threads += [threading.Thread(target=worker, args=('write', write, 1000 + i)) for i in range(writers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    report = {'errors': dict(errors)}
+    for kind in ('read', 'write'):
+        values = sorted(latencies[kind])
+        report[kind] = {
+            'ops': len(values),
+            'throughput_ops': round(len(values) / wall, 1) if wall else 0.0,
+            'latency_ms': {f"p{p}": round(percentile(values, p) * 1000, 2) for p in (50, 90, 99)},
+        }
+    return report
+
+
+class Command(BaseCommand):
+    help = "Compare SQLite read/write throughput under concurrency with and without the tuned profile"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8, help="Threads running catalog searches")
+        parser.add_argument('--writers', type=int, default=4, help="Threads holding reservation seats")
+        parser.add_argument('--duration', type=float, default=5.0, help="Seconds per profile")
+        parser.add_argument('--profiles', default=','.join(PROFILES),
+                            help=f"Comma-separated subset of: {', '.join(PROFILES)}")
+        parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+
+    def handle(self, *args, **options):
+        database = settings.DATABASES[DEFAULT_DB_ALIAS]
+        if database['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError("bench_sqlite needs an SQLite default database")
+        profiles = [p.strip() for p in options['profiles'].split(',') if p.strip()]
+        unknown = set(profiles) - set(PROFILES)
+        if unknown:
+            raise CommandError(f"Unknown profiles: {', '.join(sorted(unknown))}")
+        restaurant_ids = list(Restaurant.objects.values_list('id', flat=True)[:1000])
+        if not restaurant_ids:
+            raise CommandError("The catalog is empty; load some restaurants first")
+
+        report = {}
+        with tempfile.TemporaryDirectory() as work_dir:
+            for profile in profiles:
+                # Each profile runs on a fresh copy so neither sees the other's writes
+                path = os.path.join(work_dir, f'{profile}.sqlite3')
+                copy_database(str(database['NAME']), path)
+                self.stderr.write(f"Benchmarking {profile} for {options['duration']}s "
+                                  f"({options['readers']} readers, {options['writers']} writers)")
+                report[profile] = run_profile(profile, path, options['readers'], options['writers'],
+                                              options['duration'], restaurant_ids)
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        self.stdout.write(f"{'profile':<10}{'op':<7}{'ops':>8}{'ops/s':>10}{'p50 ms':>9}{'p99 ms':>9}{'errors':>8}")
+        for profile, stats in report.items():
+            for kind in ('read', 'write'):
+                failed = sum(n for key, n in stats['errors'].items() if key.startswith(kind))
+                self.stdout.write(
+                    f"{profile:<10}{kind:<7}{stats[kind]['ops']:>8}{stats[kind]['throughput_ops']:>10.1f}"
+                    f"{stats[kind]['latency_ms']['p50']:>9.2f}{stats[kind]['latency_ms']['p99']:>9.2f}{failed:>8}"
+                )
+        if 'baseline' in report and 'tuned' in report:
+            for kind in ('read', 'write'):
+                before = report['baseline'][kind]['throughput_ops']
+                if before:
+                    self.stdout.write(f"{kind} throughput tuned/baseline: "
+                                      f"{report['tuned'][kind]['throughput_ops'] / before:.2f}x")
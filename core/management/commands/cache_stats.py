@@ -0,0 +1,24 @@
+import json
+
+from django.core.cache import InvalidCacheBackendError, caches
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Show hit, miss and eviction counts and the size of a shared cache, over all workers"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--alias', default='default', help="Cache alias in CACHES")
+        parser.add_argument('--clear', action='store_true', help="Remove every entry afterwards")
+
+    def handle(self, *args, **options):
+        try:
+            backend = caches[options['alias']]
+        except InvalidCacheBackendError as e:
+            raise CommandError(str(e))
+        if not hasattr(backend, 'stats'):
+            raise CommandError(f"Cache '{options['alias']}' ({type(backend).__name__}) keeps no statistics")
+        self.stdout.write(json.dumps(backend.stats(), indent=2))
+        if options['clear']:
+            backend.clear()
+            self.stdout.write(f"Cleared cache '{options['alias']}'")
@@ -0,0 +1,44 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.batch_enrichment import BatchEnrichmentPipeline, LocalBatchExecutor, OpenAIBatchExecutor
+from core.models import Restaurant
+
+
+def _placeholder_response(body):
+    """Deterministic stand-in answer for --executor local dry runs"""
+    return json.dumps({'description': body['messages'][-1]['content'], 'atmosphere': 'casual',
+                       'noise_level': 'moderate'})
+
+
+class Command(BaseCommand):
+    help = "Generate descriptions, atmosphere and noise labels for the catalog via batch JSONL files"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--work-dir', default=str(settings.BASE_DIR / 'batch_enrichment'),
+                            help="Where request, output and checkpoint files live; reuse it to resume")
+        parser.add_argument('--executor', choices=['openai', 'local'], default='openai')
+        parser.add_argument('--batch-size', type=int, default=1000, help="Requests per batch file")
+        parser.add_argument('--update-chunk-size', type=int, default=500, help="Rows per bulk_update")
+        parser.add_argument('--poll-interval', type=float, default=30.0)
+        parser.add_argument('--all', action='store_true', help="Include restaurants that already have a description")
+
+    def handle(self, *args, **options):
+        if options['executor'] == 'local':
+            executor = LocalBatchExecutor(_placeholder_response)
+        else:
+            executor = OpenAIBatchExecutor(poll_interval=options['poll_interval'])
+
+        queryset = Restaurant.objects.all()
+        if not options['all']:
+            queryset = queryset.filter(description='')
+
+        pipeline = BatchEnrichmentPipeline(
+            options['work_dir'], executor,
+            batch_size=options['batch_size'],
+            update_chunk_size=options['update_chunk_size'],
+        )
+        updated = pipeline.run(queryset)
+        self.stdout.write(f"Enriched {updated} restaurants ({len(pipeline.checkpoint['batches'])} batch files)")
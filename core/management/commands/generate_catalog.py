@@ -0,0 +1,36 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.synthetic import SOURCE_CSV, CatalogGenerator, CatalogModel
+
+
+class Command(BaseCommand):
+    help = "Synthesize a catalog, users, reviews, reservations and a query log from the source CSV's distributions"
+
+    def add_arguments(self, parser):
+        parser.add_argument('out_dir', help="Directory for the CSV tables, queries.jsonl and manifest.json")
+        parser.add_argument('--restaurants', type=int, default=100_000)
+        parser.add_argument('--users', type=int, default=None, help="Default: one per 10 restaurants")
+        parser.add_argument('--review-rate', type=float, default=0.02,
+                            help="Stored reviews per review in the source counts")
+        parser.add_argument('--reservations', type=float, default=2.0, help="Mean reservations per restaurant")
+        parser.add_argument('--queries', type=int, default=10_000, help="Entries in the query log")
+        parser.add_argument('--qps', type=float, default=50.0, help="Mean arrival rate of the query log")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--chunk-size', type=int, default=100_000)
+        parser.add_argument('--source', default=str(SOURCE_CSV), help="CSV to learn distributions from")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        model = CatalogModel.fit(options['source'])
+        generator = CatalogGenerator(model, seed=options['seed'], chunk_size=options['chunk_size'])
+        manifest = generator.generate(
+            options['out_dir'], options['restaurants'], users=options['users'],
+            review_rate=options['review_rate'], reservations_per_restaurant=options['reservations'],
+            queries=options['queries'], qps=options['qps'],
+        )
+        self.stdout.write(json.dumps(manifest['counts']))
+        self.stdout.write(f"Generated in {time.perf_counter() - started:.1f}s; load with "
+                          f"`manage.py load_catalog {options['out_dir']}`")
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import availability
+from core.synthetic import load_catalog
+
+
+class Command(BaseCommand):
+    help = "Bulk-load a catalog written by generate_catalog"
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory')
+        parser.add_argument('--append', action='store_true',
+                            help="Shift ids past existing rows (the query log then no longer matches)")
+        parser.add_argument('--batch-size', type=int, default=50_000, help="Rows per transaction")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            loaded = load_catalog(options['directory'], append=options['append'], batch_size=options['batch_size'])
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+        # Rows went in without signals, so derive slot occupancy from the bookings
+        buckets = availability.rebuild()
+        elapsed = time.perf_counter() - started
+        summary = ', '.join(f"{count} {table}" for table, count in loaded.items())
+        self.stdout.write(f"Loaded {summary} and {buckets} occupancy buckets in {elapsed:.1f}s")
@@ -0,0 +1,144 @@
+import json
+import threading
+import time
+from collections import defaultdict
+from http.client import HTTPConnection, HTTPSConnection
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+DEFAULT_MESSAGES = [
+    "Find me an Italian restaurant in San Francisco",
+    "Recommend somewhere romantic for a date night",
+    "Is restaurant 1 available tomorrow at 19:00 for 4 people?",
+    "Cheap vegetarian food near downtown",
+]
+
+# name -> (path, streaming)
+ENDPOINTS = {
+    'chat_api': ('/api/chat/', False),
+    'chat_api_stream': ('/api/chat/', True),
+    'chat_endpoint': ('/chat/endpoint/', False),
+}
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+class Command(BaseCommand):
+    help = "Drive the chat endpoints at a target concurrency and report throughput, errors and latency"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help="Base URL of the running site")
+        parser.add_argument('--endpoints', default='chat_api,chat_api_stream,chat_endpoint',
+                            help=f"Comma-separated subset of: {', '.join(ENDPOINTS)}")
+        parser.add_argument('--concurrency', type=int, default=10)
+        parser.add_argument('--duration', type=float, default=30.0, help="Seconds per endpoint")
+        parser.add_argument('--messages-file', help="JSON list of chat messages to send")
+        parser.add_argument('--timeout', type=float, default=60.0)
+        parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+
+    def handle(self, *args, **options):
+        names = [n.strip() for n in options['endpoints'].split(',') if n.strip()]
+        unknown = set(names) - set(ENDPOINTS)
+        if unknown:
+            raise CommandError(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+
+        messages = DEFAULT_MESSAGES
+        if options['messages_file']:
+            with open(options['messages_file']) as f:
+                messages = json.load(f)
+
+        report = {}
+        for name in names:
+            path, streaming = ENDPOINTS[name]
+            self.stderr.write(f"Running {name} for {options['duration']}s at concurrency {options['concurrency']}")
+            report[name] = self._run(options['url'], path, streaming, messages, options)
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        header = f"{'endpoint':<18}{'reqs':>7}{'rps':>9}{'err%':>7}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'ttfb p50':>10}"
+        self.stdout.write(header)
+        for name, stats in report.items():
+            self.stdout.write(
+                f"{name:<18}{stats['requests']:>7}{stats['throughput_rps']:>9.1f}{stats['error_rate'] * 100:>7.1f}"
+                f"{stats['latency_ms']['p50']:>9.0f}{stats['latency_ms']['p90']:>9.0f}{stats['latency_ms']['p99']:>9.0f}"
+                f"{(stats['ttfb_ms'] or {}).get('p50', 0):>10.0f}"
+            )
+
+    def _run(self, base_url, path, streaming, messages, options):
+        parts = urlsplit(base_url)
+        connection_class = HTTPSConnection if parts.scheme == 'https' else HTTPConnection
+        deadline = time.perf_counter() + options['duration']
+        latencies, ttfbs, errors = [], [], defaultdict(int)
+        lock = threading.Lock()
+        counter = [0]
+
+        def worker():
+            conn = connection_class(parts.netloc, timeout=options['timeout'])
+            while time.perf_counter() < deadline:
+                with lock:
+                    message = messages[counter[0] % len(messages)]
+                    counter[0] += 1
+                body = json.dumps({'message': message})
+                headers = {'Content-Type': 'application/json'}
+                if streaming:
+                    headers['Accept'] = 'text/event-stream'
+                started = time.perf_counter()
+                ttfb = None
+                try:
+                    conn.request('POST', path, body=body, headers=headers)
+                    response = conn.getresponse()
+                    if streaming:
+                        while True:
+                            line = response.readline()
+                            if not line:
+                                break
+                            if ttfb is None and line.startswith(b'data: '):
+                                ttfb = time.perf_counter() - started
+                    else:
+                        response.read()
+                    ok = 200 <= response.status < 300
+                    error = None if ok else f"http_{response.status}"
+                except Exception as e:
+                    error = type(e).__name__
+                    conn.close()
+                    conn = connection_class(parts.netloc, timeout=options['timeout'])
+                elapsed = time.perf_counter() - started
+                with lock:
+                    if error:
+                        errors[error] += 1
+                    else:
+                        latencies.append(elapsed)
+                        if ttfb is not None:
+                            ttfbs.append(ttfb)
+            conn.close()
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(options['concurrency'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - started
+
+        latencies.sort()
+        ttfbs.sort()
+        total = len(latencies) + sum(errors.values())
+
+        def summary(values):
+            return {f"p{p}": round(percentile(values, p) * 1000, 1) for p in (50, 90, 99)}
+
+        return {
+            'requests': total,
+            'throughput_rps': len(latencies) / wall if wall else 0.0,
+            'error_rate': sum(errors.values()) / total if total else 0.0,
+            'errors': dict(errors),
+            'latency_ms': summary(latencies),
+            'ttfb_ms': summary(ttfbs) if streaming else None,
+        }
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+
+from core.mock_llm import MockLLMConfig, MockLLMServer
+
+
+class Command(BaseCommand):
+    help = "Run a local OpenAI-compatible mock server (set OPENAI_BASE_URL to its /v1 URL)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8100)
+        parser.add_argument('--latency', type=float, default=0.2, help="Seconds before the first byte")
+        parser.add_argument('--jitter', type=float, default=0.05, help="Uniform +/- seconds added to latency")
+        parser.add_argument('--tokens-per-second', type=float, default=50.0, help="Streaming token rate")
+        parser.add_argument('--completion-tokens', type=int, default=60, help="Tokens per text completion")
+        parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of calls answered with 500")
+        parser.add_argument('--rate-limit-rate', type=float, default=0.0, help="Fraction of calls answered with 429")
+        parser.add_argument('--tool-scripts', help="JSON file of {match, tool_calls} rules")
+        parser.add_argument('--json-scripts', help="JSON file of {match, content} answers for JSON-mode calls")
+        parser.add_argument('--seed', type=int)
+
+    def handle(self, *args, **options):
+        config = MockLLMConfig(
+            latency=options['latency'],
+            jitter=options['jitter'],
+            tokens_per_second=options['tokens_per_second'],
+            completion_tokens=options['completion_tokens'],
+            error_rate=options['error_rate'],
+            rate_limit_rate=options['rate_limit_rate'],
+            tool_scripts=MockLLMConfig.load_scripts(options['tool_scripts']) if options['tool_scripts'] else None,
+            json_scripts=MockLLMConfig.load_scripts(options['json_scripts']) if options['json_scripts'] else None,
+            seed=options['seed'],
+        )
+        server = MockLLMServer((options['host'], options['port']), config)
+        self.stdout.write(f"Mock LLM listening on {server.base_url}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
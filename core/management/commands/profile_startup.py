@@ -0,0 +1,113 @@
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Dependencies that must only load when a request needs them
+LAZY_MODULES = ('openai', 'pandas', 'numpy')
+
+# Runs in a fresh interpreter: set up Django, import the target, report timings
+_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import django
+django.setup()
+setup_done = time.perf_counter()
+import importlib
+importlib.import_module(sys.argv[1])
+finished = time.perf_counter()
+print(json.dumps({
+    'setup_ms': (setup_done - started) * 1000,
+    'import_ms': (finished - setup_done) * 1000,
+    'total_ms': (finished - started) * 1000,
+    'lazy_loaded': [name for name in sys.argv[2:] if name in sys.modules],
+}))
+"""
+
+
+def parse_importtime(stderr):
+    """[(module, self_us, cumulative_us, depth)] from `python -X importtime` output"""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        depth = (len(name) - len(name.lstrip(' '))) // 2
+        modules.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return modules
+
+
+def profile_imports(module='core.urls', importtime=False):
+    """
+    Cold-start timings for importing module in a fresh interpreter, plus the
+    per-module breakdown from -X importtime when asked (which slows the run).
+    """
+    command = [sys.executable]
+    if importtime:
+        command += ['-X', 'importtime']
+    command += ['-c', _PROBE, module, *LAZY_MODULES]
+    env = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'restaurant.settings')}
+    result = subprocess.run(command, cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, timeout=120)
+    if result.returncode != 0:
+        raise CommandError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    if importtime:
+        report['modules'] = parse_importtime(result.stderr)
+    return report
+
+
+class Command(BaseCommand):
+    help = "Report cold import time of the project, per module, and check it against a budget"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--module', default='core.urls', help="Module to import after django.setup()")
+        parser.add_argument('--top', type=int, default=20, help="Modules to list, slowest first")
+        parser.add_argument('--runs', type=int, default=3, help="Timed runs; the fastest is reported")
+        parser.add_argument('--budget-ms', type=float, default=None,
+                            help="Fail above this total (default: STARTUP_IMPORT_BUDGET_MS)")
+        parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+
+    def handle(self, *args, **options):
+        # Timed runs go without -X importtime, which adds its own overhead
+        runs = [profile_imports(options['module']) for _ in range(max(1, options['runs']))]
+        report = min(runs, key=lambda run: run['total_ms'])
+        modules = profile_imports(options['module'], importtime=True)['modules']
+
+        packages = defaultdict(int)
+        for name, self_us, _, _ in modules:
+            packages[name.split('.')[0]] += self_us
+        report['slowest_modules'] = [
+            {'module': name, 'self_ms': self_us / 1000, 'cumulative_ms': cumulative_us / 1000}
+            for name, self_us, cumulative_us, _ in sorted(modules, key=lambda m: m[2], reverse=True)[:options['top']]
+        ]
+        report['packages_ms'] = {
+            name: self_us / 1000
+            for name, self_us in sorted(packages.items(), key=lambda p: p[1], reverse=True)[:options['top']]
+        }
+        budget = options['budget_ms']
+        if budget is None:
+            budget = getattr(settings, 'STARTUP_IMPORT_BUDGET_MS', 0)
+        report['budget_ms'] = budget
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self.stdout.write(
+                f"django.setup() {report['setup_ms']:.0f}ms + import {options['module']} "
+                f"{report['import_ms']:.0f}ms = {report['total_ms']:.0f}ms (best of {len(runs)})"
+            )
+            self.stdout.write(f"\n{'package':<32}{'self ms':>10}")
+            for name, ms in report['packages_ms'].items():
+                self.stdout.write(f"{name:<32}{ms:>10.1f}")
+            self.stdout.write(f"\n{'module':<48}{'self ms':>10}{'cum ms':>10}")
+            for row in report['slowest_modules']:
+                self.stdout.write(f"{row['module']:<48}{row['self_ms']:>10.1f}{row['cumulative_ms']:>10.1f}")
+
+        if report['lazy_loaded']:
+            raise CommandError(f"Imported eagerly at startup: {', '.join(report['lazy_loaded'])}")
+        if budget and report['total_ms'] > budget:
+            raise CommandError(f"Cold import took {report['total_ms']:.0f}ms, over the {budget:.0f}ms budget")
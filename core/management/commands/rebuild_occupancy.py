@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from core import availability
+
+
+class Command(BaseCommand):
+    help = "Recompute reservation slot occupancy from active reservations"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--restaurant', type=int, action='append', dest='restaurants',
+                            help="Only rebuild this restaurant (repeatable)")
+
+    def handle(self, *args, **options):
+        buckets = availability.rebuild(options['restaurants'])
+        self.stdout.write(f"Rebuilt {buckets} occupancy bucket(s)")
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.enrichment import enrichment_queue
+
+
+class Command(BaseCommand):
+    help = "Process queued catalog enrichment jobs"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Drain pending jobs and exit")
+        parser.add_argument('--interval', type=float, default=5.0, help="Seconds between polls when idle")
+
+    def handle(self, *args, **options):
+        while True:
+            processed = enrichment_queue.run_pending()
+            if processed:
+                self.stdout.write(f"Processed {processed} enrichment job(s)")
+            if options['once']:
+                break
+            time.sleep(options['interval'])
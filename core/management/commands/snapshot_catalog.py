@@ -0,0 +1,38 @@
+import json
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.snapshot import CatalogSnapshot, read_header, write_snapshot
+
+
+class Command(BaseCommand):
+    help = "Write the catalog to a memory-mapped snapshot file and publish it to the workers"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=None, help="Default: CATALOG_SNAPSHOT_PATH")
+        parser.add_argument('--chunk-size', type=int, default=10_000, help="Restaurants read per query")
+        parser.add_argument('--show', action='store_true', help="Describe the published snapshot instead")
+
+    def handle(self, *args, **options):
+        path = options['output'] or settings.CATALOG_SNAPSHOT_PATH
+        if options['show']:
+            header = read_header(path)
+            if header is None:
+                raise CommandError(f"No readable snapshot at {path}")
+            snapshot = CatalogSnapshot(path)
+            sections = {name: section['shape'] for name, section in header['sections'].items()}
+            self.stdout.write(json.dumps({key: header[key] for key in ('version', 'created', 'source', 'rows')},
+                                         indent=2))
+            self.stdout.write(json.dumps(sections))
+            self.stdout.write(f"{os.path.getsize(path) / 1024 / 1024:.1f} MiB, "
+                              f"{len(snapshot.header['vocabularies']['cuisine_tags'])} cuisine tags")
+            return
+
+        started = time.perf_counter()
+        header = write_snapshot(path, chunk_size=options['chunk_size'])
+        self.stdout.write(f"Published snapshot v{header['version']} of {header['rows']} restaurants "
+                          f"({os.path.getsize(path) / 1024 / 1024:.1f} MiB) to {path} "
+                          f"in {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_enrichmentjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='restaurant',
+            name='description',
+            field=models.TextField(blank=True),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:59
+
+import django.db.models.deletion
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+def backfill_occupancy(apps, schema_editor):
+    from core.availability import seating_slots
+
+    Reservation = apps.get_model('core', 'Reservation')
+    SlotOccupancy = apps.get_model('core', 'SlotOccupancy')
+    totals = defaultdict(int)
+    rows = Reservation.objects.filter(status__in=('pending', 'confirmed')).values_list(
+        'restaurant_id', 'reservation_time', 'party_size', 'restaurant__average_dining_time')
+    for restaurant_id, start, party_size, dining_minutes in rows.iterator():
+        for day, slot in seating_slots(start, dining_minutes):
+            totals[(restaurant_id, day, slot)] += party_size
+    SlotOccupancy.objects.bulk_create(
+        [SlotOccupancy(restaurant_id=r, date=day, slot=slot, seats=seats)
+         for (r, day, slot), seats in totals.items()],
+        batch_size=1000,
+    )
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_restaurant_description'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlotOccupancy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('slot', models.SmallIntegerField(help_text='Bucket index within the day')),
+                ('seats', models.IntegerField(default=0)),
+                ('restaurant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slot_occupancy', to='core.restaurant')),
+            ],
+            options={
+                'unique_together': {('restaurant', 'date', 'slot')},
+            },
+        ),
+        migrations.RunPython(backfill_occupancy, migrations.RunPython.noop),
+    ]
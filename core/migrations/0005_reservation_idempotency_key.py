@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:02
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_slotoccupancy'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reservation',
+            name='idempotency_key',
+            field=models.CharField(blank=True, help_text='Client key that makes retried booking requests safe', max_length=255, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='reservation',
+            constraint=models.UniqueConstraint(fields=('user', 'idempotency_key'), name='unique_reservation_idempotency_key'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:05
+
+from django.db import migrations, models
+
+
+def compile_existing_hours(apps, schema_editor):
+    from core.hours import compile_hours
+
+    Restaurant = apps.get_model('core', 'Restaurant')
+    restaurants = list(Restaurant.objects.only('id', 'operating_hours'))
+    for restaurant in restaurants:
+        restaurant.hours_bitmap = compile_hours(restaurant.operating_hours)
+    Restaurant.objects.bulk_update(restaurants, ['hours_bitmap'], batch_size=500)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_reservation_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='restaurant',
+            name='hours_bitmap',
+            field=models.BinaryField(help_text='operating_hours compiled to a weekly minute bitmap', null=True),
+        ),
+        migrations.RunPython(compile_existing_hours, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:21
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def release_duplicates(apps, schema_editor):
+    EnrichmentJob = apps.get_model('core', 'EnrichmentJob')
+    # Running jobs from before the lease were never timed; let workers reclaim them
+    EnrichmentJob.objects.filter(status='running').update(started_at=F('updated_at'))
+    seen = set()
+    duplicates = []
+    active = EnrichmentJob.objects.filter(status__in=('pending', 'running')).order_by('created_at', 'id')
+    for job_id, key in active.values_list('id', 'key').iterator():
+        if key in seen:
+            duplicates.append(job_id)
+        seen.add(key)
+    EnrichmentJob.objects.filter(id__in=duplicates).update(status='failed', error='Duplicate of an earlier job')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_reservation_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='enrichmentjob',
+            name='started_at',
+            field=models.DateTimeField(blank=True, help_text='When a worker last claimed the job', null=True),
+        ),
+        migrations.RunPython(release_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='enrichmentjob',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ('pending', 'running'))), fields=('key',), name='unique_active_enrichment_key'),
+        ),
+    ]
@@ -0,0 +1,270 @@
+"""
+Local OpenAI-compatible stand-in for load testing.
+
+Serves POST /v1/chat/completions (plain and streaming) with configurable
+latency, token rate, scripted tool calls and injected errors. JSON-mode
+requests get objects shaped like what the app's prompts ask for (search
+criteria, generated restaurants, catalog labels), so load tests exercise the
+same code paths as real answers. Point the app at it with
+OPENAI_BASE_URL=http://127.0.0.1:<port>/v1.
+"""
+import json
+import logging
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+FILLER_WORDS = (
+    "Here are a few great options nearby that match what you asked for . "
+    "The pasta is excellent , the service is friendly and the prices are fair . "
+    "Reservations are recommended on weekends ."
+).split()
+
+
+class MockLLMConfig:
+    """Behaviour knobs for the mock server"""
+
+    def __init__(self, latency=0.2, jitter=0.05, tokens_per_second=50.0, completion_tokens=60,
+                 error_rate=0.0, rate_limit_rate=0.0, tool_scripts=None, json_scripts=None, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        # [{"match": "book", "tool_calls": [{"name": ..., "arguments": {...}}]}, ...]
+        self.tool_scripts = tool_scripts or []
+        # [{"match": "criteria", "content": {...}}, ...], tried before the built-in JSON answers
+        self.json_scripts = json_scripts or []
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    @classmethod
+    def load_scripts(cls, path):
+        with open(path) as f:
+            return json.load(f)
+
+
+def _count_tokens(messages):
+    text = ''.join(str(m.get('content') or '') for m in messages)
+    return max(1, math.ceil(len(text) / 4))
+
+
+def _completion_text(n_tokens):
+    return ' '.join(FILLER_WORDS[i % len(FILLER_WORDS)] for i in range(n_tokens))
+
+
+def _json_content(messages, config):
+    """
+    A JSON object for a response_format=json_object request: a scripted one,
+    else one shaped after the app prompt it answers, else {}
+    """
+    text = ' '.join(str(m.get('content') or '') for m in messages)
+    for script in config.json_scripts:
+        if script.get('match', '').lower() in text.lower():
+            return json.dumps(script.get('content', {}))
+
+    with config.lock:
+        rng = random.Random(config.random.random())
+    if 'Extract search criteria' in text:
+        return json.dumps({'cuisine': 'italian', 'price_range': '$$', 'location': 'downtown', 'occasion': 'dinner'})
+    if 'restaurant entries' in text:
+        match = re.search(r'for (.+?) cuisine in (.+?)\.', text)
+        cuisine, location = match.groups() if match else ('Fusion', 'the area')
+        return json.dumps({'restaurants': [{
+            'name': f"{cuisine.title()} Kitchen {rng.randint(1, 10 ** 6)}",
+            'address': f"{rng.randint(1, 999)} Main St, {location}",
+            'price_range': rng.choice(['$', '$$', '$$$', '$$$$']),
+            'rating': round(rng.uniform(3.0, 5.0), 1),
+            'cuisine_type': cuisine,
+            'dietary_options': rng.sample(['vegetarian', 'vegan', 'gluten-free'], rng.randint(0, 2)),
+        } for _ in range(5)]})
+    # Catalog labels: every "key (one of: a, b, c)" in the prompt gets one of its values
+    choices = re.findall(r'(\w+) \(one of: ([^)]+)\)', text)
+    if choices:
+        payload = {key: rng.choice([v.strip() for v in values.split(',')]) for key, values in choices}
+        if 'description' in text:
+            payload['description'] = ' '.join(FILLER_WORDS[:12])
+        return json.dumps(payload)
+    return '{}'
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'MockLLM/1.0'
+
+    @property
+    def config(self):
+        return self.server.config
+
+    def log_message(self, format, *args):
+        logger.debug(f"mock-llm {self.address_string()} {format % args}")
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip('/').endswith('/models'):
+            self._send_json(200, {'object': 'list', 'data': [{'id': 'mock', 'object': 'model'}]})
+        else:
+            self._send_json(404, {'error': {'message': 'Not found'}})
+
+    def do_POST(self):
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send_json(404, {'error': {'message': 'Not found'}})
+            return
+
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            request = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            self._send_json(400, {'error': {'message': 'Invalid JSON', 'type': 'invalid_request_error'}})
+            return
+
+        config = self.config
+        with config.lock:
+            roll = config.random.random()
+            delay = max(0.0, config.latency + config.random.uniform(-config.jitter, config.jitter))
+        time.sleep(delay)
+
+        if roll < config.rate_limit_rate:
+            self._send_json(429, {'error': {'message': 'Rate limit reached (injected)', 'type': 'rate_limit_error'}})
+            return
+        if roll < config.rate_limit_rate + config.error_rate:
+            self._send_json(500, {'error': {'message': 'Internal error (injected)', 'type': 'server_error'}})
+            return
+
+        messages = request.get('messages', [])
+        model = request.get('model', 'mock')
+        prompt_tokens = _count_tokens(messages)
+        tool_calls = self._scripted_tool_calls(request)
+        if tool_calls:
+            content = None
+            completion_tokens = sum(_count_tokens([{'content': c['function']['arguments']}]) for c in tool_calls)
+        elif (request.get('response_format') or {}).get('type') == 'json_object':
+            content = _json_content(messages, config)
+            completion_tokens = _count_tokens([{'content': content}])
+        else:
+            completion_tokens = min(config.completion_tokens, request.get('max_tokens') or config.completion_tokens)
+            content = _completion_text(completion_tokens)
+
+        if request.get('stream'):
+            self._stream(model, content, tool_calls, prompt_tokens, completion_tokens, request)
+            return
+
+        message = {'role': 'assistant', 'content': content}
+        if tool_calls:
+            message['tool_calls'] = tool_calls
+        self._send_json(200, {
+            'id': f"chatcmpl-{uuid.uuid4().hex[:24]}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': model,
+            'choices': [{
+                'index': 0,
+                'message': message,
+                'finish_reason': 'tool_calls' if tool_calls else 'stop',
+            }],
+            'usage': {
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens,
+                'total_tokens': prompt_tokens + completion_tokens,
+            },
+        })
+
+    def _scripted_tool_calls(self, request):
+        """Tool calls for the first script whose match appears in the last user message"""
+        messages = request.get('messages', [])
+        if not request.get('tools') or request.get('tool_choice') == 'none':
+            return None
+        # Only answer the user's turn with tools; after tool results, reply in text
+        if not messages or messages[-1].get('role') != 'user':
+            return None
+        text = str(messages[-1].get('content') or '').lower()
+        for script in self.config.tool_scripts:
+            if script.get('match', '').lower() in text:
+                return [{
+                    'id': f"call_{uuid.uuid4().hex[:24]}",
+                    'type': 'function',
+                    'function': {
+                        'name': call['name'],
+                        'arguments': json.dumps(call.get('arguments', {})),
+                    },
+                } for call in script.get('tool_calls', [])]
+        return None
+
+    def _stream(self, model, content, tool_calls, prompt_tokens, completion_tokens, request):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+
+        def chunk(delta, finish_reason=None, usage=None):
+            payload = {
+                'id': completion_id,
+                'object': 'chat.completion.chunk',
+                'created': created,
+                'model': model,
+                'choices': [] if usage else [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}],
+            }
+            if usage:
+                payload['usage'] = usage
+            self.wfile.write(f"data: {json.dumps(payload)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+
+        interval = 1.0 / self.config.tokens_per_second if self.config.tokens_per_second > 0 else 0
+        try:
+            chunk({'role': 'assistant', 'content': ''})
+            if tool_calls:
+                chunk({'tool_calls': [dict(call, index=i) for i, call in enumerate(tool_calls)]}, 'tool_calls')
+            else:
+                for i, word in enumerate(content.split(' ')):
+                    chunk({'content': word if i == 0 else ' ' + word})
+                    if interval:
+                        time.sleep(interval)
+                chunk({}, 'stop')
+            if (request.get('stream_options') or {}).get('include_usage'):
+                chunk({}, usage={
+                    'prompt_tokens': prompt_tokens,
+                    'completion_tokens': completion_tokens,
+                    'total_tokens': prompt_tokens + completion_tokens,
+                })
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            logger.debug("mock-llm client disconnected mid-stream")
+
+
+class MockLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), config=None):
+        super().__init__(address, MockLLMHandler)
+        self.config = config or MockLLMConfig()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start_in_thread(self):
+        """Serve on a daemon thread; returns the thread"""
+        thread = threading.Thread(target=self.serve_forever, name='mock-llm', daemon=True)
+        thread.start()
+        return thread
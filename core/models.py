@@ -1,6 +1,8 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 
+from .hours import compile_hours
+
 class Restaurant(models.Model):
     PRICE_CHOICES = [
         ('$', 'Budget'),
@@ -19,6 +21,7 @@ class Restaurant(models.Model):
     ]
 
     name = models.CharField(max_length=200)
+    description = models.TextField(blank=True)
     address = models.TextField()
     cuisine_type = models.CharField(max_length=100)
     price_range = models.CharField(max_length=4, choices=PRICE_CHOICES)
@@ -27,6 +30,8 @@ class Restaurant(models.Model):
     longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     capacity = models.IntegerField(default=50)
     operating_hours = models.JSONField(default=dict)
+    hours_bitmap = models.BinaryField(null=True, editable=False,
+                                      help_text="operating_hours compiled to a weekly minute bitmap")
     dietary_options = models.JSONField(default=list)
     atmosphere = models.CharField(max_length=20, choices=ATMOSPHERE_CHOICES, default='casual')
     average_dining_time = models.IntegerField(default=60, help_text="Average dining time in minutes")
@@ -38,6 +43,24 @@ class Restaurant(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    def compile_hours(self):
+        self.hours_bitmap = compile_hours(self.operating_hours)
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'operating_hours' in update_fields:
+            self.compile_hours()
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'hours_bitmap'}
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what was loaded so a changed dining time can rebuild occupancy
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
     def __str__(self):
         return self.name
 
@@ -68,8 +91,93 @@ class Reservation(models.Model):
     reservation_time = models.DateTimeField()
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     special_requests = models.TextField(blank=True)
+    idempotency_key = models.CharField(max_length=255, null=True, blank=True,
+                                       help_text="Client key that makes retried booking requests safe")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'idempotency_key'], name='unique_reservation_idempotency_key'),
+        ]
+        indexes = [
+            # Keyset pagination of a user's history
+            models.Index(fields=['user', 'reservation_time', 'id'], name='reservation_user_time'),
+        ]
+
+    # Statuses that hold seats
+    ACTIVE_STATUSES = ('pending', 'confirmed')
+
+    def save(self, *args, **kwargs):
+        # The row and its occupancy change (core.signals) commit or roll back together
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.user.username}'s reservation at {self.restaurant.name}"
+
+class ArchivedReservation(models.Model):
+    """Completed or cancelled reservation moved out of the hot table; keeps its original id"""
+    id = models.BigIntegerField(primary_key=True)
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name='archived_reservations')
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    party_size = models.IntegerField()
+    reservation_time = models.DateTimeField()
+    status = models.CharField(max_length=20, choices=Reservation.STATUS_CHOICES)
+    special_requests = models.TextField(blank=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'reservation_time', 'id'], name='archived_user_time'),
+        ]
+
+    def __str__(self):
+        return f"Archived reservation {self.id} ({self.status})"
+
+class EnrichmentJob(models.Model):
+    """Queued request to grow the catalog for a search that returned nothing"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    key = models.CharField(max_length=255, db_index=True, help_text="Normalized search arguments")
+    search_args = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', db_index=True)
+    attempts = models.IntegerField(default=0)
+    created_count = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+    started_at = models.DateTimeField(null=True, blank=True, help_text="When a worker last claimed the job")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            # At most one waiting or running job per search
+            models.UniqueConstraint(fields=['key'], condition=models.Q(status__in=('pending', 'running')),
+                                    name='unique_active_enrichment_key'),
+        ]
+
+    # Statuses of a job that is still queued or being worked on
+    ACTIVE_STATUSES = ('pending', 'running')
+
+    def __str__(self):
+        return f"Enrichment job {self.key} ({self.status})"
+
+class SlotOccupancy(models.Model):
+    """Seats held per restaurant, day and slot bucket; kept in step with reservations"""
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name='slot_occupancy')
+    date = models.DateField()
+    slot = models.SmallIntegerField(help_text="Bucket index within the day")
+    seats = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('restaurant', 'date', 'slot')
+
+    def __str__(self):
+        return f"{self.restaurant_id} {self.date} slot {self.slot}: {self.seats} seats"
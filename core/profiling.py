@@ -0,0 +1,334 @@
+"""
+Opt-in per-request profiling.
+
+A request is profiled when it carries an X-Profile header (from staff users,
+or anyone while DEBUG is on) or is picked by PROFILING_SAMPLE_RATE. While it
+runs, every query on every database connection of the serving thread, and
+of pool threads that run its work through run_profiled, is timed, LLM calls
+and service methods add their wall time, and with "X-Profile: stack" a
+sampler thread records the request thread's call stacks. The summary goes
+out in Server-Timing headers, and the slowest PROFILING_KEEP_SLOWEST
+profiles are kept in memory for /debug/profiles/. Streaming responses are
+profiled until the server closes them.
+"""
+import contextvars
+import functools
+import heapq
+import itertools
+import logging
+import random
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# The profile of the request being served, if it is profiled
+current_profile = contextvars.ContextVar('current_profile', default=None)
+# Nesting of profiled service calls in this context; only outermost calls
+# count towards the service total
+service_depth = contextvars.ContextVar('service_depth', default=0)
+
+
+class RequestProfile:
+    def __init__(self, request, stack=False):
+        self.method = request.method
+        self.path = request.get_full_path()
+        self.started = time.perf_counter()
+        self.timestamp = time.time()
+        self.queries = []  # (alias, sql, params, seconds)
+        self.spans = defaultdict(lambda: [0, 0.0])  # name -> [calls, seconds]
+        self.service_time = 0.0
+        self.stacks = Counter() if stack else None
+        self.duration = None
+        self.status = None
+        # Tool calls record from pool threads while the request thread does
+        self._lock = threading.Lock()
+
+    def record_query(self, alias, sql, params, seconds):
+        self.queries.append((alias, sql, params, seconds))
+
+    def record_span(self, name, seconds):
+        with self._lock:
+            span = self.spans[name]
+            span[0] += 1
+            span[1] += seconds
+
+    def record_service(self, name, seconds, outermost):
+        with self._lock:
+            span = self.spans[name]
+            span[0] += 1
+            span[1] += seconds
+            if outermost:
+                self.service_time += seconds
+
+    def span_time(self, prefix):
+        return sum(seconds for name, (_, seconds) in self.spans.items() if name.split(':')[0] == prefix)
+
+    def repeated_queries(self, limit=5):
+        """
+        Statements run more than once: 'duplicated' are identical including
+        parameters, 'similar' share only the SQL (the N+1 pattern)
+        """
+        exact = Counter((sql, repr(params)) for _, sql, params, _ in self.queries)
+        similar = Counter(sql for _, sql, _, _ in self.queries)
+        return {
+            'duplicated': [{'sql': sql, 'count': n} for (sql, _), n in exact.most_common(limit) if n > 1],
+            'similar': [{'sql': sql, 'count': n} for sql, n in similar.most_common(limit) if n > 1],
+        }
+
+    def server_timing(self):
+        """Server-Timing header value"""
+        sql_time = sum(q[3] for q in self.queries)
+        duplicated = sum(n - 1 for n in Counter((q[1], repr(q[2])) for q in self.queries).values())
+        entries = [
+            f'db;dur={sql_time * 1000:.1f};desc="{len(self.queries)} queries, {duplicated} duplicated"',
+            f'llm;dur={self.span_time("llm") * 1000:.1f}',
+            f'svc;dur={self.service_time * 1000:.1f}',
+        ]
+        if self.duration is not None:
+            entries.append(f'total;dur={self.duration * 1000:.1f}')
+        return ', '.join(entries)
+
+    def as_dict(self):
+        return {
+            'method': self.method,
+            'path': self.path,
+            'status': self.status,
+            'timestamp': self.timestamp,
+            'duration_ms': round((self.duration or 0) * 1000, 2),
+            'sql': {
+                'count': len(self.queries),
+                'time_ms': round(sum(q[3] for q in self.queries) * 1000, 2),
+                **self.repeated_queries(),
+            },
+            'spans': {
+                name: {'calls': calls, 'time_ms': round(seconds * 1000, 2)}
+                for name, (calls, seconds) in sorted(self.spans.items(), key=lambda s: -s[1][1])
+            },
+            'stacks': [
+                {'stack': stack, 'samples': n} for stack, n in self.stacks.most_common(20)
+            ] if self.stacks is not None else None,
+        }
+
+
+def record_span(name, seconds):
+    """Add time to the current request's profile, if any"""
+    profile = current_profile.get()
+    if profile is not None:
+        profile.record_span(name, seconds)
+
+
+def profile_methods(cls):
+    """Class decorator: time every public static method as a 'service:Class.method' span"""
+    for attr, value in list(vars(cls).items()):
+        if attr.startswith('_') or not isinstance(value, staticmethod):
+            continue
+        setattr(cls, attr, staticmethod(_timed(f"service:{cls.__name__}.{attr}", value.__func__)))
+    return cls
+
+
+def _timed(name, func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        profile = current_profile.get()
+        if profile is None:
+            return func(*args, **kwargs)
+        started = time.perf_counter()
+        depth = service_depth.get()
+        token = service_depth.set(depth + 1)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            service_depth.reset(token)
+            profile.record_service(name, time.perf_counter() - started, outermost=not depth)
+    return wrapper
+
+
+class _QueryTimer:
+    """execute_wrapper for one connection"""
+
+    def __init__(self, profile, alias):
+        self.profile = profile
+        self.alias = alias
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.profile.record_query(self.alias, sql, params, time.perf_counter() - started)
+
+
+@contextmanager
+def activate(profile):
+    """Make profile current and time the queries of this thread's connections"""
+    token = current_profile.set(profile)
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(_QueryTimer(profile, connection.alias)))
+            yield
+    finally:
+        current_profile.reset(token)
+
+
+def run_profiled(func, *args, **kwargs):
+    """
+    func(*args, **kwargs) on a pool thread, profiled like the request thread
+    when run in a copy of a profiled request's context
+    """
+    profile = current_profile.get()
+    if profile is None:
+        return func(*args, **kwargs)
+    with activate(profile):
+        return func(*args, **kwargs)
+
+
+_END = object()
+
+
+def _profiled_chunks(chunks, profile):
+    """A streaming body whose chunks are produced under profile"""
+    chunks = iter(chunks)
+    while True:
+        with activate(profile):
+            chunk = next(chunks, _END)
+        if chunk is _END:
+            return
+        yield chunk
+
+
+async def _aprofiled_chunks(chunks, profile):
+    """Async variant; queries on sync_to_async threads are not timed"""
+    chunks = aiter(chunks)
+    while True:
+        token = current_profile.set(profile)
+        try:
+            chunk = await anext(chunks, _END)
+        finally:
+            current_profile.reset(token)
+        if chunk is _END:
+            return
+        yield chunk
+
+
+class StackSampler(threading.Thread):
+    """Samples one thread's call stack every interval seconds into a Counter of folded stacks"""
+
+    def __init__(self, thread_id, stacks, interval):
+        super().__init__(name='profile-sampler', daemon=True)
+        self.thread_id = thread_id
+        self.stacks = stacks
+        self.interval = interval
+        self.done = threading.Event()
+
+    def run(self):
+        while not self.done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_filename.rsplit('/', 1)[-1]}:{code.co_name}")
+                frame = frame.f_back
+            if names:
+                self.stacks[';'.join(reversed(names))] += 1
+
+
+class SlowestProfiles:
+    """The slowest N profiles seen by this process"""
+
+    def __init__(self, size):
+        self.size = size
+        self._heap = []
+        self._order = itertools.count()
+        self._lock = threading.Lock()
+
+    def add(self, profile):
+        entry = (profile.duration, next(self._order), profile)
+        with self._lock:
+            if len(self._heap) < self.size:
+                heapq.heappush(self._heap, entry)
+            elif entry[0] > self._heap[0][0]:
+                heapq.heapreplace(self._heap, entry)
+
+    def dump(self):
+        with self._lock:
+            entries = sorted(self._heap, key=lambda e: e[0], reverse=True)
+        return [profile.as_dict() for _, _, profile in entries]
+
+    def clear(self):
+        with self._lock:
+            self._heap = []
+
+
+slowest = SlowestProfiles(getattr(settings, 'PROFILING_KEEP_SLOWEST', 50))
+
+
+def _requested_mode(request):
+    header = request.headers.get('X-Profile', '').strip().lower()
+    if header and header not in ('0', 'off'):
+        user = getattr(request, 'user', None)
+        if settings.DEBUG or (user is not None and user.is_staff):
+            return 'stack' if header == 'stack' else 'basic'
+    rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 0.0)
+    if rate and random.random() < rate:
+        return 'basic'
+    return None
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = _requested_mode(request)
+        if mode is None:
+            return self.get_response(request)
+
+        profile = RequestProfile(request, stack=mode == 'stack')
+        sampler = None
+        if profile.stacks is not None:
+            sampler = StackSampler(threading.get_ident(), profile.stacks,
+                                   getattr(settings, 'PROFILING_STACK_INTERVAL', 0.005))
+            sampler.start()
+        try:
+            with activate(profile):
+                response = self.get_response(request)
+        except BaseException:
+            self._stop(profile, sampler)
+            raise
+
+        profile.status = response.status_code
+        if not response.streaming:
+            self._finish(profile, sampler)
+            response['Server-Timing'] = profile.server_timing()
+            return response
+
+        # The body is produced after this returns; the header can only carry
+        # the time so far, and the profile is finished when the server closes
+        # the response
+        response['Server-Timing'] = profile.server_timing()
+        if response.is_async:
+            response.streaming_content = _aprofiled_chunks(response.streaming_content, profile)
+        else:
+            response.streaming_content = _profiled_chunks(response.streaming_content, profile)
+        response._resource_closers.append(functools.partial(self._finish, profile, sampler))
+        return response
+
+    @staticmethod
+    def _stop(profile, sampler):
+        if sampler is not None:
+            sampler.done.set()
+            sampler.join()
+        profile.duration = time.perf_counter() - profile.started
+
+    @staticmethod
+    def _finish(profile, sampler):
+        ProfilingMiddleware._stop(profile, sampler)
+        slowest.add(profile)
@@ -1,13 +1,56 @@
-from django.db.models import Q, F
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Q, F
 from django.conf import settings
+from django.utils import timezone
+import base64
+import binascii
 import logging
+import uuid
 from datetime import datetime, timedelta
-from .models import Restaurant, Reservation
+from . import availability, hours
+from .profiling import profile_methods
+from .singleflight import request_key
+from .models import Restaurant, Reservation, ArchivedReservation
 
 logger = logging.getLogger(__name__)
 
+@profile_methods
 class RestaurantCatalogService:
     """Service for searching and retrieving restaurant information"""
+
+    CATALOG_VERSION_KEY = 'catalog:version'
+
+    @staticmethod
+    def catalog_version():
+        """
+        Token naming the current state of the catalog in the shared cache.
+        Cached catalog results are keyed by it, so changing it drops them all.
+        """
+        version = cache.get(RestaurantCatalogService.CATALOG_VERSION_KEY)
+        if version is None:
+            version = RestaurantCatalogService.invalidate_cache()
+        return version
+
+    @staticmethod
+    def invalidate_cache():
+        """Start a new catalog version; called whenever restaurants change"""
+        version = uuid.uuid4().hex[:12]
+        cache.set(RestaurantCatalogService.CATALOG_VERSION_KEY, version, None)
+        return version
+
+    @staticmethod
+    def cached_result(namespace, params, build, timeout=None):
+        """
+        build() through the shared cache, under a key made of namespace, the
+        catalog version and params
+        """
+        key = f"{namespace}:{RestaurantCatalogService.catalog_version()}:{request_key(**params)}"
+        result = cache.get(key)
+        if result is None:
+            result = build()
+            cache.set(key, result, timeout or getattr(settings, 'CATALOG_CACHE_SECONDS', 300))
+        return result
     
     @staticmethod
     def search_restaurants(filters):
@@ -38,6 +81,10 @@ class RestaurantCatalogService:
                 
             if filters.get('atmosphere'):
                 query = query.filter(atmosphere__icontains=filters['atmosphere'])
+
+            if filters.get('open_at'):
+                # Vectorized bit test over every restaurant's compiled hours
+                query = hours.hours_index.filter_open(query, filters['open_at'])
                 
             # Order results
             order_by = filters.get('order_by', '-rating')
@@ -63,12 +110,12 @@ class RestaurantCatalogService:
                 'price_range': restaurant.price_range,
                 'rating': float(restaurant.rating),
                 'address': restaurant.address,
-                'phone': restaurant.phone,
-                'website': restaurant.website,
-                'hours_of_operation': restaurant.hours_of_operation,
+                'hours_of_operation': restaurant.operating_hours,
+                'open_now': hours.is_open_at(restaurant, timezone.now()) if restaurant.hours_bitmap is not None else None,
                 'dietary_options': restaurant.dietary_options,
                 'atmosphere': restaurant.atmosphere,
-                'image_url': restaurant.image_url
+                'capacity': restaurant.capacity,
+                'average_dining_time': restaurant.average_dining_time
             }
         except Restaurant.DoesNotExist:
             return None
@@ -77,6 +124,7 @@ class RestaurantCatalogService:
             return None
 
 
+@profile_methods
 class LocationService:
     """Service for location-based restaurant operations"""
     
@@ -107,102 +155,387 @@ class LocationService:
             return []
 
 
+@profile_methods
 class ReservationService:
     """Service for handling restaurant reservations"""
     
+    @staticmethod
+    def parse_slot(date, time):
+        """Reservation datetime from YYYY-MM-DD and HH:MM strings, in the project time zone"""
+        reservation_date = datetime.strptime(date, '%Y-%m-%d').date()
+        reservation_time = datetime.strptime(time, '%H:%M').time()
+        return timezone.make_aware(datetime.combine(reservation_date, reservation_time))
+
+    @staticmethod
+    def _validate_request(restaurant_id, date, time, party_size):
+        """
+        (restaurant, datetime, party_size, problem) for a booking request;
+        problem is None or the error/message to return
+        """
+        try:
+            reservation_datetime = ReservationService.parse_slot(date, time)
+            party_size = int(party_size)
+        except (TypeError, ValueError):
+            return None, None, None, {'error': 'Invalid date or time format'}
+
+        try:
+            restaurant = Restaurant.objects.get(id=restaurant_id)
+        except Restaurant.DoesNotExist:
+            return None, None, None, {'error': 'Restaurant not found'}
+
+        if party_size < 1:
+            return restaurant, reservation_datetime, party_size, {'error': 'Party size must be at least 1'}
+        if party_size > restaurant.capacity:
+            return restaurant, reservation_datetime, party_size, {
+                'message': f'{restaurant.name} can seat at most {restaurant.capacity} guests',
+            }
+
+        # Seatings must start within opening hours, when they are known
+        if not hours.is_open_at(restaurant, reservation_datetime):
+            return restaurant, reservation_datetime, party_size, {
+                'message': f'{restaurant.name} is closed at that time',
+            }
+        return restaurant, reservation_datetime, party_size, None
+
     @staticmethod
     def check_availability(restaurant_id, date, time, party_size):
         """
         Check if a restaurant has availability for a given time and party size
         """
         try:
-            # Parse date and time
-            try:
-                # Format: YYYY-MM-DD
-                reservation_date = datetime.strptime(date, '%Y-%m-%d').date()
-                # Format: HH:MM
-                reservation_time = datetime.strptime(time, '%H:%M').time()
-                reservation_datetime = datetime.combine(reservation_date, reservation_time)
-            except ValueError:
-                return {'available': False, 'error': 'Invalid date or time format'}
-                
-            # Check if restaurant exists
-            try:
-                restaurant = Restaurant.objects.get(id=restaurant_id)
-            except Restaurant.DoesNotExist:
-                return {'available': False, 'error': 'Restaurant not found'}
-                
-            # Check if restaurant is open at that time
-            # In a real app, you would check the restaurant's hours of operation
-                
-            # Check existing reservations
-            # This is a simplified check - in reality, you'd need to consider tables, capacity, etc.
-            existing_reservations = Reservation.objects.filter(
-                restaurant_id=restaurant_id,
-                reservation_time__date=reservation_date,
-                reservation_time__hour=reservation_time.hour,
-                reservation_time__minute=reservation_time.minute
-            ).count()
-            
-            # Assume a restaurant can handle 5 reservations per time slot for this demo
-            if existing_reservations >= 5:
-                # Suggest alternative times
-                alternative_times = [
-                    (reservation_datetime - timedelta(hours=1)).strftime('%H:%M'),
-                    (reservation_datetime + timedelta(hours=1)).strftime('%H:%M'),
-                    (reservation_datetime - timedelta(hours=2)).strftime('%H:%M'),
-                    (reservation_datetime + timedelta(hours=2)).strftime('%H:%M'),
-                ]
-                
+            restaurant, reservation_datetime, party_size, problem = ReservationService._validate_request(
+                restaurant_id, date, time, party_size
+            )
+            if problem:
+                return {'available': False, **problem}
+
+            # Overlapping seatings against capacity, from the occupancy array
+            seats_left = availability.seats_left(restaurant, reservation_datetime)
+            if party_size > seats_left:
+                # Suggest the open times nearest to the request
                 return {
-                    'available': False, 
+                    'available': False,
                     'message': 'No availability at the requested time',
-                    'alternative_times': alternative_times
+                    'seats_left': max(seats_left, 0),
+                    'alternative_times': availability.nearest_open_slots(
+                        restaurant, reservation_datetime, party_size
+                    )
                 }
-                
-            return {'available': True}
-            
+
+            return {'available': True, 'seats_left': seats_left}
+
         except Exception as e:
             logger.error(f"Error in check_availability: {str(e)}")
             return {'available': False, 'error': 'An error occurred while checking availability'}
-    
+
     @staticmethod
-    def create_reservation(restaurant_id, user, date, time, party_size, special_requests=''):
+    def availability_grid(restaurant_id, start_date, days, start_time, end_time, party_size):
         """
-        Create a new reservation
+        Seats free per day and time slot over a date range and time window
         """
         try:
-            # First check availability
-            availability = ReservationService.check_availability(restaurant_id, date, time, party_size)
-            
-            if not availability.get('available'):
-                return availability
-                
-            # Parse date and time
-            reservation_date = datetime.strptime(date, '%Y-%m-%d').date()
-            reservation_time = datetime.strptime(time, '%H:%M').time()
-            reservation_datetime = datetime.combine(reservation_date, reservation_time)
-            
-            # Create the reservation
-            reservation = Reservation.objects.create(
-                restaurant_id=restaurant_id,
-                user=user,
-                party_size=party_size,
-                reservation_time=reservation_datetime,
-                special_requests=special_requests
+            try:
+                first_day = datetime.strptime(start_date, '%Y-%m-%d').date()
+                window_start = datetime.strptime(start_time, '%H:%M').time()
+                window_end = datetime.strptime(end_time, '%H:%M').time()
+                days = int(days)
+                party_size = int(party_size)
+            except (TypeError, ValueError):
+                return {'error': 'Invalid date or time format'}
+
+            max_days = getattr(settings, 'AVAILABILITY_GRID_MAX_DAYS', 31)
+            if not 1 <= days <= max_days:
+                return {'error': f'days must be between 1 and {max_days}'}
+            if window_end < window_start:
+                return {'error': 'end_time must not be before start_time'}
+            if party_size < 1:
+                return {'error': 'Party size must be at least 1'}
+
+            try:
+                restaurant = Restaurant.objects.get(id=restaurant_id)
+            except Restaurant.DoesNotExist:
+                return {'error': 'Restaurant not found'}
+
+            grid = availability.availability_grid(
+                restaurant, first_day, days, window_start, window_end, party_size
             )
-            
+            return {
+                'restaurant_id': restaurant.id,
+                'party_size': party_size,
+                'slot_minutes': availability.slot_minutes(),
+                **grid,
+            }
+
+        except Exception as e:
+            logger.error(f"Error in availability_grid: {str(e)}")
+            return {'error': 'An error occurred while building the availability grid'}
+
+    @staticmethod
+    def find_tables(filters, date, time, party_size, flexibility_minutes=30, limit=10):
+        """
+        Restaurants matching catalog filters that have a table for party_size
+        within flexibility_minutes of the requested time, ranked by the
+        nearest open time and then rating. Availability for every candidate
+        comes from one occupancy query.
+        """
+        try:
+            try:
+                requested = ReservationService.parse_slot(date, time)
+                party_size = int(party_size)
+                flexibility_minutes = max(0, int(flexibility_minutes))
+                limit = max(1, int(limit))
+            except (TypeError, ValueError):
+                return {'error': 'Invalid date or time format'}
+            if party_size < 1:
+                return {'error': 'Party size must be at least 1'}
+
+            max_candidates = getattr(settings, 'AVAILABILITY_SEARCH_MAX_CANDIDATES', 200)
+            candidates = RestaurantCatalogService.search_restaurants(filters).filter(
+                capacity__gte=party_size
+            )[:max_candidates]
+            matches = availability.find_tables(candidates, requested, party_size, flexibility_minutes, limit)
+
+            return {
+                'date': date,
+                'time': time,
+                'party_size': party_size,
+                'results': [{
+                    'id': restaurant.id,
+                    'name': restaurant.name,
+                    'cuisine_type': restaurant.cuisine_type,
+                    'price_range': restaurant.price_range,
+                    'rating': float(restaurant.rating),
+                    'address': restaurant.address,
+                    'open_times': open_times,
+                } for restaurant, open_times in matches],
+            }
+
+        except Exception as e:
+            logger.error(f"Error in find_tables: {str(e)}")
+            return {'error': 'An error occurred while searching for tables'}
+
+    @staticmethod
+    def _replay(reservation, restaurant_id, date, time, party_size):
+        """Answer a retried request with the reservation its idempotency key created"""
+        try:
+            same_request = (
+                reservation.restaurant_id == int(restaurant_id)
+                and reservation.party_size == int(party_size)
+                and reservation.reservation_time == ReservationService.parse_slot(date, time)
+            )
+        except (TypeError, ValueError):
+            same_request = False
+        if not same_request:
+            return {'success': False, 'error': 'Idempotency key was already used for a different reservation'}
+        return {
+            'success': True,
+            'reservation_id': reservation.id,
+            'message': f'Reservation successfully created for {date} at {time}',
+            'replayed': True,
+        }
+
+    @staticmethod
+    def create_reservation(restaurant_id, user, date, time, party_size, special_requests='', status='pending',
+                           idempotency_key=None):
+        """
+        Create a new reservation.
+
+        Seats are claimed with availability.try_hold, whose conditional
+        updates make the capacity check and the booking one atomic step. A
+        request repeated with the same idempotency_key returns the original
+        reservation instead of booking twice.
+        """
+        try:
+            if idempotency_key:
+                existing = Reservation.objects.filter(user=user, idempotency_key=idempotency_key).first()
+                if existing:
+                    return ReservationService._replay(existing, restaurant_id, date, time, party_size)
+
+            restaurant, reservation_datetime, party_size, problem = ReservationService._validate_request(
+                restaurant_id, date, time, party_size
+            )
+            if problem:
+                return {'available': False, **problem}
+
+            try:
+                with transaction.atomic():
+                    if not availability.try_hold(restaurant, reservation_datetime, party_size):
+                        return {
+                            'available': False,
+                            'message': 'No availability at the requested time',
+                            'alternative_times': availability.nearest_open_slots(
+                                restaurant, reservation_datetime, party_size
+                            )
+                        }
+                    reservation = Reservation(
+                        restaurant=restaurant,
+                        user=user,
+                        party_size=party_size,
+                        reservation_time=reservation_datetime,
+                        special_requests=special_requests,
+                        status=status,
+                        idempotency_key=idempotency_key or None,
+                    )
+                    reservation._seats_held = True
+                    reservation.save()
+            except IntegrityError:
+                # A concurrent retry with the same key won; its seats stand and ours rolled back
+                if not idempotency_key:
+                    raise
+                existing = Reservation.objects.filter(user=user, idempotency_key=idempotency_key).first()
+                if existing is None:
+                    raise
+                return ReservationService._replay(existing, restaurant_id, date, time, party_size)
+
             return {
                 'success': True,
                 'reservation_id': reservation.id,
                 'message': f'Reservation successfully created for {date} at {time}'
             }
-            
+
         except Exception as e:
             logger.error(f"Error in create_reservation: {str(e)}")
             return {'success': False, 'error': 'An error occurred while creating the reservation'}
 
+    @staticmethod
+    def cancel_reservation(reservation):
+        """
+        Cancel a pending or confirmed reservation and release its seats.
+        The status change is a conditional UPDATE, so of two concurrent
+        cancellations only the one that flipped the row releases. Returns
+        whether this call cancelled it.
+        """
+        with transaction.atomic():
+            seating = Reservation.objects.select_for_update().filter(
+                pk=reservation.pk, status__in=Reservation.ACTIVE_STATUSES
+            ).values_list('restaurant_id', 'reservation_time', 'party_size', 'restaurant__average_dining_time').first()
+            cancelled = Reservation.objects.filter(
+                pk=reservation.pk, status__in=Reservation.ACTIVE_STATUSES
+            ).update(status='cancelled', updated_at=timezone.now())
+            if cancelled != 1:
+                return False
+            availability.release(*seating)
+        reservation.status = 'cancelled'
+        cache.delete(ReservationHistoryService.counts_cache_key(reservation.user_id))
+        return True
+
+
+@profile_methods
+class ReservationHistoryService:
+    """A user's reservations across the hot table and the archive"""
+
+    FIELDS = ('id', 'reservation_time', 'party_size', 'status', 'special_requests',
+              'restaurant__id', 'restaurant__name', 'restaurant__address')
+
+    @staticmethod
+    def encode_cursor(reservation):
+        raw = f"{reservation.reservation_time.isoformat()}|{reservation.id}"
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    @staticmethod
+    def decode_cursor(cursor):
+        """(reservation_time, id) from a cursor; raises ValueError"""
+        try:
+            moment, reservation_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+            return datetime.fromisoformat(moment), int(reservation_id)
+        except (TypeError, UnicodeDecodeError, binascii.Error) as e:
+            raise ValueError(f"Invalid cursor: {str(e)}")
+
+    @staticmethod
+    def _scope_filter(scope, now):
+        upcoming = Q(reservation_time__gte=now, status__in=Reservation.ACTIVE_STATUSES)
+        return upcoming if scope == 'upcoming' else ~upcoming
+
+    @staticmethod
+    def _page(model, user, scope, now, cursor, limit):
+        # Upcoming reads forwards from now, past reads backwards from now
+        descending = scope != 'upcoming'
+        query = model.objects.filter(
+            ReservationHistoryService._scope_filter(scope, now), user=user
+        ).select_related('restaurant').only(*ReservationHistoryService.FIELDS)
+        if cursor:
+            moment, reservation_id = cursor
+            if descending:
+                query = query.filter(Q(reservation_time__lt=moment) | Q(reservation_time=moment, id__lt=reservation_id))
+            else:
+                query = query.filter(Q(reservation_time__gt=moment) | Q(reservation_time=moment, id__gt=reservation_id))
+        order = ('-reservation_time', '-id') if descending else ('reservation_time', 'id')
+        return list(query.order_by(*order)[:limit])
+
+    @staticmethod
+    def get_page(user, scope='upcoming', cursor=None, limit=None):
+        """
+        One page of history with keyset pagination on (reservation_time, id).
+        Returns (reservations, next_cursor); next_cursor is None on the last page.
+        Past pages merge the hot table with the archive, whose rows keep their ids.
+        """
+        limit = limit or getattr(settings, 'RESERVATION_HISTORY_PAGE_SIZE', 20)
+        position = ReservationHistoryService.decode_cursor(cursor) if cursor else None
+        now = timezone.now()
+
+        rows = ReservationHistoryService._page(Reservation, user, scope, now, position, limit + 1)
+        if scope != 'upcoming':
+            rows += ReservationHistoryService._page(ArchivedReservation, user, scope, now, position, limit + 1)
+            rows.sort(key=lambda r: (r.reservation_time, r.id), reverse=True)
+
+        page = rows[:limit]
+        next_cursor = ReservationHistoryService.encode_cursor(page[-1]) if len(rows) > limit else None
+        return page, next_cursor
+
+    @staticmethod
+    def counts_cache_key(user_id):
+        return f"reservation_counts:{user_id}"
+
+    @staticmethod
+    def get_counts(user):
+        """{'upcoming': n, 'past': n}, cached per user and invalidated by core.signals"""
+        key = ReservationHistoryService.counts_cache_key(user.pk)
+        counts = cache.get(key)
+        if counts is None:
+            now = timezone.now()
+            upcoming = ReservationHistoryService._scope_filter('upcoming', now)
+            counts = Reservation.objects.filter(user=user).aggregate(
+                upcoming=Count('id', filter=upcoming),
+                past=Count('id', filter=~upcoming),
+            )
+            counts['past'] += ArchivedReservation.objects.filter(user=user).count()
+            cache.set(key, counts, getattr(settings, 'RESERVATION_COUNTS_CACHE_SECONDS', 300))
+        return counts
+
+    @staticmethod
+    def archive(older_than_days, batch_size=1000):
+        """
+        Move completed and cancelled reservations older than older_than_days
+        into ArchivedReservation, batch_size rows per transaction. Occupancy
+        buckets for days before the cutoff are dropped as well, unless an
+        active reservation still holds them. Returns the number of
+        reservations moved.
+        """
+        cutoff = timezone.now() - timedelta(days=older_than_days)
+        stale = Reservation.objects.filter(
+            status__in=('completed', 'cancelled'), reservation_time__lt=cutoff
+        ).order_by('id')
+        fields = ('id', 'restaurant_id', 'user_id', 'party_size', 'reservation_time', 'status',
+                  'special_requests', 'created_at', 'updated_at')
+
+        moved = 0
+        while True:
+            rows = list(stale.values(*fields)[:batch_size])
+            if not rows:
+                break
+            with transaction.atomic():
+                ArchivedReservation.objects.bulk_create(
+                    [ArchivedReservation(**row) for row in rows], ignore_conflicts=True
+                )
+                Reservation.objects.filter(id__in=[row['id'] for row in rows]).delete()
+            moved += len(rows)
+            logger.info(f"Archived {moved} reservations so far")
+
+        availability.prune(timezone.localtime(cutoff).date())
+        return moved
+
 
+@profile_methods
 class RecommendationService:
     """Service for personalized restaurant recommendations"""
     
@@ -239,6 +572,8 @@ class RecommendationService:
                             
                         # Combine with base results
                         recommended = Restaurant.objects.filter(cuisine_filter)
+                        if filters.get('open_at'):
+                            recommended = hours.hours_index.filter_open(recommended, filters['open_at'])
                         # Remove duplicates and combine
                         recommended_ids = set(recommended.values_list('id', flat=True))
                         base_ids = set(base_results.values_list('id', flat=True))
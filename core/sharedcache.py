@@ -0,0 +1,293 @@
+"""
+A Django cache backend in one SQLite file, shared by every worker process
+on the host and kept across restarts.
+
+Values are pickled, and pickles of at least COMPRESS_MIN_SIZE bytes are
+zlib-compressed when that makes them smaller. The file is bounded by
+MAX_SIZE bytes of keys plus values and MAX_ENTRIES entries. When a write
+goes over either bound, expired entries are dropped first, then the least
+recently used ones, until the cache is back under CULL_TO of both bounds.
+
+A hit does not write to the file: last-access times and the hit, miss and
+eviction counts are buffered per process and flushed in one transaction at
+most every STATS_FLUSH_INTERVAL seconds, so reads never queue on the write
+lock. The flushed counts add up over all workers; see stats().
+"""
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import zlib
+from collections import Counter
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from . import telemetry
+
+logger = logging.getLogger(__name__)
+
+cache_requests = telemetry.registry.counter(
+    'cache_requests_total', "Shared cache lookups by key namespace and result", ('namespace', 'result'))
+cache_evictions = telemetry.registry.counter(
+    'cache_evictions_total', "Entries evicted from the shared cache to stay within its bounds")
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS cache (
+        key TEXT PRIMARY KEY,
+        value BLOB NOT NULL,
+        compressed INTEGER NOT NULL,
+        size INTEGER NOT NULL,
+        expires REAL,
+        accessed REAL NOT NULL
+    ) WITHOUT ROWID""",
+    "CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)",
+    "CREATE TABLE IF NOT EXISTS cache_stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL) WITHOUT ROWID",
+]
+STATS = ('hits', 'misses', 'sets', 'evictions', 'expired')
+# Running totals kept in cache_stats so bounds are checked without scanning the table
+TOTALS = ('entries', 'bytes')
+
+
+def _namespace(key):
+    """Label for metrics: the part of a key before its first colon"""
+    return key.split(':', 1)[0] if ':' in key else 'other'
+
+
+class SQLiteCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.path = str(location)
+        self.max_size = int(options.get('MAX_SIZE', 256 * 1024 * 1024))
+        self.cull_to = float(options.get('CULL_TO', 0.9))
+        self.compress_min_size = int(options.get('COMPRESS_MIN_SIZE', 1024))
+        self.compress_level = int(options.get('COMPRESS_LEVEL', 6))
+        self.busy_timeout = float(options.get('BUSY_TIMEOUT', 5.0))
+        self.stats_flush_interval = float(options.get('STATS_FLUSH_INTERVAL', 1.0))
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._pending = Counter()
+        self._touched = {}
+        self._last_flush = time.monotonic()
+
+    # Connections and schema
+
+    def _connection(self):
+        # One connection per thread, and new ones after a fork: SQLite
+        # handles must not cross process boundaries
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            for statement in SCHEMA:
+                conn.execute(statement)
+            conn.executemany('INSERT OR IGNORE INTO cache_stats (name, value) VALUES (?, 0)',
+                             [(name,) for name in STATS + TOTALS])
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _write(self, fn):
+        """Run fn(conn) in an IMMEDIATE transaction"""
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            result = fn(conn)
+            conn.execute('COMMIT')
+            return result
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    # Serialization
+
+    def _encode(self, value):
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if len(data) >= self.compress_min_size:
+            packed = zlib.compress(data, self.compress_level)
+            if len(packed) < len(data):
+                return packed, 1
+        return data, 0
+
+    @staticmethod
+    def _decode(data, compressed):
+        return pickle.loads(zlib.decompress(data) if compressed else data)
+
+    # Buffered statistics and access times
+
+    def _note(self, stat, key=None, accessed=None):
+        with self._lock:
+            self._pending[stat] += 1
+            if accessed is not None:
+                self._touched[key] = accessed
+            due = time.monotonic() - self._last_flush >= self.stats_flush_interval
+        if due:
+            self.flush_stats()
+
+    def flush_stats(self):
+        """Write this process's buffered counts and access times to the file"""
+        with self._lock:
+            pending, touched = self._pending, self._touched
+            self._pending, self._touched = Counter(), {}
+            self._last_flush = time.monotonic()
+        if not pending and not touched:
+            return
+
+        def flush(conn):
+            conn.executemany('UPDATE cache_stats SET value = value + ? WHERE name = ?',
+                             [(n, name) for name, n in pending.items()])
+            # Never move an access time backwards, another worker may have a later one
+            conn.executemany('UPDATE cache SET accessed = MAX(accessed, ?) WHERE key = ?',
+                             [(accessed, key) for key, accessed in touched.items()])
+        try:
+            self._write(flush)
+        except sqlite3.Error as e:
+            logger.warning(f"Could not flush cache statistics: {str(e)}")
+
+    # Eviction
+
+    def _adjust_totals(self, conn, entries, size):
+        conn.execute("UPDATE cache_stats SET value = value + ? WHERE name = 'entries'", (entries,))
+        conn.execute("UPDATE cache_stats SET value = value + ? WHERE name = 'bytes'", (size,))
+
+    def _totals(self, conn):
+        rows = dict(conn.execute("SELECT name, value FROM cache_stats WHERE name IN ('entries', 'bytes')"))
+        return rows['entries'], rows['bytes']
+
+    def _cull(self, conn, now):
+        entries, size = self._totals(conn)
+        if entries <= self._max_entries and size <= self.max_size:
+            return
+        removed = conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache WHERE expires <= ?',
+                               (now,)).fetchone()
+        if removed[0]:
+            conn.execute('DELETE FROM cache WHERE expires <= ?', (now,))
+            self._adjust_totals(conn, -removed[0], -removed[1])
+            entries, size = entries - removed[0], size - removed[1]
+            with self._lock:
+                self._pending['expired'] += removed[0]
+
+        target_entries = int(self._max_entries * self.cull_to)
+        target_size = int(self.max_size * self.cull_to)
+        if entries <= self._max_entries and size <= self.max_size:
+            return
+        victims, freed = [], 0
+        for key, key_size in conn.execute('SELECT key, size FROM cache ORDER BY accessed'):
+            if entries - len(victims) <= target_entries and size - freed <= target_size:
+                break
+            victims.append((key,))
+            freed += key_size
+        conn.executemany('DELETE FROM cache WHERE key = ?', victims)
+        self._adjust_totals(conn, -len(victims), -freed)
+        with self._lock:
+            self._pending['evictions'] += len(victims)
+        cache_evictions.inc(len(victims))
+
+    # Django cache API
+
+    def _store(self, key, value, timeout, only_if_missing=False):
+        data, compressed = self._encode(value)
+        size = len(key) + len(data)
+        expires = self.get_backend_timeout(timeout)
+        now = time.time()
+
+        def store(conn):
+            row = conn.execute('SELECT size, expires FROM cache WHERE key = ?', (key,)).fetchone()
+            if only_if_missing and row is not None and (row[1] is None or row[1] > now):
+                return False
+            conn.execute('INSERT OR REPLACE INTO cache (key, value, compressed, size, expires, accessed) '
+                         'VALUES (?, ?, ?, ?, ?, ?)', (key, data, compressed, size, expires, now))
+            self._adjust_totals(conn, 0 if row else 1, size - (row[0] if row else 0))
+            self._cull(conn, now)
+            return True
+        stored = self._write(store)
+        if stored:
+            self._note('sets')
+        return stored
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._store(key, value, timeout, only_if_missing=True)
+
+    def get(self, key, default=None, version=None):
+        namespace = _namespace(key)
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+        row = self._connection().execute('SELECT value, compressed, expires FROM cache WHERE key = ?',
+                                          (key,)).fetchone()
+        if row is not None and (row[2] is None or row[2] > now):
+            try:
+                value = self._decode(row[0], row[1])
+            except (pickle.UnpicklingError, zlib.error, EOFError, AttributeError, ImportError) as e:
+                # Written by code that no longer exists, e.g. before a deploy
+                logger.warning(f"Dropping unreadable cache entry {key}: {str(e)}")
+            else:
+                cache_requests.inc(namespace=namespace, result='hit')
+                self._note('hits', key, now)
+                return value
+        cache_requests.inc(namespace=namespace, result='miss')
+        self._note('misses')
+        return default
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self._store(key, value, timeout)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+        expires = self.get_backend_timeout(timeout)
+        return self._write(lambda conn: conn.execute(
+            'UPDATE cache SET expires = ?, accessed = ? WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            (expires, now, key, now)).rowcount) == 1
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+
+        def delete(conn):
+            row = conn.execute('SELECT size FROM cache WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return False
+            conn.execute('DELETE FROM cache WHERE key = ?', (key,))
+            self._adjust_totals(conn, -1, -row[0])
+            return True
+        return self._write(delete)
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        row = self._connection().execute('SELECT expires FROM cache WHERE key = ?', (key,)).fetchone()
+        return row is not None and (row[0] is None or row[0] > time.time())
+
+    def clear(self):
+        def clear(conn):
+            conn.execute('DELETE FROM cache')
+            conn.execute("UPDATE cache_stats SET value = 0 WHERE name IN ('entries', 'bytes')")
+        self._write(clear)
+
+    def close(self, **kwargs):
+        # Called at the end of every request; keep the connection, but
+        # let the buffered statistics out if they are due
+        if time.monotonic() - self._last_flush >= self.stats_flush_interval:
+            self.flush_stats()
+
+    def stats(self):
+        """Counts over all workers (as of their last flush), entries and bytes stored"""
+        self.flush_stats()
+        conn = self._connection()
+        values = dict(conn.execute('SELECT name, value FROM cache_stats'))
+        stored = conn.execute('SELECT COALESCE(SUM(compressed), 0) FROM cache').fetchone()[0]
+        lookups = values['hits'] + values['misses']
+        return {
+            **{name: values[name] for name in STATS + TOTALS},
+            'compressed_entries': stored,
+            'hit_rate': round(values['hits'] / lookups, 4) if lookups else 0.0,
+            'max_entries': self._max_entries,
+            'max_bytes': self.max_size,
+            'path': self.path,
+        }
@@ -0,0 +1,93 @@
+import logging
+
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import availability
+from .models import Reservation, Restaurant
+from .services import ReservationHistoryService, RestaurantCatalogService
+
+logger = logging.getLogger(__name__)
+
+_SEATING_FIELDS = ('restaurant_id', 'reservation_time', 'party_size', 'status')
+
+
+def _seating(values):
+    """(restaurant_id, start, party_size) while the reservation holds seats, else None"""
+    if values['status'] not in Reservation.ACTIVE_STATUSES:
+        return None
+    return values['restaurant_id'], values['reservation_time'], values['party_size']
+
+
+def _current(instance):
+    return {field: getattr(instance, field) for field in _SEATING_FIELDS}
+
+
+def _stored_seating(instance):
+    """The seating the row holds in the database, read under a row lock"""
+    stored = Reservation.objects.select_for_update().filter(pk=instance.pk).values(*_SEATING_FIELDS).first()
+    return _seating(stored) if stored else None
+
+
+@receiver(pre_save, sender=Reservation)
+def remember_previous_seating(sender, instance, raw, **kwargs):
+    if raw or instance._state.adding:
+        # Bookings made through availability.try_hold already hold their seats
+        held = getattr(instance, '_seats_held', False)
+        instance._previous_seating = _seating(_current(instance)) if held and not raw else None
+        return
+    # Not the in-memory copy: a concurrent save may have changed the row since
+    # it was loaded. Reservation.save's transaction makes such writers queue.
+    instance._previous_seating = _stored_seating(instance)
+
+
+@receiver(post_save, sender=Reservation)
+def update_occupancy_on_save(sender, instance, created, raw, **kwargs):
+    if raw:
+        return
+    before = getattr(instance, '_previous_seating', None)
+    after = _seating(_current(instance))
+    if before != after:
+        if before:
+            dining_minutes = Restaurant.objects.values_list('average_dining_time', flat=True).get(pk=before[0])
+            availability.release(*before, dining_minutes)
+        if after and not availability.try_hold(Restaurant.objects.get(pk=after[0]), *after[1:]):
+            # Rolls back the row and the release above with Reservation.save's transaction
+            raise availability.SlotFull(f"No room for {after[2]} at restaurant {after[0]} at {after[1]}")
+    cache.delete(ReservationHistoryService.counts_cache_key(instance.user_id))
+
+
+@receiver(pre_delete, sender=Reservation)
+def remember_seating_on_delete(sender, instance, **kwargs):
+    # Sent inside the deletion's transaction. Rows inactive in memory (the
+    # archive's) skip the lookup; stale copies of active ones may not be active.
+    active = instance.status in Reservation.ACTIVE_STATUSES
+    instance._previous_seating = _stored_seating(instance) if active else None
+
+
+@receiver(post_delete, sender=Reservation)
+def release_occupancy_on_delete(sender, instance, **kwargs):
+    seating = getattr(instance, '_previous_seating', None)
+    if seating:
+        dining_minutes = Restaurant.objects.filter(pk=seating[0]).values_list('average_dining_time', flat=True).first()
+        # None when the restaurant itself is being deleted; its buckets cascade
+        if dining_minutes is not None:
+            availability.release(*seating, dining_minutes)
+    cache.delete(ReservationHistoryService.counts_cache_key(instance.user_id))
+
+
+@receiver(post_save, sender=Restaurant)
+def rebuild_occupancy_on_dining_time_change(sender, instance, created, raw, **kwargs):
+    loaded = getattr(instance, '_loaded_values', None) or {}
+    if not raw and not created and 'average_dining_time' in loaded \
+            and loaded['average_dining_time'] != instance.average_dining_time:
+        logger.info(f"Dining time of restaurant {instance.pk} changed, rebuilding occupancy")
+        availability.rebuild([instance.pk])
+    instance._loaded_values = {**loaded, 'average_dining_time': instance.average_dining_time}
+
+
+@receiver(post_save, sender=Restaurant)
+@receiver(post_delete, sender=Restaurant)
+def invalidate_catalog_cache(sender, instance, **kwargs):
+    RestaurantCatalogService.invalidate_cache()
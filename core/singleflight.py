@@ -0,0 +1,215 @@
+import hashlib
+import json
+import logging
+import threading
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize(value):
+    """Collapse whitespace in strings so trivially different prompts share a key"""
+    if isinstance(value, str):
+        return ' '.join(value.split())
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def request_key(*parts, **kwargs):
+    """Stable hash of a normalized call signature"""
+    payload = json.dumps([_normalize(list(parts)), _normalize(kwargs)], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent calls. The first caller for a key runs the
+    function; callers arriving while it is in flight wait on the same future
+    and receive its result (or exception). Async callers go through
+    llm.achat_completion, which calls do() on a worker thread, so a coroutine
+    can join a call led by a thread and vice versa.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight = {}
+
+    def _join(self, key):
+        """Return (future, is_leader)"""
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                return future, False
+            future = self._inflight[key] = Future()
+            return future, True
+
+    def _settle(self, key, future, result=None, error=None):
+        with self._lock:
+            self._inflight.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, key, fn):
+        """Run fn once per in-flight key. Returns (result, shared) where shared is True for joiners."""
+        future, leader = self._join(key)
+        if not leader:
+            return future.result(), True
+        try:
+            result = fn()
+        except BaseException as e:
+            self._settle(key, future, error=e)
+            raise
+        self._settle(key, future, result=result)
+        return result, False
+
+    def inflight(self):
+        return len(self._inflight)
+
+
+class SharedStream:
+    """
+    Fan-out of one upstream stream to many subscribers.
+
+    A pump thread reads the upstream into a buffer. Each subscriber first
+    replays everything already buffered, then follows the live stream. The
+    upstream is closed early only when every subscriber has gone away.
+    """
+
+    def __init__(self, upstream=None, on_finish=None):
+        self._upstream = upstream
+        self._on_finish = on_finish
+        self._items = []
+        self._done = False
+        self._error = None
+        self._subscribers = 0
+        self._cond = threading.Condition()
+
+    def start(self):
+        threading.Thread(target=self._run, name='shared-stream', daemon=True).start()
+
+    def _run(self):
+        try:
+            for item in self._upstream:
+                with self._cond:
+                    abandoned = self._done
+                if abandoned:
+                    # Every subscriber left before the upstream finished
+                    close = getattr(self._upstream, 'close', None)
+                    if close:
+                        close()
+                    break
+                with self._cond:
+                    self._items.append(item)
+                    self._cond.notify_all()
+        except Exception as e:
+            self._error = e
+        finally:
+            with self._cond:
+                self._done = True
+                self._cond.notify_all()
+            if self._on_finish:
+                self._on_finish()
+
+    def _fail(self, error):
+        """Abort a flight whose upstream could not be opened"""
+        with self._cond:
+            self._error = error
+            self._done = True
+            self._cond.notify_all()
+        if self._on_finish:
+            self._on_finish()
+
+    def subscribe(self):
+        """A new subscription, or None once the stream has finished or been abandoned"""
+        with self._cond:
+            if self._done:
+                return None
+            self._subscribers += 1
+        return _Subscription(self)
+
+    def _unsubscribe(self):
+        with self._cond:
+            self._subscribers -= 1
+            abandoned = self._subscribers == 0 and not self._done
+            if abandoned:
+                self._done = True
+                self._cond.notify_all()
+        if abandoned and self._upstream is not None:
+            close = getattr(self._upstream, 'close', None)
+            if close:
+                close()
+
+
+class _Subscription:
+    """Iterator over a SharedStream with the close() interface of an SDK stream"""
+
+    def __init__(self, shared):
+        self._shared = shared
+        self._closed = False
+
+    def __iter__(self):
+        shared = self._shared
+        index = 0
+        try:
+            while True:
+                with shared._cond:
+                    while index >= len(shared._items) and not shared._done:
+                        shared._cond.wait()
+                    if index >= len(shared._items):
+                        if shared._error is not None:
+                            raise shared._error
+                        return
+                    item = shared._items[index]
+                index += 1
+                yield item
+        finally:
+            self.close()
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._shared._unsubscribe()
+
+
+class StreamFlights:
+    """Single-flight for streaming calls: joiners subscribe to the live SharedStream"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight = {}
+
+    def subscribe(self, key, start):
+        """Return (subscription, shared). start() opens the upstream for a new flight."""
+        with self._lock:
+            shared = self._inflight.get(key)
+            if shared is not None:
+                subscription = shared.subscribe()
+                if subscription is not None:
+                    return subscription, True
+                # Abandoned by its subscribers, its pump thread has just not
+                # exited yet: replace it rather than replay a truncated stream
+            # Register before opening the upstream so callers arriving during
+            # connection setup join this flight instead of starting their own
+            shared = SharedStream(None)
+            shared._on_finish = lambda: self._finish(key, shared)
+            self._inflight[key] = shared
+            subscription = shared.subscribe()
+
+        try:
+            upstream = start()
+        except Exception as e:
+            shared._fail(e)
+            raise
+        shared._upstream = upstream
+        shared.start()
+        return subscription, False
+
+    def _finish(self, key, shared):
+        with self._lock:
+            if self._inflight.get(key) is shared:
+                del self._inflight[key]
@@ -0,0 +1,380 @@
+"""
+Read-only catalog snapshot, memory-mapped and shared by every worker.
+
+`manage.py snapshot_catalog` writes the Restaurant table to one binary file.
+The file holds fixed-width numeric columns, cuisine and dietary tag bitsets,
+the compiled hours bitmaps, and UTF-8 string tables. Each worker maps it with
+mmap, and numpy views read straight from the shared page cache, so N
+preforked workers hold one copy of the catalog instead of N.
+
+Layout: a 24-byte prefix (magic, format version, header length, data
+offset), a JSON header describing every section, then the sections, each
+64-byte aligned. A new snapshot is written to a temporary file and renamed
+over the published path. Readers notice the new inode within
+CATALOG_SNAPSHOT_CHECK_INTERVAL seconds and swap to it in one assignment.
+Views taken from the old snapshot stay valid until they are dropped.
+
+The header records the catalog state (row count and latest updated_at)
+it was taken from. Consumers such as the hours index use it only while
+it still matches the database.
+"""
+import json
+import logging
+import math
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Count, Max
+
+from .hours import BITMAP_BYTES
+from .lazy import lazy_import
+from .models import Restaurant
+
+np = lazy_import('numpy')
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'RCSNAP\x00\x00'
+FORMAT_VERSION = 1
+# magic, format version, header length, data offset
+PREFIX = struct.Struct('<8sIIQ')
+ALIGN = 64
+
+# Coded columns: value -> 1-based index into these tables, 0 for anything else
+CODES = {
+    'price_range': [code for code, _ in Restaurant.PRICE_CHOICES],
+    'atmosphere': [code for code, _ in Restaurant.ATMOSPHERE_CHOICES],
+    'noise_level': [code for code, _ in Restaurant._meta.get_field('noise_level').choices],
+}
+STRING_COLUMNS = ('name', 'address', 'cuisine_type')
+
+
+def catalog_state():
+    """(row count, latest updated_at) of the catalog; changes whenever a restaurant does"""
+    return tuple(Restaurant.objects.aggregate(count=Count('id'), latest=Max('updated_at')).values())
+
+
+def _state_header(state):
+    count, latest = state
+    return [count, latest.isoformat() if latest else None]
+
+
+def cuisine_tags(cuisine_type):
+    return [tag.strip().lower() for tag in (cuisine_type or '').split(',') if tag.strip()]
+
+
+def _align(offset):
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+
+class _SectionWriter:
+    """Appends one section's bytes to its own temporary file"""
+
+    def __init__(self, directory, name, dtype, width=None):
+        self.name = name
+        self.dtype = dtype
+        self.width = width
+        self.rows = 0
+        self.file = open(os.path.join(directory, name), 'w+b')
+
+    def append(self, array):
+        array = np.ascontiguousarray(array, dtype=self.dtype)
+        self.file.write(array.tobytes())
+        self.rows += array.shape[0]
+
+    def describe(self):
+        shape = [self.rows, self.width] if self.width else [self.rows]
+        return {'dtype': np.dtype(self.dtype).str, 'shape': shape}
+
+
+def _bitset(rows, vocabulary):
+    """(len(rows), words) uint64 array with bit vocabulary[tag] set for each tag of each row"""
+    words = max(1, math.ceil(len(vocabulary) / 64))
+    bits = np.zeros((len(rows), words), dtype=np.uint64)
+    for i, tags in enumerate(rows):
+        for tag in tags:
+            index = vocabulary[tag]
+            bits[i, index >> 6] |= np.uint64(1) << np.uint64(index & 63)
+    return bits
+
+
+def write_snapshot(path=None, chunk_size=10_000):
+    """
+    Snapshot the catalog to path (default CATALOG_SNAPSHOT_PATH) and publish
+    it atomically. Returns the header.
+    """
+    path = str(path or settings.CATALOG_SNAPSHOT_PATH)
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    previous = read_header(path)
+    state = catalog_state()
+
+    # Vocabularies first, from the few distinct values, so bitsets have a fixed width
+    cuisines = sorted({tag for value in Restaurant.objects.values_list('cuisine_type', flat=True).distinct()
+                       for tag in cuisine_tags(value)})
+    dietary = sorted({str(tag).strip().lower()
+                      for value in Restaurant.objects.values_list('dietary_options', flat=True).distinct()
+                      for tag in (value or []) if str(tag).strip()})
+    cuisine_index = {tag: i for i, tag in enumerate(cuisines)}
+    dietary_index = {tag: i for i, tag in enumerate(dietary)}
+    codes = {column: {value: i + 1 for i, value in enumerate(values)} for column, values in CODES.items()}
+
+    columns = ['id', 'rating', 'latitude', 'longitude', 'capacity', 'average_dining_time', *CODES,
+               'hours_bitmap', 'dietary_options', *STRING_COLUMNS]
+    with tempfile.TemporaryDirectory(dir=directory) as work_dir:
+        sections = {
+            'id': _SectionWriter(work_dir, 'id', np.int64),
+            'rating': _SectionWriter(work_dir, 'rating', np.float32),
+            'latitude': _SectionWriter(work_dir, 'latitude', np.float64),
+            'longitude': _SectionWriter(work_dir, 'longitude', np.float64),
+            'capacity': _SectionWriter(work_dir, 'capacity', np.int32),
+            'average_dining_time': _SectionWriter(work_dir, 'average_dining_time', np.int32),
+            **{column: _SectionWriter(work_dir, column, np.uint8) for column in CODES},
+            'cuisine_tags': _SectionWriter(work_dir, 'cuisine_tags', np.uint64, max(1, math.ceil(len(cuisines) / 64))),
+            'dietary_tags': _SectionWriter(work_dir, 'dietary_tags', np.uint64, max(1, math.ceil(len(dietary) / 64))),
+            'hours': _SectionWriter(work_dir, 'hours', np.uint8, BITMAP_BYTES),
+            'hours_known': _SectionWriter(work_dir, 'hours_known', np.bool_),
+        }
+        strings = {column: (_SectionWriter(work_dir, f'{column}.offsets', np.uint64),
+                            _SectionWriter(work_dir, f'{column}.data', np.uint8)) for column in STRING_COLUMNS}
+        string_sizes = dict.fromkeys(STRING_COLUMNS, 0)
+        for offsets, _ in strings.values():
+            offsets.append([0])
+
+        rows = Restaurant.objects.order_by('id').values_list(*columns)
+        chunk = []
+
+        def flush(chunk):
+            values = list(zip(*chunk))
+            named = dict(zip(columns, values))
+            sections['id'].append(named['id'])
+            sections['rating'].append([float(v or 0) for v in named['rating']])
+            for column in ('latitude', 'longitude'):
+                sections[column].append([float(v) if v is not None else math.nan for v in named[column]])
+            sections['capacity'].append(named['capacity'])
+            sections['average_dining_time'].append(named['average_dining_time'])
+            for column, table in codes.items():
+                sections[column].append([table.get(v, 0) for v in named[column]])
+            sections['cuisine_tags'].append(_bitset([cuisine_tags(v) for v in named['cuisine_type']], cuisine_index))
+            sections['dietary_tags'].append(_bitset(
+                [[str(t).strip().lower() for t in (v or []) if str(t).strip()] for v in named['dietary_options']],
+                dietary_index))
+            empty = bytes(BITMAP_BYTES)
+            sections['hours'].append(np.frombuffer(
+                b''.join(bytes(v) if v is not None else empty for v in named['hours_bitmap']), dtype=np.uint8
+            ).reshape(len(chunk), BITMAP_BYTES))
+            sections['hours_known'].append([v is not None for v in named['hours_bitmap']])
+            for column in STRING_COLUMNS:
+                offsets, data = strings[column]
+                encoded = [(v or '').encode('utf-8') for v in named[column]]
+                blob = b''.join(encoded)
+                ends = string_sizes[column] + np.cumsum([len(e) for e in encoded], dtype=np.uint64)
+                offsets.append(ends)
+                data.file.write(blob)
+                data.rows += len(blob)
+                string_sizes[column] += len(blob)
+
+        for row in rows.iterator(chunk_size=chunk_size):
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                flush(chunk)
+                chunk = []
+        if chunk:
+            flush(chunk)
+
+        writers = list(sections.values()) + [writer for pair in strings.values() for writer in pair]
+        layout, offset = {}, 0
+        for writer in writers:
+            offset = _align(offset)
+            layout[writer.name] = {**writer.describe(), 'offset': offset}
+            offset += writer.file.tell()
+
+        header = {
+            'version': (previous or {}).get('version', 0) + 1,
+            'created': datetime.now(dt_timezone.utc).isoformat(timespec='seconds'),
+            'source': _state_header(state),
+            'rows': sections['id'].rows,
+            'codes': CODES,
+            'vocabularies': {'cuisine_tags': cuisines, 'dietary_tags': dietary},
+            'strings': list(STRING_COLUMNS),
+            'sections': layout,
+        }
+        encoded_header = json.dumps(header, separators=(',', ':')).encode('utf-8')
+        data_offset = _align(PREFIX.size + len(encoded_header))
+
+        temporary = os.path.join(work_dir, 'snapshot')
+        with open(temporary, 'wb') as out:
+            out.write(PREFIX.pack(MAGIC, FORMAT_VERSION, len(encoded_header), data_offset))
+            out.write(encoded_header)
+            for writer in writers:
+                out.seek(data_offset + layout[writer.name]['offset'])
+                writer.file.seek(0)
+                shutil.copyfileobj(writer.file, out, 1024 * 1024)
+                writer.file.close()
+            out.flush()
+            os.fsync(out.fileno())
+        # Readers see either the old file or the complete new one
+        os.replace(temporary, path)
+    logger.info(f"Published catalog snapshot v{header['version']} with {header['rows']} restaurants to {path}")
+    return header
+
+
+def read_header(path):
+    """The header of the snapshot at path, or None if there is no readable one"""
+    try:
+        with open(path, 'rb') as f:
+            magic, version, length, _ = PREFIX.unpack(f.read(PREFIX.size))
+            if magic != MAGIC or version != FORMAT_VERSION:
+                return None
+            return json.loads(f.read(length))
+    except (OSError, struct.error, ValueError):
+        return None
+
+
+class StringTable:
+    """Strings stored as one UTF-8 blob plus end offsets, decoded on access"""
+
+    def __init__(self, offsets, data):
+        self.offsets = offsets
+        self.data = data
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        return bytes(self.data[int(self.offsets[index]):int(self.offsets[index + 1])]).decode('utf-8')
+
+
+class CatalogSnapshot:
+    """A mapped snapshot file. Arrays are read-only views of the mapping."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, length, data_offset = PREFIX.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a catalog snapshot")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"{path} has snapshot format {version}, expected {FORMAT_VERSION}")
+        self.path = path
+        self.header = json.loads(self._mmap[PREFIX.size:PREFIX.size + length])
+        self._data_offset = data_offset
+        self._arrays = {}
+        self._lock = threading.Lock()
+
+    @property
+    def version(self):
+        return self.header['version']
+
+    @property
+    def rows(self):
+        return self.header['rows']
+
+    def matches(self, state):
+        """Whether the snapshot was taken from this catalog state (see catalog_state)"""
+        return self.header['source'] == _state_header(state)
+
+    def array(self, name):
+        array = self._arrays.get(name)
+        if array is None:
+            section = self.header['sections'][name]
+            count = math.prod(section['shape'])
+            array = np.frombuffer(self._mmap, dtype=np.dtype(section['dtype']), count=count,
+                                  offset=self._data_offset + section['offset']).reshape(section['shape'])
+            with self._lock:
+                array = self._arrays.setdefault(name, array)
+        return array
+
+    def strings(self, column):
+        return StringTable(self.array(f'{column}.offsets'), self.array(f'{column}.data'))
+
+    def positions(self, ids):
+        """Row positions of restaurant ids, -1 where an id is not in the snapshot"""
+        all_ids = self.array('id')
+        ids = np.asarray(ids, dtype=np.int64)
+        positions = np.searchsorted(all_ids, ids)
+        found = positions < len(all_ids)
+        found[found] = all_ids[positions[found]] == ids[found]
+        return np.where(found, positions, -1)
+
+    def tag_mask(self, section, tag):
+        """Rows whose cuisine_tags or dietary_tags bitset has tag"""
+        vocabulary = self.header['vocabularies'][section]
+        tag = tag.strip().lower()
+        if tag not in vocabulary:
+            return np.zeros(self.rows, dtype=bool)
+        index = vocabulary.index(tag)
+        words = self.array(section)[:, index >> 6]
+        return (words >> np.uint64(index & 63)) & np.uint64(1) == 1
+
+    def code(self, column, value):
+        """The stored code of value in a coded column, 0 if it has none"""
+        values = self.header['codes'][column]
+        return values.index(value) + 1 if value in values else 0
+
+
+class SnapshotReader:
+    """
+    The published snapshot, remapped when a new file replaces it. The path
+    is checked at most every check_interval seconds.
+    """
+
+    def __init__(self, path, check_interval=1.0):
+        self.path = str(path)
+        self.check_interval = check_interval
+        self._snapshot = None
+        self._identity = None
+        self._checked = None
+        self._lock = threading.Lock()
+
+    def current(self):
+        """The mapped snapshot, or None when none is published or it cannot be read"""
+        now = time.monotonic()
+        if self._checked is None or now - self._checked >= self.check_interval:
+            self._checked = now
+            self._check()
+        return self._snapshot
+
+    def _check(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self._snapshot, self._identity = None, None
+            return
+        identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if identity == self._identity:
+            return
+        with self._lock:
+            if identity == self._identity:
+                return
+            try:
+                snapshot = CatalogSnapshot(self.path)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Cannot map catalog snapshot {self.path}: {str(e)}")
+                snapshot = None
+            # One assignment: readers hold either the old snapshot or the new one
+            self._snapshot, self._identity = snapshot, identity
+        if snapshot is not None:
+            logger.info(f"Mapped catalog snapshot v{snapshot.version} ({snapshot.rows} restaurants)")
+
+
+_reader = None
+_reader_lock = threading.Lock()
+
+
+def get_snapshot():
+    """The current catalog snapshot of this process, or None"""
+    global _reader
+    if _reader is None:
+        with _reader_lock:
+            if _reader is None:
+                _reader = SnapshotReader(settings.CATALOG_SNAPSHOT_PATH,
+                                         getattr(settings, 'CATALOG_SNAPSHOT_CHECK_INTERVAL', 1.0))
+    return _reader.current()
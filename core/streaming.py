@@ -0,0 +1,214 @@
+import asyncio
+import json
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+
+from . import telemetry
+
+logger = logging.getLogger(__name__)
+
+# Sentinels passed from the producer thread to the response generator
+_END = object()
+
+
+class StreamStats:
+    """Timing for a single streamed response"""
+
+    def __init__(self, name, started=None):
+        self.name = name
+        self.started = started if started is not None else time.perf_counter()
+        self.first_byte_at = None
+        self.finished_at = None
+        self.tokens = 0
+        self.frames = 0
+        self.bytes_sent = 0
+        self.cancelled = False
+
+    @property
+    def ttfb(self):
+        """Seconds until the first content frame was handed to the server"""
+        if self.first_byte_at is None:
+            return None
+        return self.first_byte_at - self.started
+
+    @property
+    def tokens_per_second(self):
+        if self.first_byte_at is None or self.finished_at is None:
+            return 0.0
+        elapsed = self.finished_at - self.first_byte_at
+        return self.tokens / elapsed if elapsed > 0 else float(self.tokens)
+
+    def as_dict(self):
+        return {
+            'name': self.name,
+            'ttfb_ms': round(self.ttfb * 1000, 1) if self.ttfb is not None else None,
+            'tokens': self.tokens,
+            'tokens_per_second': round(self.tokens_per_second, 1),
+            'frames': self.frames,
+            'bytes': self.bytes_sent,
+            'cancelled': self.cancelled,
+        }
+
+
+def sse_frame(text):
+    """Compact delta frame understood by the chat client"""
+    return f"data: {json.dumps({'d': text}, separators=(',', ':'))}\n\n"
+
+
+class SSEStream:
+    """
+    Iterable of SSE frames for a StreamingHttpResponse.
+
+    The upstream token iterator is consumed on a helper thread so the response
+    can coalesce tokens into frames on a time/size window and emit heartbeat
+    comments while the model is idle. If the client goes away the server closes
+    this generator, which sets the cancel flag and calls ``on_cancel`` so the
+    upstream generation is aborted instead of running to completion.
+    """
+
+    def __init__(self, tokens, name='chat', on_cancel=None, on_complete=None,
+                 flush_interval=None, flush_size=None, heartbeat_interval=None, started=None):
+        self.tokens = tokens
+        self.on_cancel = on_cancel
+        self.on_complete = on_complete
+        self.flush_interval = flush_interval if flush_interval is not None else getattr(settings, 'SSE_FLUSH_INTERVAL', 0.05)
+        self.flush_size = flush_size if flush_size is not None else getattr(settings, 'SSE_FLUSH_SIZE', 256)
+        self.heartbeat_interval = heartbeat_interval if heartbeat_interval is not None else getattr(settings, 'SSE_HEARTBEAT_INTERVAL', 15.0)
+        # Pass the request start time so TTFB includes the upstream call setup
+        self.stats = StreamStats(name, started)
+        self._queue = queue.Queue()
+        self._cancelled = threading.Event()
+
+    def _produce(self):
+        try:
+            for token in self.tokens:
+                if self._cancelled.is_set():
+                    break
+                if token:
+                    self._queue.put(token)
+        except Exception as e:
+            if not self._cancelled.is_set():
+                logger.error(f"Error reading upstream stream: {str(e)}")
+        finally:
+            close = getattr(self.tokens, 'close', None)
+            if self._cancelled.is_set() and close:
+                close()
+            self._queue.put(_END)
+
+    def _cancel(self):
+        if self._cancelled.is_set():
+            return
+        self.stats.cancelled = True
+        self._cancelled.set()
+        # Wake the frame loop if it is waiting on the queue
+        self._queue.put(_END)
+        if self.on_cancel:
+            try:
+                self.on_cancel()
+            except Exception as e:
+                logger.warning(f"Error cancelling upstream stream: {str(e)}")
+
+    async def async_frames(self):
+        """
+        The same frames as an async iterator, for ASGI servers: Django would
+        buffer a sync iterator there until it is exhausted. Each frame is
+        awaited on the default executor; a disconnect cancels the upstream.
+        """
+        frames = iter(self)
+        # A step may still be running on the executor when the task is
+        # cancelled; the generator can only be closed once it has returned
+        lock = threading.Lock()
+
+        def step():
+            with lock:
+                return next(frames, _END)
+
+        def close():
+            with lock:
+                frames.close()
+
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                frame = await loop.run_in_executor(None, step)
+                if frame is _END:
+                    return
+                yield frame
+        except (asyncio.CancelledError, GeneratorExit):
+            self._cancel()
+            raise
+        finally:
+            # Closing runs the sync generator's cleanup: stats, metrics and
+            # on_complete. Not awaited, a cancelled task cannot wait for it.
+            loop.run_in_executor(None, close)
+
+    def _emit(self, frame):
+        if self.stats.first_byte_at is None:
+            self.stats.first_byte_at = time.perf_counter()
+        self.stats.frames += 1
+        self.stats.bytes_sent += len(frame)
+        return frame
+
+    def __iter__(self):
+        producer = threading.Thread(target=self._produce, name=f"sse-{self.stats.name}", daemon=True)
+        producer.start()
+
+        buffer = []
+        buffered = 0
+        last_flush = time.perf_counter()
+        last_write = last_flush
+        try:
+            while True:
+                now = time.perf_counter()
+                if buffer:
+                    timeout = max(0.0, self.flush_interval - (now - last_flush))
+                else:
+                    timeout = max(0.0, self.heartbeat_interval - (now - last_write))
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    item = None
+
+                if item is _END:
+                    break
+                if item is not None:
+                    if not buffer:
+                        last_flush = time.perf_counter()
+                    buffer.append(item)
+                    buffered += len(item)
+                    self.stats.tokens += 1
+                    # The first token goes out immediately to keep TTFB low
+                    if self.stats.first_byte_at is not None and buffered < self.flush_size \
+                            and time.perf_counter() - last_flush < self.flush_interval:
+                        continue
+
+                now = time.perf_counter()
+                if buffer:
+                    yield self._emit(sse_frame(''.join(buffer)))
+                    buffer = []
+                    buffered = 0
+                    last_flush = last_write = now
+                elif now - last_write >= self.heartbeat_interval:
+                    # SSE comment line: keeps proxies from timing out idle streams
+                    yield ': ping\n\n'
+                    last_write = now
+
+            if buffer:
+                yield self._emit(sse_frame(''.join(buffer)))
+            yield "data: [DONE]\n\n"
+        except GeneratorExit:
+            # Client disconnected; stop the upstream generation
+            self._cancel()
+            raise
+        finally:
+            self.stats.finished_at = time.perf_counter()
+            logger.info(f"Stream stats: {self.stats.as_dict()}")
+            if self.stats.ttfb is not None:
+                telemetry.stream_ttfb.observe(self.stats.ttfb, endpoint=self.stats.name)
+                telemetry.stream_tokens_per_second.observe(self.stats.tokens_per_second, endpoint=self.stats.name)
+            if self.on_complete:
+                self.on_complete(self.stats)
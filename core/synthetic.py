@@ -0,0 +1,523 @@
+"""
+Synthetic catalogs at benchmark scale, learned from core/Restauarant.csv.
+
+CatalogModel.fit() reads the empirical distributions in the source CSV:
+- cuisine tags, as a first-tag distribution and tag-to-next-tag transitions,
+  so tags co-occur as they do in the source;
+- price bands and dietary tags, both conditional on the first tag;
+- ratings, review counts and cities, plus street and name vocabularies.
+
+CatalogGenerator samples catalogs of any size from the model. It writes
+them in chunks, so memory stays flat at 10M restaurants. The output is one
+CSV file per table in database column order, with ids starting at 1, plus
+a manifest.json. load_catalog() inserts a generated directory with raw
+executemany in large transactions.
+
+The generator also writes queries.jsonl, a Poisson-timed log of search,
+recommendation, availability, nearby and detail API calls. Restaurant
+popularity in the log follows a Zipf law.
+"""
+import csv
+import hashlib
+import json
+import logging
+import math
+from collections import Counter, defaultdict
+from datetime import datetime, time, timedelta
+from datetime import timezone as dt_timezone
+from pathlib import Path
+from urllib.parse import urlencode
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .hours import compile_hours
+from .lazy import lazy_import
+from .services import RestaurantCatalogService
+
+np = lazy_import('numpy')
+
+logger = logging.getLogger(__name__)
+
+SOURCE_CSV = Path(__file__).with_name('Restauarant.csv')
+
+DIETARY_TAGS = {'Vegetarian Friendly': 'vegetarian', 'Vegan Options': 'vegan', 'Gluten Free Options': 'gluten-free'}
+PRICE_BANDS = {'$': ('$',), '$$ - $$$': ('$$', '$$$'), '$$$$': ('$$$$',)}
+# First tags seen fewer times than this use the global price and dietary distributions
+MIN_CONDITIONAL_SUPPORT = 20
+
+HOURS_TEMPLATES = [
+    {'mon-thu': '11:00-22:00', 'fri-sat': '11:00-23:00', 'sunday': '12:00-21:00'},
+    {'daily': '11:30-14:30, 17:00-22:00'},
+    {'tue-sun': '17:00-23:00', 'monday': 'closed'},
+    {'daily': '07:00-15:00'},
+    {'mon-thu': '16:00-00:00', 'fri-sat': '16:00-02:00', 'sunday': '16:00-23:00'},
+]
+HOURS_WEIGHTS = [0.45, 0.2, 0.15, 0.1, 0.1]
+ATMOSPHERES = ['casual', 'family', 'trendy', 'romantic', 'business', 'formal']
+# By price band: cheaper places skew casual and family, expensive ones romantic and formal
+ATMOSPHERE_WEIGHTS = {
+    '$': [0.55, 0.3, 0.1, 0.02, 0.02, 0.01],
+    '$$': [0.4, 0.2, 0.2, 0.1, 0.07, 0.03],
+    '$$$': [0.2, 0.1, 0.25, 0.2, 0.15, 0.1],
+    '$$$$': [0.05, 0.02, 0.15, 0.35, 0.18, 0.25],
+}
+NOISE_LEVELS = ['quiet', 'moderate', 'loud']
+PARTY_SIZES, PARTY_WEIGHTS = [1, 2, 3, 4, 5, 6, 8], [0.05, 0.45, 0.12, 0.22, 0.06, 0.07, 0.03]
+REVIEW_COMMENTS = {
+    1: "Disappointing visit, would not go back.",
+    2: "Below expectations.",
+    3: "Decent food, nothing special.",
+    4: "Very good meal and friendly staff.",
+    5: "Outstanding, one of our favourites.",
+}
+OCCASIONS = ['date', 'business', 'family', 'birthday', 'casual', '']
+# Share of each endpoint in the query log
+QUERY_MIX = {'search': 0.4, 'availability': 0.25, 'recommendations': 0.15, 'detail': 0.12, 'nearby': 0.08}
+
+TABLE_ORDER = ('restaurants', 'users', 'reviews', 'reservations')
+COLUMNS = {
+    'restaurants': ['id', 'name', 'description', 'address', 'cuisine_type', 'price_range', 'rating', 'latitude',
+                    'longitude', 'capacity', 'operating_hours', 'dietary_options', 'atmosphere',
+                    'average_dining_time', 'noise_level', 'created_at', 'updated_at'],
+    'users': ['id', 'password', 'is_superuser', 'username', 'first_name', 'last_name', 'email', 'is_staff',
+              'is_active', 'date_joined'],
+    'reviews': ['id', 'restaurant_id', 'user_id', 'rating', 'comment', 'created_at'],
+    'reservations': ['id', 'restaurant_id', 'user_id', 'party_size', 'reservation_time', 'status',
+                     'special_requests', 'created_at', 'updated_at'],
+}
+
+
+class Categorical:
+    """A discrete distribution over values, sampled as indexes"""
+
+    def __init__(self, counts):
+        self.values = list(counts)
+        total = sum(counts.values())
+        self.probs = [counts[v] / total for v in self.values]
+
+    def sample(self, rng, size):
+        return rng.choice(len(self.values), size=size, p=self.probs)
+
+    def as_dict(self):
+        return dict(zip(map(str, self.values), (round(p, 4) for p in self.probs)))
+
+
+def _city_center(city, state):
+    """Stable pseudo-coordinates for a city, inside the continental US"""
+    digest = hashlib.sha256(f"{city}|{state}".encode()).digest()
+    lat = 25.0 + int.from_bytes(digest[:4], 'big') / 2 ** 32 * 23.0
+    lng = -123.0 + int.from_bytes(digest[4:8], 'big') / 2 ** 32 * 52.0
+    return lat, lng
+
+
+class CatalogModel:
+    """Empirical distributions of the source catalog"""
+
+    @classmethod
+    def fit(cls, path=SOURCE_CSV):
+        model = cls()
+        first_tags, transitions = Counter(), defaultdict(Counter)
+        prices, dietary = defaultdict(Counter), defaultdict(Counter)
+        ratings, cities, streets = Counter(), Counter(), Counter()
+        first_words, last_words = Counter(), Counter()
+        review_counts = []
+        max_tags = 1
+
+        with open(path, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                tags = [t.strip() for t in (row.get('Type') or '').split(',') if t.strip()]
+                cuisines = [t for t in tags if t not in DIETARY_TAGS]
+                if not cuisines:
+                    continue
+                first_tags[cuisines[0]] += 1
+                max_tags = max(max_tags, len(cuisines))
+                for current, following in zip(cuisines, cuisines[1:] + [None]):
+                    transitions[current][following] += 1
+                diets = '|'.join(DIETARY_TAGS[t] for t in tags if t in DIETARY_TAGS)
+                dietary[cuisines[0]][diets] += 1
+                dietary[None][diets] += 1
+
+                band = (row.get('Price_Range') or '').strip()
+                if band in PRICE_BANDS:
+                    prices[cuisines[0]][band] += 1
+                    prices[None][band] += 1
+                bubbles = (row.get('Reviews') or '').split(' of ')[0]
+                try:
+                    ratings[float(bubbles)] += 1
+                except ValueError:
+                    pass
+                count = (row.get('No of Reviews') or '').split(' ')[0].replace(',', '')
+                if count.isdigit():
+                    review_counts.append(int(count))
+
+                location = (row.get('Location') or '').split(',')
+                if len(location) >= 2 and location[1].split():
+                    cities[(location[0].strip(), location[1].split()[0])] += 1
+                street = (row.get('Street Address') or '').split(' ', 1)
+                if len(street) == 2 and street[0][:1].isdigit():
+                    streets[street[1].strip()] += 1
+                words = (row.get('Name') or '').split()
+                if len(words) >= 2:
+                    first_words[words[0]] += 1
+                    last_words[words[-1]] += 1
+
+        model.tags = Categorical(first_tags)
+        model.transitions = {tag: Categorical(following) for tag, following in transitions.items()}
+        model.max_tags = max_tags
+        model.prices = {tag: Categorical(c) for tag, c in prices.items()
+                        if tag is None or sum(c.values()) >= MIN_CONDITIONAL_SUPPORT}
+        model.dietary = {tag: Categorical(c) for tag, c in dietary.items()
+                         if tag is None or sum(c.values()) >= MIN_CONDITIONAL_SUPPORT}
+        model.ratings = Categorical(ratings)
+        model.review_counts = sorted(review_counts)
+        model.cities = Categorical(cities)
+        model.streets = Categorical(streets)
+        model.first_words = Categorical(first_words)
+        model.last_words = Categorical(last_words)
+        model.city_centers = [_city_center(city, state) for city, state in model.cities.values]
+        return model
+
+    def summary(self):
+        return {
+            'tags': len(self.tags.values),
+            'top_first_tags': dict(list(sorted(self.tags.as_dict().items(), key=lambda i: -i[1]))[:10]),
+            'price_bands': self.prices[None].as_dict(),
+            'ratings': self.ratings.as_dict(),
+            'cities': len(self.cities.values),
+            'review_count_median': self.review_counts[len(self.review_counts) // 2] if self.review_counts else 0,
+        }
+
+
+def _db_datetime(moment):
+    """Naive UTC text, as Django stores datetimes in SQLite"""
+    if timezone.is_aware(moment):
+        moment = moment.astimezone(dt_timezone.utc).replace(tzinfo=None)
+    return moment.strftime('%Y-%m-%d %H:%M:%S')
+
+
+class CatalogGenerator:
+    def __init__(self, model, seed=0, chunk_size=100_000, base_date=None):
+        self.model = model
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        self.chunk_size = chunk_size
+        self.base_date = base_date or timezone.localdate()
+        self.now = timezone.now().replace(microsecond=0)
+
+    def _conditional(self, distributions, first):
+        """Sample from distributions[tag of first], falling back to distributions[None]"""
+        out = np.empty(len(first), dtype=object)
+        for tag_index in np.unique(first):
+            mask = first == tag_index
+            dist = distributions.get(self.model.tags.values[tag_index], distributions[None])
+            out[mask] = np.array(dist.values, dtype=object)[dist.sample(self.rng, int(mask.sum()))]
+        return out
+
+    def _tags(self, size):
+        """(first tag index, cuisine_type strings) following the learned tag transitions"""
+        model = self.model
+        first = model.tags.sample(self.rng, size)
+        current = np.array(model.tags.values, dtype=object)[first]
+        chains = [[tag] for tag in current]
+        alive = np.ones(size, dtype=bool)
+        for _ in range(model.max_tags - 1):
+            following = np.full(size, None, dtype=object)
+            # Sorted: set order follows string hashing, which changes per process
+            for tag in sorted(set(current[alive])):
+                mask = alive & (current == tag)
+                dist = model.transitions.get(tag)
+                if dist is None:
+                    continue
+                following[mask] = np.array(dist.values, dtype=object)[dist.sample(self.rng, int(mask.sum()))]
+            alive &= following != None  # noqa: E711
+            for row in np.flatnonzero(alive):
+                if following[row] in chains[row]:
+                    alive[row] = False
+                else:
+                    chains[row].append(following[row])
+            current = following
+        return first, [', '.join(chain) for chain in chains]
+
+    def _restaurants(self, start, size):
+        rng, model = self.rng, self.model
+        first, cuisine_types = self._tags(size)
+        bands = self._conditional(model.prices, first)
+        prices = np.empty(size, dtype=object)
+        for band, choices in PRICE_BANDS.items():
+            # A "$$ - $$$" band becomes either end of the band
+            mask = bands == band
+            prices[mask] = np.array(choices, dtype=object)[rng.integers(len(choices), size=int(mask.sum()))]
+        atmospheres = np.empty(size, dtype=object)
+        for price, weights in ATMOSPHERE_WEIGHTS.items():
+            mask = prices == price
+            atmospheres[mask] = np.array(ATMOSPHERES, dtype=object)[
+                rng.choice(len(ATMOSPHERES), size=int(mask.sum()), p=weights)]
+        diets = self._conditional(model.dietary, first)
+        ratings = np.array(model.ratings.values)[model.ratings.sample(rng, size)]
+        ratings = np.clip(ratings + rng.normal(0, 0.15, size), 1, 5).round(1)
+        cities = model.cities.sample(rng, size)
+        centers = np.array(model.city_centers)[cities]
+        coords = centers + rng.normal(0, 0.03, (size, 2))
+        streets = np.array(model.streets.values, dtype=object)[model.streets.sample(rng, size)]
+        numbers = rng.integers(1, 9999, size)
+        first_words = np.array(model.first_words.values, dtype=object)[model.first_words.sample(rng, size)]
+        last_words = np.array(model.last_words.values, dtype=object)[model.last_words.sample(rng, size)]
+        hours = rng.choice(len(HOURS_TEMPLATES), size=size, p=HOURS_WEIGHTS)
+        hours_json = [json.dumps(template) for template in HOURS_TEMPLATES]
+        capacity = np.clip(rng.lognormal(math.log(60), 0.5, size), 12, 400).astype(int)
+        dining = rng.choice([45, 60, 75, 90, 120], size=size, p=[0.1, 0.3, 0.2, 0.3, 0.1])
+        noise = rng.choice(len(NOISE_LEVELS), size=size, p=[0.25, 0.55, 0.2])
+        created = _db_datetime(self.now)
+
+        ids = np.arange(start, start + size)
+        city_names = model.cities.values
+        rows = []
+        for i in range(size):
+            city, state = city_names[cities[i]]
+            rows.append((
+                int(ids[i]), f"{first_words[i]} {last_words[i]}", '',
+                f"{numbers[i]} {streets[i]}, {city}, {state}", cuisine_types[i], prices[i], f"{ratings[i]:.1f}",
+                f"{coords[i, 0]:.6f}", f"{coords[i, 1]:.6f}", int(capacity[i]), hours_json[hours[i]],
+                json.dumps(diets[i].split('|') if diets[i] else []), atmospheres[i], int(dining[i]),
+                NOISE_LEVELS[noise[i]], created, created,
+            ))
+        return rows, ratings
+
+    def generate(self, out_dir, restaurants, users=None, review_rate=0.02, reservations_per_restaurant=2.0,
+                 queries=10_000, qps=50.0):
+        """Write the CSV tables, query log and manifest to out_dir; returns the manifest"""
+        out_dir = Path(out_dir)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        users = users or max(1, restaurants // 10)
+        counts = dict.fromkeys(TABLE_ORDER, 0)
+        files = {table: open(out_dir / f"{table}.csv", 'w', newline='', encoding='utf-8') for table in TABLE_ORDER}
+        try:
+            writers = {table: csv.writer(f) for table, f in files.items()}
+            for table, writer in writers.items():
+                writer.writerow(COLUMNS[table])
+
+            self._users(writers['users'], users)
+            counts['users'] = users
+            for start in range(1, restaurants + 1, self.chunk_size):
+                size = min(self.chunk_size, restaurants + 1 - start)
+                rows, ratings = self._restaurants(start, size)
+                writers['restaurants'].writerows(rows)
+                counts['restaurants'] += size
+                counts['reviews'] += self._reviews(writers['reviews'], start, ratings, users, review_rate,
+                                                   counts['reviews'])
+                counts['reservations'] += self._reservations(writers['reservations'], start, size, users,
+                                                             reservations_per_restaurant, counts['reservations'])
+                logger.info(f"Generated {counts['restaurants']}/{restaurants} restaurants")
+        finally:
+            for f in files.values():
+                f.close()
+
+        counts['queries'] = self._query_log(out_dir / 'queries.jsonl', restaurants, queries, qps)
+        manifest = {
+            'seed': self.seed,
+            'base_date': self.base_date.isoformat(),
+            'counts': counts,
+            'columns': COLUMNS,
+            'source': self.model.summary(),
+        }
+        with open(out_dir / 'manifest.json', 'w') as f:
+            json.dump(manifest, f, indent=2)
+        return manifest
+
+    def _users(self, writer, users):
+        joined = _db_datetime(self.now)
+        for start in range(1, users + 1, self.chunk_size):
+            writer.writerows(
+                (i, '!', 0, f"synthetic{i}", '', '', f"synthetic{i}@example.com", 0, 1, joined)
+                for i in range(start, min(users + 1, start + self.chunk_size))
+            )
+
+    def _reviews(self, writer, start, ratings, users, review_rate, written):
+        """Reviews by distinct users per restaurant, scaled down from the source review counts"""
+        rng = self.rng
+        sampled = np.array(self.model.review_counts)[rng.integers(len(self.model.review_counts), size=len(ratings))]
+        counts = np.minimum(rng.poisson(sampled * review_rate), users)
+        total = int(counts.sum())
+        if not total:
+            return 0
+        restaurant = np.repeat(np.arange(start, start + len(ratings)), counts)
+        offset = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        # Consecutive users from a random start are distinct within a restaurant
+        user = (np.repeat(rng.integers(users, size=len(ratings)), counts) + offset) % users + 1
+        stars = np.clip(np.rint(np.repeat(ratings, counts) + rng.normal(0, 0.8, total)), 1, 5).astype(int)
+        age = rng.integers(0, 730 * 24 * 60, total)
+        writer.writerows(
+            (written + i + 1, int(restaurant[i]), int(user[i]), int(stars[i]), REVIEW_COMMENTS[stars[i]],
+             _db_datetime(self.now - timedelta(minutes=int(age[i]))))
+            for i in range(total)
+        )
+        return total
+
+    def _reservations(self, writer, start, size, users, rate, written):
+        """Bookings from 60 days back to 30 days ahead, on the quarter hour between 11:00 and 21:45"""
+        rng = self.rng
+        counts = rng.poisson(rate, size)
+        total = int(counts.sum())
+        if not total:
+            return 0
+        restaurant = np.repeat(np.arange(start, start + size), counts)
+        days = rng.integers(-60, 31, total)
+        slots = rng.integers(44, 88, total)
+        party = np.array(PARTY_SIZES)[rng.choice(len(PARTY_SIZES), size=total, p=PARTY_WEIGHTS)]
+        user = rng.integers(1, users + 1, total)
+        lead_days = rng.integers(1, 30, total)
+        past_status = np.where(rng.random(total) < 0.85, 'completed', 'cancelled')
+        future_roll = rng.random(total)
+        future_status = np.where(future_roll < 0.7, 'confirmed', np.where(future_roll < 0.9, 'pending', 'cancelled'))
+        status = np.where(days < 0, past_status, future_status)
+
+        # One UTC offset per day is enough for quarter-hour times away from DST switches
+        offsets = {}
+        rows = []
+        for i in range(total):
+            day = int(days[i])
+            if day not in offsets:
+                local = timezone.make_aware(datetime.combine(self.base_date + timedelta(days=day), time(12)))
+                offsets[day] = local.utcoffset()
+            moment = (datetime.combine(self.base_date + timedelta(days=day), time())
+                      + timedelta(minutes=int(slots[i]) * 15) - offsets[day])
+            booked = _db_datetime(moment - timedelta(days=int(lead_days[i])))
+            rows.append((written + i + 1, int(restaurant[i]), int(user[i]), int(party[i]),
+                         _db_datetime(moment), status[i], '', booked, booked))
+        writer.writerows(rows)
+        return total
+
+    def _popular_restaurant(self, restaurants, size):
+        """Zipf-distributed restaurant ids, with popularity ranks scattered over the id range"""
+        ranks = np.minimum(self.rng.zipf(1.2, size), restaurants) - 1
+        return (ranks * 2654435761 % restaurants) + 1
+
+    def _query_log(self, path, restaurants, queries, qps):
+        rng, model = self.rng, self.model
+        endpoints = list(QUERY_MIX)
+        kinds = rng.choice(len(endpoints), size=queries, p=list(QUERY_MIX.values()))
+        arrivals = np.cumsum(rng.exponential(1 / qps, queries))
+        tags = np.array(model.tags.values, dtype=object)[model.tags.sample(rng, queries)]
+        cities = model.cities.sample(rng, queries)
+        popular = self._popular_restaurant(restaurants, queries)
+        coin = rng.random((queries, 4))
+
+        with open(path, 'w') as f:
+            for i in range(queries):
+                kind = endpoints[kinds[i]]
+                city, _ = model.cities.values[cities[i]]
+                if kind == 'search':
+                    params = {'cuisine': tags[i].lower()}
+                    if coin[i, 0] < 0.5:
+                        params['location'] = city
+                    if coin[i, 1] < 0.3:
+                        params['price'] = '$' * int(rng.integers(1, 5))
+                    if coin[i, 2] < 0.2:
+                        params['rating_min'] = '4'
+                    route = '/api/restaurants/search/'
+                elif kind == 'recommendations':
+                    params = {'occasion': OCCASIONS[int(coin[i, 0] * len(OCCASIONS))], 'cuisine[]': tags[i].lower()}
+                    if coin[i, 1] < 0.4:
+                        params['location'] = city
+                    route = '/api/recommendations/'
+                elif kind == 'availability':
+                    day = self.base_date + timedelta(days=int(coin[i, 0] * 14))
+                    minute = 17 * 60 + int(coin[i, 1] * 19) * 15
+                    params = {'restaurant_id': int(popular[i]), 'date': day.isoformat(),
+                              'time': f"{minute // 60:02d}:{minute % 60:02d}",
+                              'party_size': PARTY_SIZES[int(coin[i, 2] * 5)]}
+                    route = '/api/reservations/check-availability/'
+                elif kind == 'nearby':
+                    lat, lng = model.city_centers[cities[i]]
+                    params = {'lat': f"{lat:.4f}", 'lng': f"{lng:.4f}", 'radius': 5}
+                    route = '/api/restaurants/nearby/'
+                else:
+                    params, route = {}, f"/api/restaurants/{int(popular[i])}/"
+                query = f"?{urlencode(params)}" if params else ''
+                f.write(json.dumps({'at': round(float(arrivals[i]), 4), 'endpoint': kind, 'path': route + query}) + '\n')
+        return queries
+
+
+def read_query_log(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+TABLES = {
+    'restaurants': 'core_restaurant',
+    'users': 'auth_user',
+    'reviews': 'core_review',
+    'reservations': 'core_reservation',
+}
+FOREIGN_KEYS = {'restaurant_id': 'restaurants', 'user_id': 'users'}
+
+
+def load_catalog(directory, append=False, batch_size=50_000):
+    """
+    Insert a generated catalog. Into empty tables ids are kept, so the query
+    log matches; with append=True ids are shifted past the existing rows.
+    Returns {table: rows inserted}.
+    """
+    directory = Path(directory)
+    with open(directory / 'manifest.json') as f:
+        manifest = json.load(f)
+    offsets = {}
+    with connection.cursor() as cursor:
+        for table, db_table in TABLES.items():
+            cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {connection.ops.quote_name(db_table)}")
+            offsets[table] = cursor.fetchone()[0]
+    if not append and any(offsets.values()):
+        raise ValueError("Tables already have rows; load with append=True to shift ids past them")
+
+    bitmaps = {}
+    loaded = {}
+    for table in TABLE_ORDER:
+        columns = manifest['columns'][table]
+        extra = ['hours_bitmap'] if table == 'restaurants' else []
+        if table == 'reservations':
+            extra = ['idempotency_key']
+        names = ', '.join(connection.ops.quote_name(c) for c in columns + extra)
+        placeholders = ', '.join(['%s'] * (len(columns) + len(extra)))
+        sql = f"INSERT INTO {connection.ops.quote_name(TABLES[table])} ({names}) VALUES ({placeholders})"
+        shifts = [offsets[FOREIGN_KEYS[c]] if c in FOREIGN_KEYS else offsets[table] if c == 'id' else None
+                  for c in columns]
+        username = columns.index('username') if 'username' in columns else None
+
+        def rows():
+            with open(directory / f"{table}.csv", newline='', encoding='utf-8') as f:
+                reader = csv.reader(f)
+                next(reader)
+                for row in reader:
+                    values = [int(v) + shift if shift is not None else v for v, shift in zip(row, shifts)]
+                    if username is not None and offsets['users']:
+                        values[username] = f"{values[username]}-{offsets['users']}"
+                    if table == 'restaurants':
+                        hours = row[columns.index('operating_hours')]
+                        if hours not in bitmaps:
+                            bitmaps[hours] = compile_hours(json.loads(hours))
+                        values.append(bitmaps[hours])
+                    elif table == 'reservations':
+                        values.append(None)
+                    yield values
+
+        count = 0
+        batch = []
+        for values in rows():
+            batch.append(values)
+            if len(batch) >= batch_size:
+                count += _insert(sql, batch)
+                batch = []
+        if batch:
+            count += _insert(sql, batch)
+        loaded[table] = count
+        logger.info(f"Loaded {count} {table}")
+    # Raw inserts send no signals, so drop cached catalog results here
+    RestaurantCatalogService.invalidate_cache()
+    return loaded
+
+
+def _insert(sql, batch):
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.executemany(sql, batch)
+    return len(batch)
@@ -1,3 +1,1520 @@
-from django.test import TestCase
+import asyncio
+import contextvars
+import gzip
+import json
+import multiprocessing
+import os
+import queue
+import runpy
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+import unittest.mock
+from datetime import timedelta
+from types import SimpleNamespace
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from . import availability, fallback, hours, profiling, snapshot, utils
+from .admission import AdmissionController, LLMOverloaded
+from .batch_enrichment import BatchEnrichmentPipeline, LocalBatchExecutor
+from .circuit import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpen
+
+from .context import build_restaurant_context, estimate_tokens, row_cache
+from .enrichment import EnrichmentQueue, job_key
+from .httpcache import choose_coding
+from .hours import MINUTES_PER_DAY, bitmap_bits, compile_hours, hours_index, is_open_at
+from .llm import achat_completion, chat_completion
+from .management.commands.loadtest_chat import percentile
+from .mock_llm import MockLLMConfig, MockLLMServer
+from .models import ArchivedReservation, Restaurant, EnrichmentJob, Reservation, Review, SlotOccupancy
+from .services import ReservationHistoryService, ReservationService, RestaurantCatalogService
+from .sharedcache import SQLiteCache
+from .singleflight import SingleFlight, StreamFlights
+from .streaming import SSEStream, sse_frame
+from .synthetic import CatalogGenerator, CatalogModel, load_catalog, read_query_log
+from .telemetry import MetricsRegistry
+from .utils import RestaurantAI
+from .warmup import STEPS, warm
+
+request_label = contextvars.ContextVar('request_label', default=None)
+
+
+# Tests must not read or wipe the shared cache file in BASE_DIR: the whole
+# module runs against a throwaway cache of the same backend
+_test_cache_dir = None
+_test_caches = None
+
+
+def setUpModule():
+    global _test_cache_dir, _test_caches
+    _test_cache_dir = tempfile.mkdtemp()
+    _test_caches = override_settings(CACHES={'default': {
+        'BACKEND': 'core.sharedcache.SQLiteCache',
+        'LOCATION': os.path.join(_test_cache_dir, 'cache.sqlite3'),
+    }})
+    _test_caches.enable()
+
+
+def tearDownModule():
+    _test_caches.disable()
+    shutil.rmtree(_test_cache_dir, ignore_errors=True)
+
+
+def fake_generator(search_args):
+    """Local stand-in for the LLM used by the enrichment queue"""
+    cuisine = search_args.get('cuisine_type', 'Fusion')
+    return [
+        {'name': 'Casa Verde', 'address': '1 Main St', 'cuisine_type': cuisine, 'rating': 4.2},
+        {'name': 'casa verde!', 'address': '1 main st.', 'cuisine_type': cuisine},
+        {'name': 'Blue Door', 'address': '2 Side St', 'cuisine_type': cuisine, 'price_range': '$$$'},
+    ]
+
+
+def completion(content=None, tool_calls=None):
+    """Non-streaming chat completion shaped like the OpenAI SDK's"""
+    message = SimpleNamespace(content=content, tool_calls=tool_calls)
+    return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+def tool_call(call_id, name, **arguments):
+    return SimpleNamespace(id=call_id, function=SimpleNamespace(name=name, arguments=json.dumps(arguments)))
+
+
+class ScriptedClient:
+    """OpenAI client stand-in that answers chat completions from a script"""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = []
+        self.base_url = 'http://scripted.test'
+        self.chat = SimpleNamespace(completions=self)
+
+    def create(self, **kwargs):
+        self.calls.append(kwargs)
+        return self.responses.pop(0)
+
+
+class ToolLoopTests(TestCase):
+    def make_ai(self, client):
+        ai = RestaurantAI.__new__(RestaurantAI)
+        ai.client, ai.model, ai.conversation_history, ai.tool_latencies = client, 'test-model', [], []
+        return ai
+
+    def test_tool_calls_run_concurrently_in_the_request_context(self):
+        barrier = threading.Barrier(2, timeout=2)
+        seen = []
+
+        def search(args):
+            # Both calls must be running at once to get past the barrier
+            barrier.wait()
+            if args['location'] == 'first':
+                time.sleep(0.05)
+            seen.append(request_label.get())
+            return f"results for {args['location']}"
+
+        client = ScriptedClient(
+            completion(tool_calls=[tool_call('call_a', 'search_restaurants', location='first'),
+                                   tool_call('call_b', 'search_restaurants', location='second')]),
+            completion(content='Here you go'),
+        )
+        ai = self.make_ai(client)
+        ai._handle_restaurant_search = search
+        token = request_label.set('chat')
+        try:
+            answer = ai.process_user_input('pasta please')
+        finally:
+            request_label.reset(token)
+
+        self.assertEqual(answer, 'Here you go')
+        self.assertEqual(seen, ['chat', 'chat'])
+        # Answers go back in the order the model asked, not the order they finished
+        tool_messages = [m for m in client.calls[1]['messages'] if m['role'] == 'tool']
+        self.assertEqual([(m['tool_call_id'], m['content']) for m in tool_messages],
+                         [('call_a', 'results for first'), ('call_b', 'results for second')])
+        self.assertEqual([name for name, _ in ai.tool_latencies], ['search_restaurants'] * 2)
+        self.assertGreaterEqual(ai.tool_latencies[0][1], 0.05)
+
+    def test_round_limit_forces_a_final_answer_without_tools(self):
+        client = ScriptedClient(
+            completion(tool_calls=[tool_call('call_1', 'search_restaurants', location='a')]),
+            completion(tool_calls=[tool_call('call_2', 'search_restaurants', location='b')]),
+            completion(content='Best I can do'),
+        )
+        ai = self.make_ai(client)
+        ai._handle_restaurant_search = lambda args: 'nothing found'
+        with self.settings(TOOL_CALL_MAX_ROUNDS=2):
+            self.assertEqual(ai.process_user_input('anything'), 'Best I can do')
+        self.assertEqual([call['tool_choice'] for call in client.calls], ['auto', 'auto', 'none'])
+        self.assertEqual(len(ai.tool_latencies), 2)
+
+
+class EnrichmentQueueTests(TestCase):
+    def setUp(self):
+        self.queue = EnrichmentQueue(generator=fake_generator, num_workers=0)
+
+    def test_repeat_queries_share_one_job(self):
+        args = {'cuisine_type': 'Peruvian', 'location': 'Austin'}
+        first = self.queue.enqueue(args)
+        second = self.queue.enqueue({'cuisine_type': ' peruvian', 'location': 'AUSTIN'})
+        self.assertEqual(first.id, second.id)
+        self.assertEqual(EnrichmentJob.objects.count(), 1)
+
+    def test_job_bulk_creates_deduplicated_restaurants(self):
+        Restaurant.objects.create(name='Blue Door', address='2 Side St.', cuisine_type='Peruvian', price_range='$$')
+        job = self.queue.enqueue({'cuisine_type': 'Peruvian', 'location': 'Austin'})
+
+        self.assertEqual(self.queue.run_pending(), 1)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'done')
+        self.assertEqual(job.created_count, 1)
+        self.assertEqual(Restaurant.objects.filter(name__iexact='casa verde').count(), 1)
+        self.assertEqual(Restaurant.objects.filter(name='Blue Door').count(), 1)
+
+    def test_failed_generation_is_retried_then_marked_failed(self):
+        def broken(search_args):
+            raise RuntimeError("upstream unavailable")
+
+        queue = EnrichmentQueue(generator=broken, num_workers=0)
+        job = queue.enqueue({'cuisine_type': 'Thai'})
+        with self.settings(ENRICHMENT_MAX_ATTEMPTS=2):
+            queue.run_pending()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(job.attempts, 2)
+        self.assertEqual(job.key, job_key({'cuisine_type': 'Thai'}))
+
+    def test_jobs_left_running_by_a_dead_worker_are_claimed_again(self):
+        job = self.queue.enqueue({'cuisine_type': 'Peruvian'})
+        self.assertEqual(self.queue.claim_next_job().id, job.id)
+        # The worker dies here; its job keeps counting as queued until the lease runs out
+        self.assertIsNone(self.queue.claim_next_job())
+        self.assertEqual(self.queue.enqueue({'cuisine_type': 'peruvian'}).id, job.id)
+
+        EnrichmentJob.objects.filter(id=job.id).update(started_at=timezone.now() - timedelta(minutes=10))
+        self.assertEqual(self.queue.run_pending(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('done', 2))
+
+    def test_lost_job_without_attempts_left_is_failed(self):
+        job = self.queue.enqueue({'cuisine_type': 'Peruvian'})
+        with self.settings(ENRICHMENT_MAX_ATTEMPTS=1):
+            self.queue.claim_next_job()
+            EnrichmentJob.objects.filter(id=job.id).update(started_at=timezone.now() - timedelta(minutes=10))
+            self.assertIsNone(self.queue.claim_next_job())
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertNotEqual(self.queue.enqueue({'cuisine_type': 'Peruvian'}).id, job.id)
+
+    def test_racing_enqueues_share_one_job(self):
+        args = {'cuisine_type': 'Peruvian'}
+        existing = EnrichmentJob.objects.create(key=job_key(args), search_args=args)
+        # Another request inserts its job between this one's lookup and insert
+        with unittest.mock.patch('django.db.models.query.QuerySet.first', side_effect=[None, existing]):
+            self.assertEqual(self.queue.enqueue(args).id, existing.id)
+        self.assertEqual(EnrichmentJob.objects.count(), 1)
+
+    def test_default_generator_calls_the_shared_client(self):
+        restaurants = {'restaurants': fake_generator({'cuisine_type': 'Ethiopian'})}
+        client = ScriptedClient(completion(content=json.dumps(restaurants)))
+        previous, utils._client = utils._client, client
+        self.addCleanup(setattr, utils, '_client', previous)
+
+        queue = EnrichmentQueue(num_workers=0)
+        job = queue.enqueue({'cuisine_type': 'Ethiopian', 'location': 'Denver'})
+        with self.settings(LLM_ADMISSION_ENABLED=False, LLM_CIRCUIT_ENABLED=False, LLM_RESPONSE_CACHE_SECONDS=0):
+            queue.run_pending()
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.created_count), ('done', 2))
+        self.assertEqual(client.calls[0]['response_format'], {'type': 'json_object'})
+        self.assertIn('Ethiopian cuisine in Denver', client.calls[0]['messages'][1]['content'])
+
+
+class SSEStreamTests(SimpleTestCase):
+    def test_first_token_goes_out_alone_and_the_rest_are_coalesced(self):
+        stream = SSEStream(iter(['Hel', 'lo', ' wor', 'ld']), flush_interval=0.5, heartbeat_interval=10)
+        self.assertEqual(list(stream), [sse_frame('Hel'), sse_frame('lo world'), 'data: [DONE]\n\n'])
+        self.assertEqual((stream.stats.tokens, stream.stats.frames), (4, 2))
+
+        sized = SSEStream(iter(['ab', 'cd', 'ef', 'gh']), flush_interval=0.5, flush_size=4, heartbeat_interval=10)
+        self.assertEqual(list(sized)[:-1], [sse_frame('ab'), sse_frame('cdef'), sse_frame('gh')])
+
+    def test_idle_streams_send_heartbeats(self):
+        def slow():
+            time.sleep(0.2)
+            yield 'late'
+
+        frames = list(SSEStream(slow(), heartbeat_interval=0.05))
+        self.assertIn(': ping\n\n', frames[:-2])
+        self.assertEqual(frames[-2:], [sse_frame('late'), 'data: [DONE]\n\n'])
+
+    def test_disconnect_cancels_upstream_and_records_stats(self):
+        released, completed = threading.Event(), threading.Event()
+
+        def stalled():
+            yield 'hello'
+            # The upstream stalls until it is cancelled
+            released.wait(2)
+            yield 'never sent'
+
+        stream = SSEStream(stalled(), on_cancel=released.set, on_complete=lambda stats: completed.set(),
+                           heartbeat_interval=10)
+        frames = iter(stream)
+        self.assertEqual(next(frames), sse_frame('hello'))
+        frames.close()
+        self.assertTrue(released.is_set() and completed.is_set())
+        self.assertTrue(stream.stats.cancelled)
+
+    def test_async_disconnect_closes_the_sync_stream(self):
+        released, completed = threading.Event(), threading.Event()
+
+        def stalled():
+            yield 'hello'
+            released.wait(2)
+            yield 'never sent'
+
+        stream = SSEStream(stalled(), on_cancel=released.set, on_complete=lambda stats: completed.set(),
+                           heartbeat_interval=10)
+
+        async def disconnect():
+            first = asyncio.Event()
+            received = []
+
+            async def consume():
+                async for frame in stream.async_frames():
+                    received.append(frame)
+                    first.set()
+
+            task = asyncio.create_task(consume())
+            await first.wait()
+            # What the ASGI handler does when the client goes away
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            return received
+
+        self.assertEqual(asyncio.run(disconnect()), [sse_frame('hello')])
+        self.assertTrue(completed.wait(2))
+        self.assertTrue(released.is_set() and stream.stats.cancelled)
+
+
+class TelemetryTests(TestCase):
+    def test_histogram_buckets_are_cumulative_with_inclusive_bounds(self):
+        histogram = MetricsRegistry().histogram('wait_seconds', "Wait", ('endpoint',), buckets=(1.0, 0.1))
+        for value in (0.05, 0.1, 0.5, 5):
+            histogram.observe(value, endpoint='chat')
+        self.assertEqual(list(histogram.samples()), [
+            'wait_seconds_bucket{endpoint="chat",le="0.1"} 2',
+            'wait_seconds_bucket{endpoint="chat",le="1"} 3',
+            'wait_seconds_bucket{endpoint="chat",le="+Inf"} 4',
+            'wait_seconds_sum{endpoint="chat"} 5.65',
+            'wait_seconds_count{endpoint="chat"} 4',
+        ])
+        self.assertEqual(histogram.count(endpoint='chat'), 4)
+
+    def test_text_format_escapes_label_values(self):
+        registry = MetricsRegistry()
+        registry.counter('calls_total', "Calls", ('caller',)).inc(2, caller='a"b\\c\nd')
+        registry.gauge('queue_depth', "Queued").set(1.5)
+        self.assertEqual(registry.render(), (
+            '# HELP calls_total Calls\n'
+            '# TYPE calls_total counter\n'
+            'calls_total{caller="a\\"b\\\\c\\nd"} 2\n'
+            '# HELP queue_depth Queued\n'
+            '# TYPE queue_depth gauge\n'
+            'queue_depth 1.5\n'
+        ))
+
+    def test_metrics_endpoint_is_for_staff_and_scrapers_only(self):
+        self.assertEqual(self.client.get('/metrics/', HTTP_HOST='localhost').status_code, 403)
+        with self.settings(METRICS_TOKEN='scrape-me'):
+            response = self.client.get('/metrics/', HTTP_HOST='localhost', HTTP_AUTHORIZATION='Bearer wrong')
+            self.assertEqual(response.status_code, 403)
+        with self.settings(METRICS_TOKEN=''):
+            response = self.client.get('/metrics/', HTTP_HOST='localhost', HTTP_AUTHORIZATION='Bearer ')
+            self.assertEqual(response.status_code, 403)
+        self.client.force_login(User.objects.create_user('ops', is_staff=True))
+        self.assertEqual(self.client.get('/metrics/', HTTP_HOST='localhost').status_code, 200)
+
+    def test_metrics_endpoint_exposes_llm_calls(self):
+        client = ScriptedClient(completion(content='ok'))
+        chat_completion(client, caller='metrics-test', model='m', messages=[])
+        with self.settings(METRICS_TOKEN='scrape-me'):
+            response = self.client.get('/metrics/', HTTP_HOST='localhost', HTTP_AUTHORIZATION='Bearer scrape-me')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        body = response.content.decode()
+        self.assertIn('# TYPE llm_requests_total counter', body)
+        self.assertIn('llm_requests_total{model="m",endpoint="background",caller="metrics-test",'
+                      'status="ok",cache="miss"} ', body)
+        self.assertIn('llm_request_duration_seconds_count{model="m",endpoint="background",'
+                      'caller="metrics-test"} ', body)
+
+
+class GatedUpstream:
+    """Upstream stream that yields what the test puts in its queue; None ends it"""
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.closed = threading.Event()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        item = self.queue.get(timeout=2)
+        if item is None:
+            raise StopIteration
+        return item
+
+    def close(self):
+        self.closed.set()
+
+
+class SingleFlightTests(SimpleTestCase):
+    def test_concurrent_identical_calls_share_one_result_or_error(self):
+        flights, release, calls = SingleFlight(), threading.Event(), []
+
+        def slow():
+            calls.append(1)
+            release.wait(2)
+            if len(calls) > 1:
+                raise RuntimeError("called twice")
+            return 'answer'
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(flights.do('k', slow))) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.05)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(results), [('answer', False)] + [('answer', True)] * 3)
+        self.assertEqual(flights.inflight(), 0)
+
+        def broken():
+            raise ValueError("upstream said no")
+
+        with self.assertRaises(ValueError):
+            flights.do('k', broken)
+        self.assertEqual(flights.inflight(), 0)
+
+    def test_late_joiner_replays_the_buffer_then_follows_the_stream(self):
+        flights, upstream = StreamFlights(), GatedUpstream()
+        first, shared = flights.subscribe('k', lambda: upstream)
+        self.assertFalse(shared)
+        leader = iter(first)
+        upstream.queue.put('t0')
+        upstream.queue.put('t1')
+        self.assertEqual([next(leader), next(leader)], ['t0', 't1'])
+
+        late, shared = flights.subscribe('k', lambda: self.fail("joiner opened an upstream"))
+        self.assertTrue(shared)
+        upstream.queue.put('t2')
+        upstream.queue.put(None)
+        self.assertEqual(list(late), ['t0', 't1', 't2'])
+        self.assertEqual(list(leader), ['t2'])
+        self.assertFalse(upstream.closed.is_set())
+
+    def test_abandoned_stream_is_closed_and_not_joined(self):
+        flights, upstream = StreamFlights(), GatedUpstream()
+        first, _ = flights.subscribe('k', lambda: upstream)
+        upstream.queue.put('t0')
+        stream = iter(first)
+        self.assertEqual(next(stream), 't0')
+        # The user disconnects and sends the same message again while the
+        # old pump is still blocked on the upstream
+        stream.close()
+        self.assertTrue(upstream.closed.is_set())
+
+        retry = GatedUpstream()
+        again, shared = flights.subscribe('k', lambda: retry)
+        self.assertFalse(shared)
+        for item in ('t0', 't1', None):
+            retry.queue.put(item)
+        self.assertEqual(list(again), ['t0', 't1'])
+        upstream.queue.put(None)
+
+    def test_async_callers_join_calls_led_by_threads(self):
+        release, started = threading.Event(), threading.Event()
+
+        class SlowClient(ScriptedClient):
+            def create(self, **kwargs):
+                started.set()
+                release.wait(2)
+                return super().create(**kwargs)
+
+        client = SlowClient(completion(content='shared'))
+        kwargs = {'model': 'm', 'messages': [{'role': 'user', 'content': 'coalesce me'}]}
+        results = []
+
+        async def join():
+            task = asyncio.create_task(achat_completion(client, caller='test', **kwargs))
+            await asyncio.sleep(0.05)
+            release.set()
+            return await task
+
+        leader = threading.Thread(target=lambda: results.append(chat_completion(client, caller='test', **kwargs)))
+        leader.start()
+        self.assertTrue(started.wait(2))
+        results.append(asyncio.run(join()))
+        leader.join()
+        self.assertEqual(len(client.calls), 1)
+        self.assertIs(results[0], results[1])
+
+
+class RestaurantContextTests(TestCase):
+    def setUp(self):
+        Restaurant.objects.bulk_create([
+            Restaurant(name=f'Place {i}', address=f'{i} Long Street, Springfield', cuisine_type='American',
+                       price_range='$$', rating=3.0)
+            for i in range(300)
+        ])
+        Restaurant.objects.create(name='Trattoria Roma', address='9 Via Roma, Springfield',
+                                  cuisine_type='Italian', price_range='$$', rating=4.0)
+
+    def test_context_stays_within_budget(self):
+        text, included = build_restaurant_context(Restaurant.objects.order_by('id'), token_budget=200)
+        self.assertGreater(included, 0)
+        self.assertLess(included, 300)
+        self.assertLessEqual(estimate_tokens(text), 200)
+
+    def test_matching_restaurants_are_packed_first(self):
+        text, _ = build_restaurant_context(Restaurant.objects.order_by('id'), {'cuisine': 'italian'},
+                                           token_budget=60, max_candidates=400)
+        self.assertIn('Trattoria Roma', text.splitlines()[1])
+
+
+class MockLLMServerTests(TestCase):
+    databases = {'default', 'catalog'}
+
+    def setUp(self):
+        config = MockLLMConfig(latency=0, jitter=0, tokens_per_second=0, completion_tokens=8, seed=1, tool_scripts=[
+            {'match': 'table', 'tool_calls': [{'name': 'check_availability', 'arguments': {
+                'restaurant_id': 999999, 'date': '2030-01-01', 'time': '19:00', 'party_size': 2}}]},
+        ])
+        server = MockLLMServer(config=config)
+        server.start_in_thread()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        from openai import OpenAI
+        self.client = OpenAI(api_key='test', base_url=server.base_url, max_retries=0)
+        override = self.settings(LLM_COALESCE=False)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_plain_streaming_and_tool_call_completions(self):
+        messages = [{'role': 'user', 'content': 'hello'}]
+        plain = chat_completion(self.client, caller='test', model='mock', messages=messages)
+        self.assertEqual(len(plain.choices[0].message.content.split()), 8)
+        self.assertEqual(plain.usage.completion_tokens, 8)
+
+        stream = chat_completion(self.client, caller='test', model='mock', messages=messages, stream=True)
+        text = ''.join(chunk.choices[0].delta.content or '' for chunk in stream if chunk.choices)
+        self.assertEqual(text, plain.choices[0].message.content)
+
+        ai = RestaurantAI.__new__(RestaurantAI)
+        ai.client, ai.model, ai.conversation_history, ai.tool_latencies = self.client, 'mock', [], []
+        answer = ai.process_user_input('a table for two please')
+        self.assertEqual([name for name, _ in ai.tool_latencies], ['check_availability'])
+        self.assertEqual(len(answer.split()), 8)
+
+    def test_json_mode_answers_follow_the_prompt(self):
+        def json_answer(messages):
+            response = chat_completion(self.client, caller='test', model='mock', messages=messages,
+                                       response_format={'type': 'json_object'})
+            return json.loads(response.choices[0].message.content)
+
+        criteria = json_answer([{'role': 'system', 'content': 'Extract search criteria from user messages.'},
+                                {'role': 'user', 'content': 'cheap pasta'}])
+        self.assertTrue({'cuisine', 'price_range', 'location'} <= set(criteria))
+
+        labels = json_answer([{'role': 'user', 'content': 'Label Roma with a description, '
+                                                          'atmosphere (one of: casual, romantic) and '
+                                                          'noise_level (one of: quiet, lively).'}])
+        self.assertIn(labels['atmosphere'], ('casual', 'romantic'))
+        self.assertIn(labels['noise_level'], ('quiet', 'lively'))
+        self.assertTrue(labels['description'])
+
+    def test_percentile_picks_nearest_rank(self):
+        self.assertEqual(percentile([], 50), 0.0)
+        self.assertEqual(percentile([1, 2, 3, 4, 5], 50), 3)
+        self.assertEqual(percentile([1, 2, 3, 4, 5], 99), 5)
+
+
+class AdmissionControllerTests(SimpleTestCase):
+    def test_sheds_when_queue_is_full(self):
+        controller = AdmissionController(max_concurrency=1, max_queue=0, max_wait=0.05)
+        controller.acquire('a')
+        with self.assertRaises(LLMOverloaded) as ctx:
+            controller.acquire('b')
+        self.assertEqual(ctx.exception.reason, 'queue_full')
+        controller.release()
+
+    def test_waiting_clients_are_served_round_robin(self):
+        controller = AdmissionController(max_concurrency=1, max_queue=10, max_wait=5)
+        controller.acquire('holder')
+        order = []
+
+        def call(client):
+            controller.acquire(client)
+            order.append(client)
+            controller.release()
+
+        threads = []
+        for client in ('busy', 'busy', 'busy', 'quiet'):
+            thread = threading.Thread(target=call, args=(client,))
+            thread.start()
+            threads.append(thread)
+            time.sleep(0.02)
+        controller.release()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(order[:2], ['busy', 'quiet'])
+
+    def test_token_budget_times_out_large_calls(self):
+        controller = AdmissionController(max_concurrency=5, tokens_per_minute=600, max_wait=0.05)
+        controller.acquire('a', tokens=600)
+        with self.assertRaises(LLMOverloaded) as ctx:
+            controller.acquire('a', tokens=300)
+        self.assertEqual(ctx.exception.reason, 'timeout')
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def test_trips_on_error_rate_and_recovers_after_probe(self):
+        breaker = CircuitBreaker(min_calls=4, error_threshold=0.5, open_seconds=0.05)
+        for failed in (False, True, False, True):
+            breaker.before_call()
+            breaker.record(failed, 0.1)
+        self.assertEqual(breaker.state, OPEN)
+        with self.assertRaises(CircuitOpen):
+            breaker.before_call()
+
+        time.sleep(0.06)
+        breaker.before_call()
+        self.assertEqual(breaker.state, HALF_OPEN)
+        # Only one probe at a time while half-open
+        with self.assertRaises(CircuitOpen):
+            breaker.before_call()
+        breaker.record(False, 0.1)
+        self.assertEqual(breaker.state, CLOSED)
+
+    def test_trips_on_slow_calls(self):
+        breaker = CircuitBreaker(min_calls=3, slow_call_seconds=1.0, slow_threshold=0.5)
+        for duration in (2.0, 0.1, 3.0):
+            breaker.record(False, duration)
+        self.assertEqual(breaker.state, OPEN)
+
+
+class BatchEnrichmentTests(TestCase):
+    def setUp(self):
+        Restaurant.objects.bulk_create([
+            Restaurant(name=f'Diner {i}', address=f'{i} Elm St', cuisine_type='American', price_range='$')
+            for i in range(7)
+        ])
+        self.work_dir = tempfile.mkdtemp()
+
+    @staticmethod
+    def respond(body):
+        """Local stand-in for the batch LLM"""
+        return json.dumps({'description': 'A friendly spot.', 'atmosphere': 'family', 'noise_level': 'loud'})
+
+    def test_interrupted_run_resumes_from_checkpoint(self):
+        calls = []
+
+        def flaky(body):
+            calls.append(body)
+            if len(calls) > 3:
+                raise KeyboardInterrupt
+            return self.respond(body)
+
+        with self.assertRaises(KeyboardInterrupt):
+            BatchEnrichmentPipeline(self.work_dir, LocalBatchExecutor(flaky), batch_size=3).run(Restaurant.objects.all())
+        self.assertEqual(Restaurant.objects.filter(atmosphere='family').count(), 3)
+
+        updated = BatchEnrichmentPipeline(self.work_dir, LocalBatchExecutor(self.respond), batch_size=3) \
+            .run(Restaurant.objects.all())
+        self.assertEqual(updated, 4)
+        self.assertEqual(Restaurant.objects.filter(noise_level='loud', description='A friendly spot.').count(), 7)
+
+    def test_rerun_retries_restaurants_without_a_usable_result(self):
+        def patchy(body):
+            prompt = body['messages'][-1]['content']
+            if prompt.startswith('Diner 2,'):
+                raise RuntimeError("request failed")
+            if prompt.startswith('Diner 4,'):
+                return 'not json'
+            return self.respond(body)
+
+        self.assertEqual(BatchEnrichmentPipeline(self.work_dir, LocalBatchExecutor(patchy), batch_size=3)
+                         .run(Restaurant.objects.all()), 5)
+        pipeline = BatchEnrichmentPipeline(self.work_dir, LocalBatchExecutor(self.respond), batch_size=3)
+        self.assertEqual(pipeline.run(Restaurant.objects.all()), 2)
+        self.assertEqual(Restaurant.objects.filter(description='A friendly spot.').count(), 7)
+        retry = pipeline.checkpoint['batches'][-1]
+        self.assertEqual((retry['count'], retry['failed']), (2, []))
+
+        pipeline = BatchEnrichmentPipeline(self.work_dir, LocalBatchExecutor(self.respond), batch_size=3)
+        self.assertEqual(pipeline.run(Restaurant.objects.all()), 0)
+        self.assertEqual(len(pipeline.checkpoint['batches']), 4)
+
+    def test_applied_results_start_a_new_catalog_version(self):
+        version = RestaurantCatalogService.catalog_version()
+        state = snapshot.catalog_state()
+        BatchEnrichmentPipeline(self.work_dir, LocalBatchExecutor(self.respond)).run(Restaurant.objects.all())
+        self.assertNotEqual(RestaurantCatalogService.catalog_version(), version)
+        # Published snapshots taken before the run no longer match
+        self.assertNotEqual(snapshot.catalog_state(), state)
+
+    def test_invalid_labels_are_ignored(self):
+        executor = LocalBatchExecutor(lambda body: json.dumps({'atmosphere': 'spooky', 'noise_level': 'quiet'}))
+        BatchEnrichmentPipeline(self.work_dir, executor, update_chunk_size=2).run(Restaurant.objects.all())
+        self.assertEqual(Restaurant.objects.filter(atmosphere='casual', noise_level='quiet').count(), 7)
+
+
+class AvailabilityTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('guest')
+        self.restaurant = Restaurant.objects.create(
+            name='Trattoria', address='1 Main St', cuisine_type='Italian', price_range='$$',
+            capacity=10, average_dining_time=90,
+        )
+
+    def book(self, time, party_size):
+        return ReservationService.create_reservation(self.restaurant.id, self.user, '2030-05-01', time, party_size)
+
+    def check(self, time, party_size):
+        return ReservationService.check_availability(self.restaurant.id, '2030-05-01', time, party_size)
+
+    def test_overlapping_seatings_share_capacity(self):
+        self.assertTrue(self.book('19:00', 6)['success'])
+        # 20:00 overlaps the 19:00-20:30 seating; 20:30 does not
+        self.assertEqual(self.check('20:00', 4)['seats_left'], 4)
+        self.assertFalse(self.check('20:00', 5)['available'])
+        self.assertFalse(self.check('18:00', 5)['available'])
+        self.assertEqual(self.check('20:30', 10)['seats_left'], 10)
+        self.assertFalse(self.book('18:30', 5)['available'])
+
+    def test_cancellation_and_changes_update_occupancy(self):
+        reservation = Reservation.objects.get(pk=self.book('19:00', 8)['reservation_id'])
+        self.assertFalse(self.check('19:30', 4)['available'])
+
+        reservation.party_size = 2
+        reservation.save()
+        self.assertEqual(self.check('19:30', 4)['seats_left'], 8)
+
+        reservation.status = 'cancelled'
+        reservation.save()
+        self.assertEqual(self.check('19:30', 10)['seats_left'], 10)
+        self.assertFalse(SlotOccupancy.objects.filter(seats__gt=0).exists())
+
+    def test_changes_that_do_not_fit_are_rejected(self):
+        reservation = Reservation.objects.get(pk=self.book('19:00', 4)['reservation_id'])
+        self.book('20:00', 5)
+
+        reservation.party_size = 6
+        with self.assertRaises(availability.SlotFull):
+            reservation.save()
+        reservation.refresh_from_db()
+        self.assertEqual(reservation.party_size, 4)
+        self.assertEqual(self.check('19:30', 1)['seats_left'], 1)
+
+        # Its own seats count as free when it grows in place
+        reservation.party_size = 5
+        reservation.save()
+        self.assertEqual(self.check('19:30', 1)['seats_left'], 0)
+
+    def test_cancelling_twice_releases_once(self):
+        reservation = Reservation.objects.get(pk=self.book('19:00', 4)['reservation_id'])
+        stale = Reservation.objects.get(pk=reservation.pk)
+        self.book('19:00', 3)
+
+        self.assertTrue(ReservationService.cancel_reservation(reservation))
+        self.assertFalse(ReservationService.cancel_reservation(stale))
+        stale.delete()
+        self.assertEqual(self.check('19:30', 1)['seats_left'], 7)
+
+    def test_late_seating_spills_into_next_day(self):
+        self.book('23:30', 10)
+        self.assertEqual(
+            ReservationService.check_availability(self.restaurant.id, '2030-05-02', '00:30', 1)['seats_left'], 0)
+
+    def test_party_larger_than_capacity_is_rejected(self):
+        self.assertFalse(self.check('12:00', 11)['available'])
+
+    def test_rebuild_matches_incremental_updates(self):
+        self.book('19:00', 3)
+        self.book('19:45', 4)
+        Reservation.objects.create(
+            restaurant=self.restaurant, user=self.user, party_size=2,
+            reservation_time=ReservationService.parse_slot('2030-05-01', '20:00'), status='cancelled')
+        incremental = {(o.date, o.slot): o.seats for o in SlotOccupancy.objects.filter(seats__gt=0)}
+        availability.rebuild()
+        rebuilt = {(o.date, o.slot): o.seats for o in SlotOccupancy.objects.all()}
+        self.assertEqual(incremental, rebuilt)
+
+    def test_check_reads_occupancy_without_scanning_reservations(self):
+        self.book('19:00', 2)
+        with self.assertNumQueries(2):
+            self.check('19:30', 2)
+
+    def test_grid_matches_single_checks(self):
+        self.book('19:00', 6)
+        self.book('20:15', 3)
+        grid = ReservationService.availability_grid(self.restaurant.id, '2030-05-01', 2, '17:00', '22:00', 4)
+        self.assertEqual(len(grid['days']), 2)
+        for day in grid['days']:
+            for time, seats, open_ in zip(grid['times'], day['seats_left'], day['available']):
+                result = ReservationService.check_availability(self.restaurant.id, day['date'], time, 4)
+                self.assertEqual(seats, result['seats_left'], (day['date'], time))
+                self.assertEqual(open_, result['available'], (day['date'], time))
+
+    def test_alternatives_are_open_and_nearest(self):
+        self.book('19:00', 10)
+        result = self.check('19:00', 2)
+        self.assertFalse(result['available'])
+        # The 90 minute seating blocks starts from 17:45 to 20:15
+        self.assertEqual(result['alternative_times'], ['17:30', '20:30', '17:15', '20:45'])
+        for time in result['alternative_times']:
+            self.assertTrue(self.check(time, 2)['available'])
+
+    def test_grid_endpoint_validates_parameters(self):
+        url = '/api/reservations/availability/'
+        response = self.client.get(url, {'restaurant_id': self.restaurant.id, 'start_date': '2030-05-01',
+                                         'party_size': 2, 'days': 400}, HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(url, {'restaurant_id': self.restaurant.id, 'start_date': '2030-05-01',
+                                         'party_size': 2, 'start_time': '18:00', 'end_time': '19:00'},
+                                   HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['times'], ['18:00', '18:15', '18:30', '18:45', '19:00'])
+
+    def test_idempotency_key_replays_the_original_booking(self):
+        first = ReservationService.create_reservation(
+            self.restaurant.id, self.user, '2030-05-01', '19:00', 4, idempotency_key='abc')
+        retry = ReservationService.create_reservation(
+            self.restaurant.id, self.user, '2030-05-01', '19:00', 4, idempotency_key='abc')
+        self.assertEqual(first['reservation_id'], retry['reservation_id'])
+        self.assertTrue(retry['replayed'])
+        self.assertEqual(Reservation.objects.count(), 1)
+        self.assertEqual(self.check('19:00', 1)['seats_left'], 6)
+
+        reused = ReservationService.create_reservation(
+            self.restaurant.id, self.user, '2030-05-01', '20:00', 4, idempotency_key='abc')
+        self.assertFalse(reused['success'])
+
+    def test_find_tables_ranks_open_restaurants_in_one_pass(self):
+        full = self.restaurant
+        near = Restaurant.objects.create(name='Osteria', address='2 Main St', cuisine_type='Italian',
+                                         price_range='$$', capacity=8, average_dining_time=60, rating=4.0)
+        best = Restaurant.objects.create(name='Enoteca', address='3 Main St', cuisine_type='Italian',
+                                         price_range='$$', capacity=8, average_dining_time=60, rating=4.8)
+        Restaurant.objects.create(name='Sushi Bar', address='4 Main St', cuisine_type='Japanese',
+                                  price_range='$$', capacity=40)
+        ReservationService.create_reservation(full.id, self.user, '2030-05-01', '19:00', 10)
+        # Enoteca only has room from 19:30
+        ReservationService.create_reservation(best.id, self.user, '2030-05-01', '18:30', 8)
+
+        with self.assertNumQueries(2):
+            result = ReservationService.find_tables(
+                {'cuisine_type': 'italian', 'price_range': '$$'}, '2030-05-01', '19:00', 4, flexibility_minutes=30)
+        self.assertEqual([r['name'] for r in result['results']], ['Osteria', 'Enoteca'])
+        self.assertEqual(result['results'][0]['open_times'], ['18:30', '18:45', '19:00', '19:15', '19:30'])
+        self.assertEqual(result['results'][1]['open_times'], ['19:30'])
+        for restaurant in result['results']:
+            for time in restaurant['open_times']:
+                self.assertTrue(ReservationService.check_availability(restaurant['id'], '2030-05-01', time, 4)['available'])
+
+
+@unittest.skipIf(connection.vendor == 'sqlite' and connection.settings_dict['TEST']['NAME'] in (None, ':memory:'),
+                 "needs a file-backed test database")
+class ConcurrentBookingTests(TransactionTestCase):
+    """Many threads booking the same slot must never overbook it"""
+
+    databases = {'default', 'catalog'}
+
+    def setUp(self):
+        self.restaurant = Restaurant.objects.create(
+            name='Popular', address='1 Main St', cuisine_type='Thai', price_range='$$',
+            capacity=20, average_dining_time=60,
+        )
+        self.users = [User.objects.create_user(f'guest{i}') for i in range(8)]
+
+    def test_no_overbooking_under_concurrent_load(self):
+        attempts_per_thread = 10
+        results = []
+        lock = threading.Lock()
+
+        def worker(user, offset):
+            try:
+                for attempt in range(attempts_per_thread):
+                    # Overlapping starts so seatings compete for the same buckets
+                    time_ = ['19:00', '19:15', '19:30'][(offset + attempt) % 3]
+                    result = ReservationService.create_reservation(
+                        self.restaurant.id, user, '2030-06-01', time_, 2,
+                        idempotency_key=f'{user.pk}-{attempt}')
+                    with lock:
+                        results.append(result)
+            finally:
+                connections.close_all()
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=worker, args=(user, i)) for i, user in enumerate(self.users)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        self.assertEqual(len(results), len(self.users) * attempts_per_thread)
+        self.assertFalse([r for r in results if r.get('error')])
+        booked = sum(1 for r in results if r.get('success'))
+        self.assertEqual(booked, 10)
+        self.assertEqual(Reservation.objects.count(), booked)
+        self.assertLessEqual(max(SlotOccupancy.objects.values_list('seats', flat=True)), self.restaurant.capacity)
+        # Incremental counters agree with a rebuild from the reservations themselves
+        counters = {(o.date, o.slot): o.seats for o in SlotOccupancy.objects.filter(seats__gt=0)}
+        availability.rebuild()
+        self.assertEqual(counters, {(o.date, o.slot): o.seats for o in SlotOccupancy.objects.all()})
+        self.assertLess(elapsed, 30)
+
+    def test_concurrent_cancellations_release_seats_once(self):
+        user = self.users[0]
+        booked = ReservationService.create_reservation(self.restaurant.id, user, '2030-06-01', '19:00', 4)
+        ReservationService.create_reservation(self.restaurant.id, user, '2030-06-01', '19:00', 6)
+        barrier = threading.Barrier(len(self.users))
+        results = []
+
+        def worker():
+            try:
+                # Every thread holds its own stale copy of the active reservation
+                reservation = Reservation.objects.get(pk=booked['reservation_id'])
+                barrier.wait()
+                results.append(ReservationService.cancel_reservation(reservation))
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker) for _ in self.users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(results), [False] * (len(self.users) - 1) + [True])
+        self.assertEqual(set(SlotOccupancy.objects.values_list('seats', flat=True)), {6})
+
+
+class DatabaseProfileTests(TransactionTestCase):
+    databases = {'default', 'catalog'}
+
+    def pragma(self, alias, name):
+        with connections[alias].cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    @unittest.skipIf(connection.vendor != 'sqlite', "SQLite pragmas")
+    def test_connections_get_the_tuned_pragmas(self):
+        self.assertEqual(self.pragma('default', 'journal_mode'), 'wal')
+        self.assertEqual(self.pragma('default', 'synchronous'), 1)
+        self.assertEqual(self.pragma('default', 'busy_timeout'), settings.SQLITE_PRAGMAS['busy_timeout'])
+        self.assertEqual(self.pragma('default', 'query_only'), 0)
+        self.assertEqual(self.pragma('catalog', 'query_only'), 1)
+
+    def test_catalog_reads_use_the_read_only_alias_outside_transactions(self):
+        restaurant = Restaurant.objects.create(name='Quiet', address='2 Side St', cuisine_type='Thai',
+                                               price_range='$', capacity=10)
+        loaded = Restaurant.objects.get(pk=restaurant.pk)
+        self.assertEqual(loaded._state.db, 'catalog')
+        self.assertEqual(Reservation.objects.all().db, 'default')
+        with transaction.atomic():
+            self.assertEqual(Restaurant.objects.all().db, 'default')
+
+        # Instances read from the catalog alias still save through default
+        loaded.capacity = 12
+        loaded.save()
+        user = User.objects.create_user('diner')
+        Reservation.objects.create(restaurant=loaded, user=user, party_size=2,
+                                   reservation_time=timezone.now() + timedelta(days=1))
+        self.assertEqual(Restaurant.objects.get(pk=restaurant.pk).capacity, 12)
+        self.assertEqual(Reservation.objects.count(), 1)
+
+
+class OperatingHoursTests(TestCase):
+    def open_minutes(self, operating_hours):
+        bits = bitmap_bits(compile_hours(operating_hours))
+        return {(int(m) // MINUTES_PER_DAY, int(m) % MINUTES_PER_DAY) for m in bits.nonzero()[0]}
+
+    def test_compiles_spans_and_overnight_hours(self):
+        minutes = self.open_minutes({'monday': '11:00-14:00, 6pm-2am', 'sunday': '22:00-01:00'})
+        self.assertIn((0, 11 * 60), minutes)
+        self.assertNotIn((0, 14 * 60), minutes)
+        self.assertIn((0, 23 * 60 + 59), minutes)
+        self.assertIn((1, 60), minutes)          # Monday night runs into Tuesday
+        self.assertNotIn((1, 2 * 60), minutes)
+        self.assertIn((0, 30), minutes)          # Sunday night wraps to Monday
+        self.assertEqual(len(minutes), 3 * 60 + 8 * 60 + 3 * 60)
+
+    def test_day_ranges_and_unparseable_hours(self):
+        self.assertEqual(len(self.open_minutes({'mon-fri': '09:00-17:00'})), 5 * 8 * 60)
+        self.assertEqual(len(self.open_minutes({'daily': '24 hours'})), 7 * MINUTES_PER_DAY)
+        self.assertIsNone(compile_hours({'monday': 'whenever'}))
+        self.assertIsNone(compile_hours({}))
+
+    def test_open_at_filter_and_bookings_follow_hours(self):
+        user = User.objects.create_user('diner')
+        late = Restaurant.objects.create(name='Night Owl', address='1 Main St', cuisine_type='Diner',
+                                         price_range='$', operating_hours={'friday': '18:00-03:00'})
+        lunch = Restaurant.objects.create(name='Lunchbox', address='2 Main St', cuisine_type='Diner',
+                                          price_range='$', operating_hours={'daily': '11:00-15:00'})
+        Restaurant.objects.create(name='Mystery', address='3 Main St', cuisine_type='Diner', price_range='$')
+
+        # 2030-05-03 is a Friday
+        saturday_1am = ReservationService.parse_slot('2030-05-04', '01:00')
+        found = RestaurantCatalogService.search_restaurants({'open_at': saturday_1am})
+        self.assertEqual([r.name for r in found], ['Night Owl'])
+        noon = ReservationService.parse_slot('2030-05-03', '12:00')
+        self.assertEqual([r.name for r in RestaurantCatalogService.search_restaurants({'open_at': noon})],
+                         ['Lunchbox'])
+        self.assertTrue(is_open_at(late, saturday_1am))
+
+        self.assertTrue(ReservationService.check_availability(late.id, '2030-05-04', '01:00', 2)['available'])
+        self.assertFalse(ReservationService.check_availability(late.id, '2030-05-04', '04:00', 2)['available'])
+        self.assertFalse(ReservationService.create_reservation(lunch.id, user, '2030-05-03', '18:00', 2)
+                         .get('success'))
+        grid = ReservationService.availability_grid(lunch.id, '2030-05-03', 1, '10:30', '15:15', 2)
+        self.assertEqual(
+            [t for t, ok in zip(grid['times'], grid['days'][0]['available']) if ok][::4],
+            ['11:00', '12:00', '13:00', '14:00'],
+        )
+
+    def test_hours_index_reloads_after_changes(self):
+        restaurant = Restaurant.objects.create(name='Cafe', address='1 Main St', cuisine_type='Cafe',
+                                               price_range='$', operating_hours={'daily': '08:00-12:00'})
+        evening = ReservationService.parse_slot('2030-05-03', '19:00')
+        self.assertFalse(hours_index.filter_open(Restaurant.objects.all(), evening).exists())
+        restaurant.operating_hours = {'daily': '08:00-22:00'}
+        restaurant.save(update_fields=['operating_hours', 'updated_at'])
+        self.assertTrue(hours_index.filter_open(Restaurant.objects.all(), evening).exists())
+
+    def test_long_id_lists_are_not_bound_one_by_one(self):
+        for i in range(6):
+            Restaurant.objects.create(name=f'Cafe {i}', address=f'{i} Main St', cuisine_type='Cafe', price_range='$',
+                                      operating_hours={'daily': '08:00-12:00' if i % 2 else '08:00-22:00'})
+        evening = ReservationService.parse_slot('2030-05-03', '19:00')
+        expected = list(hours_index.filter_open(Restaurant.objects.order_by('id'), evening))
+        with unittest.mock.patch.object(hours, 'MAX_BOUND_IDS', 2):
+            queryset = hours_index.filter_open(Restaurant.objects.order_by('id'), evening)
+            self.assertIn('json_each', str(queryset.query))
+            self.assertEqual(list(queryset), expected)
+        self.assertEqual([r.name for r in expected], ['Cafe 0', 'Cafe 2', 'Cafe 4'])
+
+    def test_hours_index_does_not_query_the_catalog_state_per_filter(self):
+        Restaurant.objects.create(name='Cafe', address='1 Main St', cuisine_type='Cafe',
+                                  price_range='$', operating_hours={'daily': '08:00-22:00'})
+        evening = ReservationService.parse_slot('2030-05-03', '19:00')
+        hours_index.open_mask(evening)
+        with self.assertNumQueries(0):
+            hours_index.open_mask(evening)
+
+    def test_large_sides_are_filtered_in_sql(self):
+        for i in range(6):
+            Restaurant.objects.create(name=f'Cafe {i}', address=f'{i} Main St', cuisine_type='Cafe', price_range='$',
+                                      operating_hours={'daily': '08:00-12:00' if i % 2 else '08:00-22:00'})
+        Restaurant.objects.create(name='Unknown', address='9 Main St', cuisine_type='Cafe', price_range='$')
+        evening = ReservationService.parse_slot('2030-05-03', '19:00')
+        expected = list(hours_index.filter_open(Restaurant.objects.order_by('id'), evening, 60))
+        with self.settings(HOURS_FILTER_MAX_IDS=1):
+            queryset = hours_index.filter_open(Restaurant.objects.order_by('id'), evening, 60)
+            self.assertIn('hours_open', str(queryset.query))
+            self.assertEqual(list(queryset), expected)
+            self.assertFalse(hours_index.filter_open(Restaurant.objects.all(), evening, 4 * 60).exists())
+        self.assertEqual([r.name for r in expected], ['Cafe 0', 'Cafe 2', 'Cafe 4'])
+
+    def test_restaurant_details_include_hours(self):
+        restaurant = Restaurant.objects.create(name='Cafe', address='1 Main St', cuisine_type='Cafe',
+                                               price_range='$', operating_hours={'daily': '08:00-12:00'})
+        details = RestaurantCatalogService.get_restaurant_details(restaurant.id)
+        self.assertEqual(details['hours_of_operation'], {'daily': '08:00-12:00'})
+        self.assertIn(details['open_now'], (True, False))
+
+
+class ReservationHistoryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('regular', password='pw')
+        self.restaurant = Restaurant.objects.create(name='Bistro', address='1 Main St', cuisine_type='French',
+                                                    price_range='$$')
+        now = timezone.now()
+        for days in range(1, 6):
+            self.reserve(now + timedelta(days=days), 'confirmed')
+        for days in range(1, 201):
+            self.reserve(now - timedelta(days=days), 'completed' if days % 3 else 'cancelled')
+
+    def reserve(self, when, status):
+        return Reservation.objects.create(restaurant=self.restaurant, user=self.user, party_size=2,
+                                          reservation_time=when, status=status)
+
+    def walk(self, scope, limit):
+        seen, cursor = [], None
+        while True:
+            page, cursor = ReservationHistoryService.get_page(self.user, scope, cursor=cursor, limit=limit)
+            seen.extend(page)
+            if not cursor:
+                return seen
+
+    def test_keyset_pages_cover_history_in_order(self):
+        upcoming = self.walk('upcoming', 2)
+        self.assertEqual(len(upcoming), 5)
+        self.assertEqual([r.reservation_time for r in upcoming], sorted(r.reservation_time for r in upcoming))
+        with self.assertNumQueries(2):
+            ReservationHistoryService.get_page(self.user, 'past', limit=20)
+
+    def test_archive_moves_old_rows_without_changing_history(self):
+        before = [r.id for r in self.walk('past', 30)]
+        counts = ReservationHistoryService.get_counts(self.user)
+        self.assertEqual(counts, {'upcoming': 5, 'past': 200})
+
+        call_command('archive_reservations', days=90, batch_size=25, stdout=open('/dev/null', 'w'))
+        self.assertEqual(ArchivedReservation.objects.count(), 111)
+        self.assertEqual(Reservation.objects.count(), 205 - 111)
+        self.assertEqual([r.id for r in self.walk('past', 30)], before)
+        self.assertEqual(ReservationHistoryService.get_counts(self.user), counts)
+
+    def test_archive_keeps_buckets_of_active_reservations(self):
+        stale = self.reserve(timezone.now() - timedelta(days=120), 'confirmed')
+        self.reserve(timezone.now() - timedelta(days=130), 'cancelled')
+        held = set(SlotOccupancy.objects.filter(seats__gt=0).values_list('date', 'slot', 'seats'))
+        self.assertEqual(len({day for day, _, _ in held if day < timezone.localdate() - timedelta(days=90)}), 1)
+
+        ReservationHistoryService.archive(90)
+        self.assertTrue(Reservation.objects.filter(pk=stale.pk).exists())
+        self.assertEqual(set(SlotOccupancy.objects.filter(seats__gt=0).values_list('date', 'slot', 'seats')), held)
+        counters = {(o.date, o.slot): o.seats for o in SlotOccupancy.objects.filter(seats__gt=0)}
+        availability.rebuild()
+        self.assertEqual(counters, {(o.date, o.slot): o.seats for o in SlotOccupancy.objects.all()})
+
+    def test_counts_are_cached_until_a_reservation_changes(self):
+        ReservationHistoryService.get_counts(self.user)
+        with self.assertNumQueries(0):
+            ReservationHistoryService.get_counts(self.user)
+        self.reserve(timezone.now() + timedelta(days=9), 'pending')
+        self.assertEqual(ReservationHistoryService.get_counts(self.user)['upcoming'], 6)
+
+    def test_history_view_and_cancellation(self):
+        self.client.login(username='regular', password='pw')
+        response = self.client.get('/my-reservations/', HTTP_HOST='localhost')
+        self.assertContains(response, 'Upcoming (5)')
+        reservation = Reservation.objects.filter(status='confirmed').first()
+        self.client.post(f'/reservation/{reservation.id}/cancel/', HTTP_HOST='localhost')
+        reservation.refresh_from_db()
+        self.assertEqual(reservation.status, 'cancelled')
+        response = self.client.get('/my-reservations/?scope=past', HTTP_HOST='localhost')
+        self.assertContains(response, 'Past (201)')
+
+
+class WarmupTests(TransactionTestCase):
+    databases = {'default', 'catalog'}
+
+    def setUp(self):
+        hours_index._version = None
+        fallback._cuisines.update(values=[], loaded_at=float('-inf'))
+        row_cache._rows.clear()
+
+    def load_serving_profile(self, role):
+        previous = os.environ.get('SERVER_ROLE')
+        os.environ['SERVER_ROLE'] = role
+        try:
+            return runpy.run_path(str(settings.BASE_DIR / 'gunicorn.conf.py'))
+        finally:
+            if previous is None:
+                del os.environ['SERVER_ROLE']
+            else:
+                os.environ['SERVER_ROLE'] = previous
+
+    def test_serving_profiles(self):
+        api = self.load_serving_profile('api')
+        self.assertEqual((api['wsgi_app'], api['worker_class']), ('restaurant.wsgi:application', 'sync'))
+        self.assertTrue(api['preload_app'])
+        stream = self.load_serving_profile('stream')
+        self.assertEqual((stream['wsgi_app'], stream['worker_class']),
+                         ('restaurant.asgi:application', 'uvicorn_worker.UvicornWorker'))
+        self.assertGreater(stream['timeout'], api['timeout'])
+
+    def test_when_ready_fills_the_caches_workers_inherit(self):
+        Restaurant.objects.create(name='Trattoria', address='1 Main St', cuisine_type='Italian, Pizza',
+                                  price_range='$$', operating_hours={'daily': '00:00-23:59'})
+        Restaurant.objects.create(name='Pho One', address='2 Main St', cuisine_type='Vietnamese', price_range='$')
+        with self.assertNoLogs('core.warmup', 'WARNING'):
+            self.load_serving_profile('api')['when_ready'](None)
+
+        self.assertEqual(len(hours_index._ids), 2)
+        self.assertEqual(fallback._cuisines['values'], ['vietnamese', 'italian', 'pizza'])
+        self.assertEqual(len(row_cache._rows), 2)
+        self.assertIsNotNone(utils._client)
+
+    def test_empty_catalog(self):
+        with self.assertNoLogs('core.warmup', 'WARNING'):
+            timings = warm()
+        self.assertEqual(set(timings), {name for name, _ in STEPS})
+        self.assertEqual(len(hours_index._ids), 0)
+        self.assertEqual(fallback._cuisines['values'], [])
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        profiling.slowest.clear()
+        for name in ('Thai One', 'Thai Two'):
+            Restaurant.objects.create(name=name, address='1 Main St', cuisine_type='Thai', price_range='$$')
+        self.staff = User.objects.create_user('ops', password='pw', is_staff=True)
+
+    def test_profiled_request_reports_server_timing(self):
+        response = self.client.get('/api/restaurants/search/?cuisine=thai', HTTP_HOST='localhost',
+                                   HTTP_X_PROFILE='1')
+        self.assertNotIn('Server-Timing', response)  # the header is ignored for anonymous users
+
+        self.client.login(username='ops', password='pw')
+        # Another query: the first request's results are in the shared cache
+        response = self.client.get('/api/restaurants/search/?cuisine=thai&price=%24%24', HTTP_HOST='localhost',
+                                   HTTP_X_PROFILE='1')
+        self.assertRegex(response['Server-Timing'], r'db;dur=[\d.]+;desc="\d+ queries, \d+ duplicated"')
+        self.assertIn('svc;dur=', response['Server-Timing'])
+
+        profiles = self.client.get('/debug/profiles/', HTTP_HOST='localhost').json()['profiles']
+        self.assertEqual(len(profiles), 1)
+        self.assertGreater(profiles[0]['sql']['count'], 0)
+        self.assertIn('service:RestaurantCatalogService.search_restaurants', profiles[0]['spans'])
+
+    def test_repeated_queries_and_stack_samples(self):
+        first, second = Restaurant.objects.values_list('id', flat=True)
+
+        def view(request):
+            for pk in (first, first, second):
+                Restaurant.objects.filter(pk=pk).exists()
+            time.sleep(0.05)
+            return HttpResponse('ok')
+
+        request = RequestFactory().get('/anything/', HTTP_X_PROFILE='stack')
+        request.user = self.staff
+        response = profiling.ProfilingMiddleware(view)(request)
+        self.assertIn('3 queries, 1 duplicated', response['Server-Timing'])
+
+        profile = profiling.slowest.dump()[0]
+        self.assertEqual([entry['count'] for entry in profile['sql']['duplicated']], [2])
+        self.assertEqual([entry['count'] for entry in profile['sql']['similar']], [3])
+        self.assertTrue(any('tests.py:view' in entry['stack'] for entry in profile['stacks']))
+
+    def test_tool_threads_and_streamed_bodies_are_profiled(self):
+        ai = RestaurantAI.__new__(RestaurantAI)
+        ai.tool_latencies = []
+
+        def search(args):
+            RestaurantCatalogService.catalog_version()
+            return str(User.objects.filter(is_staff=True).exists())
+        ai._handle_restaurant_search = search
+
+        def body():
+            yield 'one'
+            User.objects.exists()
+            profiling.record_span('llm:test', 0.01)
+            yield 'two'
+
+        def view(request):
+            ai._execute_tool_calls([tool_call('a', 'search_restaurants'), tool_call('b', 'search_restaurants')])
+            return StreamingHttpResponse(body())
+
+        request = RequestFactory().get('/chat/', HTTP_X_PROFILE='1')
+        request.user = self.staff
+        response = profiling.ProfilingMiddleware(view)(request)
+        self.assertEqual(b''.join(response.streaming_content), b'onetwo')
+        self.assertEqual(profiling.slowest.dump(), [])
+
+        response.close()
+        profile = profiling.slowest._heap[0][2]
+        # Two tool threads and the body; the pool threads' connection setup aside
+        self.assertEqual(len([sql for _, sql, _, _ in profile.queries if 'auth_user' in sql]), 3)
+        self.assertEqual(profile.spans['service:RestaurantCatalogService.catalog_version'][0], 2)
+        self.assertGreater(profile.service_time, 0)
+        self.assertIn('llm:test', profile.spans)
+
+class SyntheticCatalogTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.model = CatalogModel.fit()
+        cls.work_dir = tempfile.mkdtemp()
+        cls.manifest = CatalogGenerator(cls.model, seed=7, chunk_size=120).generate(
+            cls.work_dir, 300, users=40, queries=40)
+        cls.addClassCleanup(shutil.rmtree, cls.work_dir)
+
+    def test_learned_distributions(self):
+        self.assertIn('American', self.model.tags.values)
+        self.assertEqual(set(self.model.prices[None].values), {'$', '$$ - $$$', '$$$$'})
+        # Co-occurrence: Sushi follows Japanese far more often than it starts a list
+        self.assertGreater(self.model.transitions['Japanese'].as_dict().get('Sushi', 0), 0.3)
+
+    def test_load_and_replay(self):
+        loaded = load_catalog(self.work_dir)
+        counts = self.manifest['counts']
+        self.assertEqual(loaded, {table: counts[table] for table in loaded})
+        self.assertEqual(Restaurant.objects.count(), 300)
+        self.assertFalse(Restaurant.objects.filter(hours_bitmap__isnull=True).exists())
+        self.assertEqual(Review.objects.count(), counts['reviews'])
+        self.assertTrue(set(Restaurant.objects.values_list('price_range', flat=True)) <= {'$', '$$', '$$$', '$$$$'})
+
+        for entry in read_query_log(f"{self.work_dir}/queries.jsonl")[:15]:
+            response = self.client.get(entry['path'], HTTP_HOST='localhost')
+            self.assertEqual(response.status_code, 200, entry['path'])
+
+        with self.assertRaises(ValueError):
+            load_catalog(self.work_dir)
+
+
+class StartupImportTests(SimpleTestCase):
+    def test_cold_import_stays_lazy_and_within_budget(self):
+        from .management.commands.profile_startup import profile_imports
+
+        report = min((profile_imports('core.urls') for _ in range(2)), key=lambda run: run['total_ms'])
+        self.assertEqual(report['lazy_loaded'], [])
+        self.assertLessEqual(report['total_ms'], settings.STARTUP_IMPORT_BUDGET_MS)
+
+    def test_lazy_module_imports_on_first_use(self):
+        from .lazy import lazy_import
+
+        module = lazy_import('json.tool')
+        self.assertIn('not loaded', repr(module))
+        self.assertTrue(callable(module.main))
+        self.assertNotIn('not loaded', repr(module))
+
+
+class ServiceBenchmarkTests(TestCase):
+    def test_hot_paths_report_latency_queries_and_memory(self):
+        from .management.commands.bench_services import (
+            HOT_PATHS, benchmark_base_date, compare, query_log_cases, run_hot_paths,
+        )
+
+        work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, work_dir)
+        CatalogGenerator(CatalogModel.fit(), seed=3, chunk_size=100, base_date=benchmark_base_date()).generate(
+            work_dir, 200, users=20, queries=200)
+        load_catalog(work_dir)
+        availability.rebuild()
+
+        cases = query_log_cases(read_query_log(f"{work_dir}/queries.jsonl"))
+        results = run_hot_paths(cases, iterations=4, warmup=1, memory_iterations=1)
+        self.assertEqual(set(results), set(HOT_PATHS))
+        self.assertEqual(results['get_restaurant_details']['queries_per_call'], 1)
+        for stats in results.values():
+            self.assertEqual(stats['calls'], 4)
+            self.assertGreater(stats['latency_ms']['p50'], 0)
+            self.assertGreater(stats['peak_memory_kb'], 0)
+
+        report = {'sizes': {'200': results}}
+        self.assertEqual(compare(report, report, tolerance=0.3), [])
+        worse = json.loads(json.dumps(report))
+        worse['sizes']['200']['get_restaurant_details']['queries_per_call'] = 2
+        worse['sizes']['200']['search_restaurants']['latency_ms']['p50'] += 0.1
+        regressions = compare(report, worse, tolerance=0.3)
+        self.assertEqual([(r['path'], r['metric']) for r in regressions],
+                         [('get_restaurant_details', 'queries per call')])
+
+
+class SharedCacheTests(TestCase):
+    def make_cache(self, **options):
+        work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, work_dir)
+        options.setdefault('STATS_FLUSH_INTERVAL', 0)
+        return SQLiteCache(f"{work_dir}/cache.sqlite3", {'OPTIONS': options})
+
+    def test_values_are_compressed_shared_across_processes_and_expire(self):
+        shared = self.make_cache(COMPRESS_MIN_SIZE=512)
+        rows = [{'name': f'Restaurant {i}', 'cuisine_type': 'Italian, Pizza'} for i in range(200)]
+        shared.set('search:big', rows)
+        shared.set('search:small', {'id': 1}, timeout=0.05)
+        self.assertEqual(shared.get('search:big'), rows)
+        self.assertEqual(shared.stats()['compressed_entries'], 1)
+        self.assertFalse(shared.add('search:small', 'other'))
+
+        # Another process sees the same entries through the file
+        process = multiprocessing.get_context('fork').Process(target=shared.set, args=('llm:child', 'from child'))
+        process.start()
+        process.join()
+        self.assertEqual(shared.get('llm:child'), 'from child')
+
+        time.sleep(0.06)
+        self.assertIsNone(shared.get('search:small'))
+        self.assertTrue(shared.add('search:small', 'again'))
+
+    def test_lru_eviction_within_entry_and_size_bounds(self):
+        shared = self.make_cache(MAX_ENTRIES=10, CULL_TO=0.5)
+        for i in range(10):
+            shared.set(f'k{i}', i)
+            time.sleep(0.002)
+        shared.get('k0')  # now the most recently used
+        shared.set('k10', 10)
+
+        stats = shared.stats()
+        self.assertEqual(stats['entries'], 5)
+        self.assertEqual(stats['evictions'], 6)
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(shared.get('k0'), 0)
+        self.assertIsNone(shared.get('k1'))
+        self.assertEqual(shared.get('k10'), 10)
+
+        small = self.make_cache(MAX_SIZE=4000)
+        for i in range(20):
+            small.set(f'blob{i}', os.urandom(500))
+        self.assertLessEqual(small.stats()['bytes'], 4000)
+
+    def test_catalog_results_follow_restaurant_changes(self):
+        cache.clear()
+        Restaurant.objects.create(name='Pho One', address='1 Main St', cuisine_type='Vietnamese', price_range='$')
+        first = self.client.get('/api/restaurants/search/?cuisine=vietnamese', HTTP_HOST='localhost').json()
+        with self.assertNumQueries(0):
+            cached = self.client.get('/api/restaurants/search/?cuisine=vietnamese', HTTP_HOST='localhost').json()
+        self.assertEqual(first, cached)
+
+        Restaurant.objects.create(name='Pho Two', address='2 Main St', cuisine_type='Vietnamese', price_range='$')
+        results = self.client.get('/api/restaurants/search/?cuisine=vietnamese', HTTP_HOST='localhost').json()
+        self.assertEqual(len(results['results']), 2)
+
+    def test_cacheable_llm_calls_reach_upstream_once(self):
+        cache.clear()
+        calls = []
+
+        class Completions:
+            def create(self, **kwargs):
+                calls.append(kwargs)
+                return {'content': '{"cuisine": "thai"}'}
+
+        client = SimpleNamespace(base_url='http://llm.test', chat=SimpleNamespace(completions=Completions()))
+        messages = [{'role': 'user', 'content': 'thai near me'}]
+        with self.settings(LLM_ADMISSION_ENABLED=False, LLM_CIRCUIT_ENABLED=False):
+            for _ in range(2):
+                response = chat_completion(client, caller='test', model='m', messages=messages, cacheable=True)
+                self.assertEqual(response, {'content': '{"cuisine": "thai"}'})
+            chat_completion(client, caller='test', model='m', messages=messages)
+        self.assertEqual(len(calls), 2)
+
+
+class CatalogSnapshotTests(TestCase):
+    def setUp(self):
+        work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, work_dir)
+        self.path = f"{work_dir}/catalog.snapshot"
+        Restaurant.objects.create(name='Trattoria Roma', address='1 Via Roma', cuisine_type='Italian, Pizza',
+                                  price_range='$$', rating=4.5, dietary_options=['vegetarian'],
+                                  operating_hours={'daily': '12:00-22:00'})
+        Restaurant.objects.create(name='Café Élan', address='2 Rue Neuve', cuisine_type='French',
+                                  price_range='$$$$', atmosphere='romantic', latitude=40.7, longitude=-74.0)
+        # A fresh reader and hours index for this path, and again afterwards for other tests
+        override = self.settings(CATALOG_SNAPSHOT_PATH=self.path, CATALOG_SNAPSHOT_CHECK_INTERVAL=0)
+        override.enable()
+        self.addCleanup(override.disable)
+        self._reset()
+        self.addCleanup(self._reset)
+
+    @staticmethod
+    def _reset():
+        snapshot._reader = None
+        hours_index._version = None
+
+    def test_columns_tags_and_strings_round_trip(self):
+        header = snapshot.write_snapshot()
+        mapped = snapshot.CatalogSnapshot(self.path)
+        self.assertEqual((header['version'], mapped.rows), (1, 2))
+        self.assertEqual(list(mapped.strings('name')), ['Trattoria Roma', 'Café Élan'])
+        self.assertEqual(mapped.tag_mask('cuisine_tags', 'Pizza').tolist(), [True, False])
+        self.assertEqual(mapped.tag_mask('dietary_tags', 'vegetarian').tolist(), [True, False])
+        self.assertEqual(mapped.array('price_range').tolist(), [mapped.code('price_range', '$$'),
+                                                                mapped.code('price_range', '$$$$')])
+        self.assertAlmostEqual(float(mapped.array('rating')[0]), 4.5)
+        self.assertEqual(mapped.array('hours_known').tolist(), [True, False])
+        ids = list(Restaurant.objects.order_by('id').values_list('id', flat=True))
+        self.assertEqual(mapped.positions([ids[1], 999999]).tolist(), [1, -1])
+        self.assertFalse(mapped.array('hours').flags.writeable)
+
+    def test_hours_index_shares_the_mapping_and_follows_new_versions(self):
+        moment = timezone.make_aware(timezone.datetime(2030, 1, 2, 13, 0))
+        snapshot.write_snapshot()
+        ids, mask = hours_index.open_mask(moment)
+        mapped = snapshot.get_snapshot()
+        self.assertIs(hours_index._bitmaps, mapped.array('hours'))
+        self.assertEqual(ids[mask].tolist(), [Restaurant.objects.get(name='Trattoria Roma').id])
+
+        # A change the snapshot does not have yet: the index reads the database
+        Restaurant.objects.create(name='Late Bar', address='3 Side St', cuisine_type='Bar', price_range='$',
+                                  operating_hours={'daily': '18:00-02:00'})
+        ids, mask = hours_index.open_mask(moment)
+        self.assertEqual((len(ids), int(mask.sum())), (3, 1))
+        self.assertIsNot(hours_index._bitmaps, mapped.array('hours'))
+
+        # Publishing swaps every reader to the new file; the old views stay readable
+        old_hours = mapped.array('hours')
+        self.assertEqual(snapshot.write_snapshot()['version'], 2)
+        self.assertEqual(snapshot.get_snapshot().version, 2)
+        hours_index.open_mask(moment)
+        self.assertIs(hours_index._bitmaps, snapshot.get_snapshot().array('hours'))
+        self.assertEqual(old_hours.shape, (2, len(old_hours[0])))
+
+
+class ConditionalApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        for i in range(30):
+            Restaurant.objects.create(name=f'Trattoria {i}', address=f'{i} Via Roma, Little Italy',
+                                      cuisine_type='Italian, Pizza', price_range='$$', rating=4.0)
+
+    def get(self, path, **headers):
+        return self.client.get(path, HTTP_HOST='localhost', **headers)
+
+    def test_large_responses_are_gzipped_with_their_own_etag(self):
+        plain = self.get('/api/restaurants/search/?cuisine=italian')
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertTrue(plain['ETag'].startswith('"search-'))
+        self.assertIn('Accept-Encoding', plain['Vary'])
+
+        encoded = self.get('/api/restaurants/search/?cuisine=italian', HTTP_ACCEPT_ENCODING='gzip, br;q=0')
+        self.assertEqual(encoded['Content-Encoding'], 'gzip')
+        self.assertEqual(encoded['ETag'], plain['ETag'][:-1] + '-gzip"')
+        self.assertLess(len(encoded.content), len(plain.content) // 4)
+        self.assertEqual(json.loads(gzip.decompress(encoded.content)), plain.json())
+
+        small = self.get('/api/restaurants/search/?cuisine=thai', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertNotIn('Content-Encoding', small)
+        self.assertIsNone(choose_coding('gzip;q=0, identity'))
+        self.assertEqual(choose_coding('deflate, gzip;q=0.5, br;q=0'), 'gzip')
+
+    def test_matching_etag_is_answered_with_304_until_the_catalog_changes(self):
+        first = self.get('/api/restaurants/nearby/?lat=40.7&lng=-74.0', HTTP_ACCEPT_ENCODING='gzip')
+        etag = first['ETag']
+        with self.assertNumQueries(0):
+            again = self.get('/api/restaurants/nearby/?lat=40.7&lng=-74.0', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((again.status_code, again['ETag'], again.content), (304, etag, b''))
+
+        other = self.get('/api/restaurants/nearby/?lat=40.7&lng=-73.0', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(other.status_code, 200)
+
+        Restaurant.objects.create(name='Pizzeria Nuova', address='1 Broadway', cuisine_type='Pizza', price_range='$')
+        changed = self.get('/api/restaurants/nearby/?lat=40.7&lng=-74.0', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], etag)
+
+    def test_recommendations_are_private_and_revalidated(self):
+        first = self.get('/api/recommendations/?cuisine[]=italian')
+        self.assertEqual(first['Cache-Control'], 'private, no-cache')
+        again = self.get('/api/recommendations/?cuisine[]=italian', HTTP_IF_NONE_MATCH=f'W/{first["ETag"]}')
+        self.assertEqual(again.status_code, 304)
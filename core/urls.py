@@ -17,6 +17,10 @@ urlpatterns = [
     path('api/chat/', views.chat_api, name='chat_api'),
     path('chat/endpoint/', views.chat_endpoint, name='chat_endpoint'),
     
+    # Metrics scrape endpoint
+    path('metrics/', views.metrics, name='metrics'),
+    path('debug/profiles/', views.slowest_profiles, name='slowest_profiles'),
+
     # Restaurant Catalog Service
     path('api/restaurants/search/', views.restaurant_search, name='restaurant_search'),
     path('api/restaurants/<int:restaurant_id>/', views.restaurant_detail, name='api_restaurant_detail'),
@@ -26,6 +30,8 @@ urlpatterns = [
     
     # Reservation Service
     path('api/reservations/check-availability/', views.check_availability, name='check_availability'),
+    path('api/reservations/availability/', views.availability_grid, name='availability_grid'),
+    path('api/reservations/find-table/', views.find_table, name='find_table'),
     path('api/reservations/create/', views.create_reservation, name='create_reservation'),
     
     # Recommendation Service
@@ -1,22 +1,44 @@
+import contextvars
 import logging
-from openai import OpenAI
-import pandas as pd
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 from django.conf import settings
-from .models import Restaurant, Reservation
-from datetime import datetime
+from django.db import connections
+from . import profiling
+from .models import Restaurant
 import json
 from typing import Dict, List, Any
 import os
 from django.db.models import Q
 from .services import RestaurantCatalogService, ReservationService, RecommendationService, LocationService
-import requests
+from .enrichment import enrichment_queue
+from .admission import LLMOverloaded
+from .fallback import catalog_only_response
+from .llm import chat_completion
+from .context import build_restaurant_context
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
-# Initialize OpenAI client
-client = OpenAI(api_key=settings.OPENAI_API_KEY)
+# Shared OpenAI client, created on first use: importing openai is the slowest
+# part of loading this module, and views, commands and tests that never call
+# the model should not pay for it
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from openai import OpenAI
+                # Retries are handled by the LLM gateway so they can be counted
+                _client = OpenAI(api_key=settings.OPENAI_API_KEY, base_url=settings.OPENAI_BASE_URL,
+                                 timeout=settings.LLM_TIMEOUT, max_retries=0)
+    return _client
 
 # OpenAI function definitions
 OPENAI_FUNCTIONS = [
@@ -84,6 +106,50 @@ OPENAI_FUNCTIONS = [
             }
         }
     },
+    {
+        "type": "function",
+        "function": {
+            "name": "find_table",
+            "description": "Find restaurants matching the criteria that have a free table near a given date and time",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "date": {
+                        "type": "string",
+                        "format": "date",
+                        "description": "Date for the reservation (YYYY-MM-DD)"
+                    },
+                    "time": {
+                        "type": "string",
+                        "format": "time",
+                        "description": "Preferred time (HH:MM)"
+                    },
+                    "party_size": {
+                        "type": "integer",
+                        "description": "Number of people"
+                    },
+                    "flexibility_minutes": {
+                        "type": "integer",
+                        "description": "How far from the preferred time a table may be, in minutes (default 30)"
+                    },
+                    "cuisine_type": {
+                        "type": "string",
+                        "description": "Type of cuisine"
+                    },
+                    "price_range": {
+                        "type": "string",
+                        "enum": ["$", "$$", "$$$", "$$$$"],
+                        "description": "Price range for restaurants"
+                    },
+                    "location": {
+                        "type": "string",
+                        "description": "Location to search for restaurants"
+                    }
+                },
+                "required": ["date", "time", "party_size"]
+            }
+        }
+    },
     {
         "type": "function",
         "function": {
@@ -160,74 +226,206 @@ OPENAI_FUNCTIONS = [
 
 # Function removed as per user request
 
+# Shared pool for executing the tool calls of a single model turn concurrently.
+# Bounded so that a burst of chat requests cannot open unlimited DB connections.
+_tool_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'TOOL_CALL_MAX_WORKERS', 4),
+    thread_name_prefix='chat-tool'
+)
+
 class RestaurantAI:
 
     def __init__(self):
         try:
-            self.client = OpenAI(api_key=settings.OPENAI_API_KEY)
             if not settings.OPENAI_API_KEY:
                 raise ValueError("OpenAI API key is not set")
+            self.client = get_client()
+            self.model = "gpt-3.5-turbo-0125"
+            self.conversation_history = []
+            # (function name, seconds) for every tool executed by the last request
+            self.tool_latencies = []
             logger.info("OpenAI client initialized successfully")
         except Exception as e:
             logger.error(f"Error initializing OpenAI client: {str(e)}")
             raise
 
+    def _get_system_prompt(self):
+        """Return the system prompt that defines the AI's role"""
+        return ("You are an expert restaurant recommender. Help users find the perfect restaurant by "
+                "considering their preferences, occasion, and needs. Be conversational and provide "
+                "detailed, personalized recommendations.")
+
     def process_user_input(self, user_input, user=None, csv_file_path=None):
         """Process user input and return appropriate response using OpenAI function calling"""
         if csv_file_path:
             import_restaurants_from_csv(csv_file_path)
 
-        """Process user input and return appropriate response using OpenAI function calling"""
         try:
             if not user_input:
                 return "I didn't receive any input. How can I help you?"
 
             logger.info(f"Processing user input: {user_input}")
-            
+            self.tool_latencies = []
+
             # Create the messages list with system message for better context
             messages = [
-                {"role": "system", "content": "You are an expert restaurant recommender. Help users find the perfect restaurant by considering their preferences, occasion, and needs. Be conversational and provide detailed, personalized recommendations."},
+                {"role": "system", "content": self._get_system_prompt()},
                 {"role": "user", "content": user_input}
             ]
 
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo-0125",  # Using the latest model version
+            max_rounds = getattr(settings, 'TOOL_CALL_MAX_ROUNDS', 3)
+            for _ in range(max_rounds):
+                response = chat_completion(
+                    self.client,
+                    model=self.model,
+                    messages=messages,
+                    tools=OPENAI_FUNCTIONS,
+                    tool_choice="auto"
+                )
+
+                logger.info("Received response from OpenAI")
+                response_message = response.choices[0].message
+
+                if not response_message.tool_calls:
+                    # Ensure we always return a string
+                    return response_message.content or "I understand your request. How else can I help you?"
+
+                # Echo the assistant turn, then answer every tool call it made
+                messages.append({
+                    "role": "assistant",
+                    "content": response_message.content,
+                    "tool_calls": [{
+                        "id": tool_call.id,
+                        "type": "function",
+                        "function": {
+                            "name": tool_call.function.name,
+                            "arguments": tool_call.function.arguments
+                        }
+                    } for tool_call in response_message.tool_calls]
+                })
+                for tool_call_id, output in self._execute_tool_calls(response_message.tool_calls, user):
+                    messages.append({"role": "tool", "tool_call_id": tool_call_id, "content": output})
+
+            # Round limit reached: ask for a final answer without further tool use
+            response = chat_completion(
+                self.client,
+                model=self.model,
                 messages=messages,
                 tools=OPENAI_FUNCTIONS,
-                tool_choice="auto"
+                tool_choice="none"
             )
+            return response.choices[0].message.content or "I understand your request. How else can I help you?"
 
-            logger.info("Received response from OpenAI")
-            response_message = response.choices[0].message
-
-            if response_message.tool_calls:
-                tool_call = response_message.tool_calls[0]
-                function_name = tool_call.function.name
-                function_args = json.loads(tool_call.function.arguments)
-                
-                logger.info(f"Function called: {function_name} with args: {function_args}")
-                
-                if function_name == "search_restaurants":
-                    return self._handle_restaurant_search(function_args)
-                elif function_name == "check_availability":
-                    return self._handle_availability_check(function_args)
-                elif function_name == "make_reservation":
-                    if not user:
-                        return "To make a reservation, please log in first. However, I can still help you find restaurants and check availability!"
-                    return self._handle_reservation(function_args, user)
-                elif function_name == "recommend_restaurants":
-                    return self._handle_restaurant_recommendations(function_args)
-            
-            # Ensure we always return a string
-            if not response_message.content:
-                return "I understand your request. How else can I help you?"
-                
-            return response_message.content
-
+        except LLMOverloaded as e:
+            return catalog_only_response(user_input, user, reason=e.reason)
         except Exception as e:
             logger.error(f"Error in process_user_input: {str(e)}", exc_info=True)
             return "I apologize, but I encountered an error processing your request. Please try again or rephrase your question."
 
+    def _execute_tool_calls(self, tool_calls, user=None):
+        """
+        Run all tool calls of one model turn concurrently on the shared pool.
+        Returns (tool_call_id, output) pairs in the order the model issued them.
+        Each tool runs in a copy of the request's context, so context variables
+        set for the request follow it onto the pool thread, and a profiled
+        request also times the queries the tool makes there.
+        """
+        futures = [
+            (tool_call.id, _tool_executor.submit(
+                contextvars.copy_context().run, profiling.run_profiled, self._run_tool_call, tool_call, user))
+            for tool_call in tool_calls
+        ]
+        results = []
+        for tool_call_id, future in futures:
+            function_name, output, elapsed = future.result()
+            self.tool_latencies.append((function_name, elapsed))
+            results.append((tool_call_id, output))
+        return results
+
+    def _run_tool_call(self, tool_call, user=None):
+        """Dispatch a single tool call and time it. Runs on a pool thread."""
+        function_name = tool_call.function.name
+        started = time.perf_counter()
+        try:
+            function_args = json.loads(tool_call.function.arguments or "{}")
+            logger.info(f"Function called: {function_name} with args: {function_args}")
+
+            if function_name == "search_restaurants":
+                output = self._handle_restaurant_search(function_args)
+            elif function_name == "check_availability":
+                output = self._handle_availability_check(function_args)
+            elif function_name == "find_table":
+                output = self._handle_find_table(function_args)
+            elif function_name == "make_reservation":
+                if not user or not user.is_authenticated:
+                    output = "To make a reservation, please log in first. However, I can still help you find restaurants and check availability!"
+                else:
+                    output = self._handle_reservation(function_args, user)
+            elif function_name == "recommend_restaurants":
+                output = self._handle_restaurant_recommendations(function_args)
+            else:
+                output = f"Unknown function: {function_name}"
+        except Exception as e:
+            logger.error(f"Error running tool {function_name}: {str(e)}", exc_info=True)
+            output = f"Sorry, I encountered an error running {function_name}."
+        finally:
+            # Pool threads keep their own DB connections; release them per task
+            connections.close_all()
+
+        elapsed = time.perf_counter() - started
+        logger.info(f"Tool {function_name} completed in {elapsed * 1000:.1f}ms")
+        return function_name, output, elapsed
+
+    def generate_streaming_response(self, user_message, user=None):
+        """Generate a streaming response for real-time conversation"""
+        try:
+            # Add user message to conversation history
+            self.conversation_history.append({"role": "user", "content": user_message})
+
+            # Prepare messages for API call
+            messages = [
+                {"role": "system", "content": self._get_system_prompt()},
+                # Add contextual information about the user if available
+                *([] if not user or user.is_anonymous else [
+                    {"role": "system", "content": f"The user's name is {user.username}. Personalize your responses appropriately."}
+                ]),
+                # Add conversation history (limited to last 10 exchanges for brevity)
+                *self.conversation_history[-10:]
+            ]
+
+            # Return the stream object to be processed by the view
+            return chat_completion(
+                self.client,
+                model=self.model,
+                messages=messages,
+                temperature=0.7,
+                max_tokens=800,
+                stream=True
+            )
+
+        except LLMOverloaded:
+            # Let the view degrade to a catalog-only answer
+            raise
+        except Exception as e:
+            logger.error(f"Error in OpenAI streaming API call: {str(e)}")
+            return None
+
+    def handle_stream_response(self, stream):
+        """Yield the text deltas of a streaming response and collect the full message"""
+        full_response = ""
+        try:
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    content_chunk = chunk.choices[0].delta.content
+                    full_response += content_chunk
+                    yield content_chunk
+
+            # After streaming completes, add the full response to conversation history
+            self.conversation_history.append({"role": "assistant", "content": full_response})
+
+        except Exception as e:
+            logger.error(f"Error processing stream: {str(e)}")
+
     def _handle_restaurant_search(self, args):
         """Handle restaurant search based on provided criteria"""
         try:
@@ -248,73 +446,23 @@ class RestaurantAI:
                 for restriction in args["dietary_restrictions"]:
                     query = query.filter(dietary_options__contains=[restriction])
 
-            restaurants = query[:5]  # Limit to top 5 results
-            
+            restaurants = list(query[:5])  # Limit to top 5 results
+
             if not restaurants:
-                # Auto-populate restaurants from OpenAI when no results found
+                # Grow the catalog in the background instead of blocking on the LLM
                 try:
-                    new_restaurants = self._populate_restaurants_from_ai(args)
-                    if new_restaurants:
-                        return self._format_restaurant_results(new_restaurants)
+                    enrichment_queue.enqueue(args)
+                    return ("I don't have any matching restaurants in my catalog yet. I'm fetching more "
+                            "options for this search now - please ask again in a minute.")
                 except Exception as e:
-                    logger.error(f"Error auto-populating restaurants: {str(e)}")
-            
+                    logger.error(f"Error queueing restaurant enrichment: {str(e)}")
+
             return self._format_restaurant_results(restaurants)
 
         except Exception as e:
             logger.error(f"Error in _handle_restaurant_search: {str(e)}", exc_info=True)
             return "Sorry, I encountered an error while searching for restaurants."
 
-    def _populate_restaurants_from_ai(self, search_args):
-        """Populate restaurant data using OpenAI when no results found"""
-        try:
-            # Create a prompt for OpenAI to generate restaurant data
-            prompt = f"Generate 5 realistic restaurant entries for {search_args.get('cuisine_type', 'various')} cuisine "
-            prompt += f"in {search_args.get('location', 'the area')}. Include name, address, price range ($-$$$$), "
-            prompt += "rating (1-5), cuisine type, and dietary options. Format as JSON."
-
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo-0125",
-                messages=[
-                    {"role": "system", "content": "You are a restaurant database expert. Provide realistic restaurant data in JSON format."},
-                    {"role": "user", "content": prompt}
-                ],
-                response_format={ "type": "json_object" }
-            )
-
-            # Parse the JSON response
-            restaurants_data = json.loads(response.choices[0].message.content)
-            new_restaurants = []
-
-            # Create restaurant entries in the database
-            for restaurant_data in restaurants_data.get('restaurants', []):
-                restaurant = Restaurant.objects.create(
-                    name=restaurant_data['name'],
-                    address=restaurant_data['address'],
-                    cuisine_type=restaurant_data.get('cuisine_type', search_args.get('cuisine_type', '')),
-                    price_range=restaurant_data.get('price_range', '$$'),
-                    rating=float(restaurant_data.get('rating', 4.0)),
-                    dietary_options=restaurant_data.get('dietary_options', []),
-                    operating_hours=restaurant_data.get('operating_hours', {
-                        'monday': '11:00-22:00',
-                        'tuesday': '11:00-22:00',
-                        'wednesday': '11:00-22:00',
-                        'thursday': '11:00-22:00',
-                        'friday': '11:00-23:00',
-                        'saturday': '11:00-23:00',
-                        'sunday': '11:00-22:00'
-                    }),
-                    capacity=restaurant_data.get('capacity', 50)
-                )
-                new_restaurants.append(restaurant)
-
-            logger.info(f"Successfully auto-populated {len(new_restaurants)} restaurants")
-            return new_restaurants
-
-        except Exception as e:
-            logger.error(f"Error in _populate_restaurants_from_ai: {str(e)}")
-            raise
-
     def _format_restaurant_results(self, restaurants):
         """Format restaurant results into a readable string"""
         if not restaurants:
@@ -336,56 +484,67 @@ class RestaurantAI:
         """Check restaurant availability"""
         try:
             restaurant = Restaurant.objects.get(id=args["restaurant_id"])
-            datetime_str = f"{args['date']} {args['time']}"
-            reservation_time = datetime.strptime(datetime_str, '%Y-%m-%d %H:%M')
-            
-            # Check if restaurant is open
-            day_of_week = reservation_time.strftime('%A').lower()
-            if day_of_week not in restaurant.operating_hours:
-                return f"Sorry, {restaurant.name} is closed on {day_of_week}."
-
-            # Check existing reservations
-            existing_reservations = Reservation.objects.filter(
-                restaurant=restaurant,
-                reservation_time=reservation_time,
-                status='confirmed'
+            result = ReservationService.check_availability(
+                restaurant.id, args['date'], args['time'], args['party_size']
             )
-            
-            total_guests = sum(r.party_size for r in existing_reservations)
-            available_capacity = restaurant.capacity - total_guests
-            
-            if available_capacity >= args["party_size"]:
+
+            if result.get('available'):
                 return f"Great news! {restaurant.name} is available for {args['party_size']} people at {args['time']} on {args['date']}."
-            else:
-                return f"Sorry, {restaurant.name} is fully booked at that time. Maybe try a different time?"
-            
+            if result.get('error'):
+                return f"Sorry, I couldn't check {restaurant.name}: {result['error']}."
+            reply = f"Sorry, {restaurant.name} can't take that booking: {result.get('message', 'fully booked')}."
+            if result.get('alternative_times'):
+                reply += f" You could try {', '.join(result['alternative_times'])}."
+            return reply
+
         except Restaurant.DoesNotExist:
             return "Sorry, I couldn't find that restaurant."
         except Exception as e:
             logger.error(f"Error in _handle_availability_check: {str(e)}", exc_info=True)
             return "Sorry, I encountered an error checking availability."
 
+    def _handle_find_table(self, args):
+        """Find restaurants with a free table near the requested time"""
+        try:
+            filters = {key: args[key] for key in ('cuisine_type', 'price_range', 'location') if args.get(key)}
+            result = ReservationService.find_tables(
+                filters, args['date'], args['time'], args['party_size'],
+                flexibility_minutes=args.get('flexibility_minutes', 30), limit=5
+            )
+            if result.get('error'):
+                return f"Sorry, I couldn't search for tables: {result['error']}."
+            if not result['results']:
+                return (f"I couldn't find a table for {args['party_size']} near {args['time']} on "
+                        f"{args['date']}. Try another time or relaxing the criteria.")
+
+            reply = f"Restaurants with a table for {args['party_size']} near {args['time']} on {args['date']}:\n\n"
+            for restaurant in result['results']:
+                reply += f"- {restaurant['name']} (ID: {restaurant['id']}, {restaurant['price_range']})\n"
+                reply += f"  Cuisine: {restaurant['cuisine_type']}, Rating: {restaurant['rating']}/5.0\n"
+                reply += f"  Open times: {', '.join(restaurant['open_times'])}\n\n"
+            return reply
+
+        except Exception as e:
+            logger.error(f"Error in _handle_find_table: {str(e)}", exc_info=True)
+            return "Sorry, I encountered an error searching for tables."
+
     def _handle_reservation(self, args, user):
         """Handle restaurant reservation"""
         try:
             restaurant = Restaurant.objects.get(id=args["restaurant_id"])
-            datetime_str = f"{args['date']} {args['time']}"
-            reservation_time = datetime.strptime(datetime_str, '%Y-%m-%d %H:%M')
-
-            # Create new reservation
-            reservation = Reservation.objects.create(
-                restaurant=restaurant,
-                user=user,
-                party_size=args["party_size"],
-                reservation_time=reservation_time,
+            result = ReservationService.create_reservation(
+                restaurant.id, user, args['date'], args['time'], args['party_size'],
                 special_requests=args.get("special_requests", ""),
                 status="confirmed"
             )
-            
+
+            if not result.get('success'):
+                reason = result.get('message') or result.get('error') or 'no availability'
+                return f"Sorry, I couldn't book {restaurant.name}: {reason}."
             return (f"Perfect! I've made a reservation for {args['party_size']} people at "
                    f"{restaurant.name} on {args['date']} at {args['time']}.\n"
-                   f"Your reservation ID is: {reservation.id}")
-            
+                   f"Your reservation ID is: {result['reservation_id']}")
+
         except Restaurant.DoesNotExist:
             return "Sorry, I couldn't find that restaurant."
         except Exception as e:
@@ -403,7 +562,7 @@ class RestaurantAI:
             
             # Filter by cuisine preferences
             if "cuisine_preferences" in args and args["cuisine_preferences"]:
-                query = query.filter(cuisine_type__in(args["cuisine_preferences"]))
+                query = query.filter(cuisine_type__in=args["cuisine_preferences"])
             
             # Filter by dietary restrictions
             if "dietary_restrictions" in args and args["dietary_restrictions"]:
@@ -449,7 +608,8 @@ def extract_criteria_from_message(message: str) -> Dict[str, Any]:
     Use OpenAI to extract search criteria from user message
     """
     try:
-        response = client.chat.completions.create(
+        response = chat_completion(
+            get_client(),
             model="gpt-3.5-turbo",
             messages=[
                 {"role": "system", "content": """You are a restaurant recommendation assistant. 
@@ -460,11 +620,15 @@ def extract_criteria_from_message(message: str) -> Dict[str, Any]:
                 - occasion (string)"""},
                 {"role": "user", "content": message}
             ],
-            response_format={ "type": "json_object" }
+            response_format={ "type": "json_object" },
+            # Same message, same criteria
+            cacheable=True
         )
         
         criteria = json.loads(response.choices[0].message.content)
         return criteria
+    except LLMOverloaded:
+        raise
     except Exception as e:
         logger.error(f"Error extracting criteria: {str(e)}")
         return {}
@@ -480,11 +644,8 @@ def generate_restaurant_response(message: str) -> str:
         # Get restaurant recommendations
         restaurants = get_restaurant_recommendations(criteria)
         
-        # Format restaurant list for OpenAI
-        restaurant_list = "\n".join([
-            f"- {r.name}: {r.cuisine_type} cuisine, {r.price_range}, located in {r.address}"
-            for r in restaurants
-        ])
+        # Pack the most relevant restaurants into a bounded, compact table
+        restaurant_list, _ = build_restaurant_context(restaurants, criteria)
         
         if not restaurant_list:
             restaurant_list = "No specific restaurants found matching your criteria."
@@ -497,7 +658,8 @@ def generate_restaurant_response(message: str) -> str:
         Please provide a helpful response recommending these restaurants in a natural way.
         If no restaurants match the criteria exactly, recommend the available ones that might be of interest."""
         
-        response = client.chat.completions.create(
+        response = chat_completion(
+            get_client(),
             model="gpt-3.5-turbo",
             messages=[
                 {"role": "system", "content": "You are a helpful restaurant recommendation assistant."},
@@ -508,6 +670,8 @@ def generate_restaurant_response(message: str) -> str:
         )
         
         return response.choices[0].message.content
+    except LLMOverloaded as e:
+        return catalog_only_response(message, reason=e.reason)
     except Exception as e:
         logger.error(f"Error generating response: {str(e)}", exc_info=True)
         return "I apologize, but I encountered an error while finding restaurant recommendations. Please try again."
@@ -518,183 +682,3 @@ def get_restaurant_recommendations(criteria: Dict[str, Any]) -> List[Restaurant]
     """
     # Use the dedicated RecommendationService instead of direct DB queries
     return RecommendationService.get_recommendations(criteria)
-
-def generate_restaurant_response(user_message):
-    """
-    Generate a response to a user message using OpenAI API
-    """
-    try:
-        api_key = settings.OPENAI_API_KEY
-        
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
-        
-        data = {
-            "model": "gpt-3.5-turbo",
-            "messages": [
-                {"role": "system", "content": "You are a helpful restaurant assistant. You provide information about restaurants, help with reservations, and give recommendations. Keep responses concise and helpful."},
-                {"role": "user", "content": user_message}
-            ],
-            "max_tokens": 300
-        }
-        
-        response = requests.post(
-            "https://api.openai.com/v1/chat/completions",
-            headers=headers,
-            json=data
-        )
-        
-        if response.status_code == 200:
-            return response.json()["choices"][0]["message"]["content"]
-        else:
-            logger.error(f"Error from OpenAI API: {response.status_code} - {response.text}")
-            return "Sorry, I'm having trouble processing your request right now. Please try again later."
-            
-    except Exception as e:
-        logger.error(f"Error generating restaurant response: {str(e)}")
-        return "I apologize, but I encountered an error. Please try again later."
-
-
-import os
-import logging
-import openai
-from django.conf import settings
-
-logger = logging.getLogger(__name__)
-
-# Configure OpenAI API key from Django settings
-openai.api_key = getattr(settings, 'OPENAI_API_KEY', os.getenv('OPENAI_API_KEY'))
-
-class RestaurantAI:
-    """
-    Class to handle all AI interactions for restaurant recommendations,
-    query understanding, and conversational abilities.
-    """
-    def __init__(self):
-        self.conversation_history = []
-        self.model = "gpt-4" # Update to "gpt-4.5-turbo" or actual model name when available
-    
-    def _get_system_prompt(self):
-        """Return the system prompt that defines the AI's role"""
-        return """You are RestaurantAI, a helpful assistant specializing in restaurant recommendations, 
-        cuisine information, and dining experiences. Provide helpful, accurate information about restaurants, 
-        food, reservations, and dining experiences. If users ask about making reservations, you can help them 
-        understand availability but direct them to use the app's reservation system for actual bookings. 
-        When recommending restaurants, be specific about cuisine types, price ranges, and special features.
-        If you don't know something, admit it rather than making up information."""
-    
-    def process_user_input(self, user_message, user=None):
-        """Process user input and generate a response"""
-        try:
-            # Add user message to conversation history
-            self.conversation_history.append({"role": "user", "content": user_message})
-            
-            # Prepare messages for API call
-            messages = [
-                {"role": "system", "content": self._get_system_prompt()},
-                # Add contextual information about the user if available
-                *([] if not user or user.is_anonymous else [
-                    {"role": "system", "content": f"The user's name is {user.username}. Personalize your responses appropriately."}
-                ]),
-                # Add conversation history (limited to last 10 exchanges for brevity)
-                *self.conversation_history[-10:]
-            ]
-            
-            # Call OpenAI API
-            response = openai.ChatCompletion.create(
-                model=self.model,
-                messages=messages,
-                temperature=0.7,
-                max_tokens=800,
-                top_p=1.0,
-                frequency_penalty=0.0,
-                presence_penalty=0.0,
-                stream=False
-            )
-            
-            # Extract response content
-            ai_response = response.choices[0].message["content"]
-            
-            # Add AI response to conversation history
-            self.conversation_history.append({"role": "assistant", "content": ai_response})
-            
-            return ai_response
-            
-        except Exception as e:
-            logger.error(f"Error in OpenAI API call: {str(e)}")
-            return "I'm sorry, I encountered an error while processing your request. Please try again later."
-    
-    def generate_streaming_response(self, user_message, user=None):
-        """Generate a streaming response for real-time conversation"""
-        try:
-            # Add user message to conversation history
-            self.conversation_history.append({"role": "user", "content": user_message})
-            
-            # Prepare messages for API call
-            messages = [
-                {"role": "system", "content": self._get_system_prompt()},
-                # Add contextual information about the user if available
-                *([] if not user or user.is_anonymous else [
-                    {"role": "system", "content": f"The user's name is {user.username}. Personalize your responses appropriately."}
-                ]),
-                # Add conversation history (limited to last 10 exchanges for brevity)
-                *self.conversation_history[-10:]
-            ]
-            
-            # Call OpenAI API with streaming enabled
-            stream = openai.ChatCompletion.create(
-                model=self.model,
-                messages=messages,
-                temperature=0.7,
-                max_tokens=800,
-                top_p=1.0,
-                frequency_penalty=0.0,
-                presence_penalty=0.0,
-                stream=True
-            )
-            
-            # Return the stream object to be processed by the view
-            return stream
-            
-        except Exception as e:
-            logger.error(f"Error in OpenAI streaming API call: {str(e)}")
-            return None
-    
-    def handle_stream_response(self, stream):
-        """Process the streaming response and collect the full message"""
-        full_response = ""
-        try:
-            for chunk in stream:
-                if chunk.choices and chunk.choices[0].delta.content:
-                    content_chunk = chunk.choices[0].delta.content
-                    full_response += content_chunk
-                    yield chunk
-                    
-            # After streaming completes, add the full response to conversation history
-            self.conversation_history.append({"role": "assistant", "content": full_response})
-            
-        except Exception as e:
-            logger.error(f"Error processing stream: {str(e)}")
-
-
-def generate_restaurant_response(message):
-    """
-    Utility function to generate a response regarding restaurant inquiries.
-    This is a simplified version that doesn't track conversation history.
-    """
-    try:
-        response = openai.ChatCompletion.create(
-            model="gpt-4",  # Update to the appropriate model when available
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant specializing in restaurant recommendations and information."},
-                {"role": "user", "content": message}
-            ],
-            temperature=0.7,
-            max_tokens=500
-        )
-        return response.choices[0].message["content"]
-    except Exception as e:
-        logger.error(f"Error in generate_restaurant_response: {str(e)}")
-        return "I apologize, but I'm having trouble processing your request right now. Please try again later."
@@ -1,17 +1,30 @@
+from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
 from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.contrib import messages
+from django.core.handlers.asgi import ASGIRequest
 from django.middleware.csrf import get_token
+import hmac
 import json
 import logging
+import time
+from datetime import datetime
+from django.utils import timezone
 from .models import Restaurant, Review, Reservation
 from .utils import RestaurantAI, generate_restaurant_response
+from .streaming import SSEStream
+from .admission import LLMOverloaded
+from .fallback import catalog_only_response
+from . import profiling
+from .httpcache import catalog_etag, catalog_response, not_modified
+from .telemetry import registry, track_endpoint
 from .services import (
     RestaurantCatalogService, 
     ReservationService, 
+    ReservationHistoryService,
     RecommendationService, 
     LocationService
 )
@@ -119,6 +132,7 @@ def home(request):
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@track_endpoint('chat_endpoint')
 def chat_endpoint(request):
     try:
         data = json.loads(request.body)
@@ -145,11 +159,26 @@ def restaurant_detail(request, restaurant_id):
 
 @login_required
 def my_reservations(request):
-    return render(request, 'core/my_reservations.html', {'reservations': []})
+    scope = 'past' if request.GET.get('scope') == 'past' else 'upcoming'
+    try:
+        reservations, next_cursor = ReservationHistoryService.get_page(
+            request.user, scope, cursor=request.GET.get('cursor')
+        )
+    except ValueError:
+        return redirect(f"{request.path}?scope={scope}")
+    return render(request, 'core/my_reservations.html', {
+        'reservations': reservations,
+        'scope': scope,
+        'next_cursor': next_cursor,
+        'counts': ReservationHistoryService.get_counts(request.user),
+    })
 
 @login_required
+@require_http_methods(["POST"])
 def cancel_reservation(request, reservation_id):
-    # Handle reservation cancellation
+    reservation = get_object_or_404(Reservation, id=reservation_id, user=request.user)
+    if ReservationService.cancel_reservation(reservation):
+        messages.success(request, f"Your reservation at {reservation.restaurant.name} was cancelled.")
     return redirect('core:my_reservations')
 
 def search_restaurants(request):
@@ -163,8 +192,10 @@ def chat_interface(request):
     })
 
 @csrf_exempt
+@track_endpoint('chat_api')
 def chat_api(request):
     """API endpoint for the chat interface with streaming support"""
+    started = time.perf_counter()
     try:
         if request.method == 'POST':
             data = json.loads(request.body)
@@ -177,18 +208,21 @@ def chat_api(request):
             
             if accepts_stream:
                 # Stream the response
-                stream = ai.generate_streaming_response(user_message, request.user)
+                try:
+                    stream = ai.generate_streaming_response(user_message, request.user)
+                except LLMOverloaded as e:
+                    return JsonResponse({
+                        'response': catalog_only_response(user_message, request.user, reason=e.reason),
+                        'degraded': True
+                    })
                 
                 if not stream:
                     return JsonResponse({'error': 'Failed to generate streaming response'}, status=500)
                 
-                def event_stream():
-                    for chunk in ai.handle_stream_response(stream):
-                        yield f"data: {json.dumps(chunk)}\n\n"
-                    yield "data: [DONE]\n\n"
-                
+                frames = SSEStream(ai.handle_stream_response(stream), name='chat_api', on_cancel=stream.close, started=started)
                 response = StreamingHttpResponse(
-                    event_stream(),
+                    # ASGI servers need an async iterator to stream instead of buffering
+                    frames.async_frames() if isinstance(request, ASGIRequest) else frames,
                     content_type='text/event-stream'
                 )
                 response['Cache-Control'] = 'no-cache'
@@ -204,7 +238,47 @@ def chat_api(request):
         logger.error(f"Error in chat_api: {str(e)}")
         return JsonResponse({'error': 'An error occurred'}, status=500)
 
+def _has_metrics_token(request):
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    return bool(token) and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+
+@require_http_methods(["GET"])
+def metrics(request):
+    """
+    Expose in-process metrics in the Prometheus text format. Staff or
+    METRICS_TOKEN only: the labels show per-caller LLM usage and cost.
+    """
+    if not (request.user.is_staff or _has_metrics_token(request)):
+        return HttpResponse('Forbidden', status=403, content_type='text/plain')
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@require_http_methods(["GET", "DELETE"])
+def slowest_profiles(request):
+    """Staff only: the slowest profiled requests of this process, slowest first; DELETE clears them"""
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Forbidden'}, status=403)
+    if request.method == 'DELETE':
+        profiling.slowest.clear()
+        return JsonResponse({'cleared': True})
+    return JsonResponse({'profiles': profiling.slowest.dump()})
+
 # Restaurant Catalog Service views
+def _open_at_param(request):
+    """Datetime from ?open_at=YYYY-MM-DDTHH:MM or ?open_now=1, else None. Raises ValueError."""
+    if request.GET.get('open_now') in ('1', 'true', 'yes'):
+        return timezone.now()
+    value = request.GET.get('open_at')
+    if not value:
+        return None
+    moment = datetime.fromisoformat(value)
+    return timezone.make_aware(moment) if timezone.is_naive(moment) else moment
+
+def _cache_params(filters):
+    """filters as a cache key; open_at only matters to the minute, like the hours bitmaps"""
+    if filters.get('open_at'):
+        return {**filters, 'open_at': filters['open_at'].isoformat(timespec='minutes')}
+    return filters
+
 @require_http_methods(["GET"])
 def restaurant_search(request):
     """Search for restaurants with filtering"""
@@ -219,22 +293,34 @@ def restaurant_search(request):
             'atmosphere': request.GET.get('atmosphere', None),
             'order_by': request.GET.get('order_by', '-rating')
         }
+        try:
+            filters['open_at'] = _open_at_param(request)
+        except ValueError:
+            return JsonResponse({'error': 'Invalid open_at, expected YYYY-MM-DDTHH:MM'}, status=400)
         
-        # Use service to perform search
-        restaurants = RestaurantCatalogService.search_restaurants(filters)
-        
-        # Format response
-        results = [{
-            'id': restaurant.id,
-            'name': restaurant.name,
-            'cuisine_type': restaurant.cuisine_type,
-            'price_range': restaurant.price_range,
-            'rating': float(restaurant.rating),
-            'address': restaurant.address,
-            'dietary_options': restaurant.dietary_options
-        } for restaurant in restaurants]
-        
-        return JsonResponse({'results': results})
+        params = _cache_params(filters)
+        etag = catalog_etag('search', params)
+        unchanged = not_modified(request, etag, 'search')
+        if unchanged:
+            return unchanged
+
+        def search():
+            # Use service to perform search
+            restaurants = RestaurantCatalogService.search_restaurants(filters)
+
+            # Format response
+            return [{
+                'id': restaurant.id,
+                'name': restaurant.name,
+                'cuisine_type': restaurant.cuisine_type,
+                'price_range': restaurant.price_range,
+                'rating': float(restaurant.rating),
+                'address': restaurant.address,
+                'dietary_options': restaurant.dietary_options
+            } for restaurant in restaurants]
+
+        results = RestaurantCatalogService.cached_result('search', params, search)
+        return catalog_response({'results': results}, etag)
     except Exception as e:
         logger.error(f"Error in restaurant_search: {str(e)}")
         return JsonResponse({'error': str(e)}, status=500)
@@ -265,19 +351,27 @@ def nearby_restaurants(request):
         if not (latitude and longitude):
             return JsonResponse({'error': 'Latitude and longitude are required'}, status=400)
         
-        restaurants = LocationService.find_nearby_restaurants(latitude, longitude, radius)
-        
-        results = [{
-            'id': restaurant.id,
-            'name': restaurant.name,
-            'cuisine_type': restaurant.cuisine_type,
-            'price_range': restaurant.price_range,
-            'rating': float(restaurant.rating),
-            'address': restaurant.address,
-            'distance': round(getattr(restaurant, 'distance', 0), 2)  # Distance in km
-        } for restaurant in restaurants]
-        
-        return JsonResponse({'results': results})
+        params = {'lat': latitude, 'lng': longitude, 'radius': radius}
+        etag = catalog_etag('nearby', params)
+        unchanged = not_modified(request, etag, 'nearby')
+        if unchanged:
+            return unchanged
+
+        def nearby():
+            restaurants = LocationService.find_nearby_restaurants(latitude, longitude, radius)
+
+            return [{
+                'id': restaurant.id,
+                'name': restaurant.name,
+                'cuisine_type': restaurant.cuisine_type,
+                'price_range': restaurant.price_range,
+                'rating': float(restaurant.rating),
+                'address': restaurant.address,
+                'distance': round(getattr(restaurant, 'distance', 0), 2)  # Distance in km
+            } for restaurant in restaurants]
+
+        results = RestaurantCatalogService.cached_result('nearby', params, nearby)
+        return catalog_response({'results': results}, etag)
     except Exception as e:
         logger.error(f"Error in nearby_restaurants: {str(e)}")
         return JsonResponse({'error': str(e)}, status=500)
@@ -304,6 +398,66 @@ def check_availability(request):
         logger.error(f"Error in check_availability: {str(e)}")
         return JsonResponse({'error': str(e)}, status=500)
 
+@require_http_methods(["GET"])
+def availability_grid(request):
+    """Availability matrix for a restaurant over a date range and time window"""
+    try:
+        restaurant_id = int(request.GET.get('restaurant_id', 0))
+        start_date = request.GET.get('start_date', '')
+        party_size = request.GET.get('party_size', '')
+
+        if not all([restaurant_id, start_date, party_size]):
+            return JsonResponse({'error': 'Missing required parameters'}, status=400)
+
+        grid = ReservationService.availability_grid(
+            restaurant_id,
+            start_date,
+            request.GET.get('days', 7),
+            request.GET.get('start_time', '00:00'),
+            request.GET.get('end_time', '23:59'),
+            party_size,
+        )
+        if 'error' in grid:
+            status = 404 if grid['error'] == 'Restaurant not found' else 400
+            return JsonResponse(grid, status=status)
+        return JsonResponse(grid)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid restaurant_id'}, status=400)
+    except Exception as e:
+        logger.error(f"Error in availability_grid: {str(e)}")
+        return JsonResponse({'error': str(e)}, status=500)
+
+@require_http_methods(["GET"])
+def find_table(request):
+    """Restaurants matching search filters that have a table near the requested time"""
+    try:
+        date = request.GET.get('date', '')
+        time = request.GET.get('time', '')
+        party_size = request.GET.get('party_size', '')
+
+        if not all([date, time, party_size]):
+            return JsonResponse({'error': 'Missing required parameters'}, status=400)
+
+        filters = {
+            'cuisine_type': request.GET.get('cuisine', ''),
+            'location': request.GET.get('location', ''),
+            'price_range': request.GET.get('price', ''),
+            'dietary_restrictions': request.GET.getlist('dietary[]', []),
+            'rating_min': request.GET.get('rating_min', None),
+            'atmosphere': request.GET.get('atmosphere', None),
+        }
+        result = ReservationService.find_tables(
+            filters, date, time, party_size,
+            flexibility_minutes=request.GET.get('flexibility', 30),
+            limit=request.GET.get('limit', 10),
+        )
+        if 'error' in result:
+            return JsonResponse(result, status=400)
+        return JsonResponse(result)
+    except Exception as e:
+        logger.error(f"Error in find_table: {str(e)}")
+        return JsonResponse({'error': str(e)}, status=500)
+
 @login_required
 @csrf_exempt
 @require_http_methods(["POST"])
@@ -316,12 +470,15 @@ def create_reservation(request):
         time = data.get('time')
         party_size = data.get('party_size')
         special_requests = data.get('special_requests', '')
+        # Clients retrying after a timeout send the same key to avoid double booking
+        idempotency_key = request.headers.get('Idempotency-Key') or data.get('idempotency_key')
         
         if not all([restaurant_id, date, time, party_size]):
             return JsonResponse({'error': 'Missing required parameters'}, status=400)
         
         result = ReservationService.create_reservation(
-            restaurant_id, request.user, date, time, party_size, special_requests
+            restaurant_id, request.user, date, time, party_size, special_requests,
+            idempotency_key=idempotency_key
         )
         
         return JsonResponse(result)
@@ -341,21 +498,38 @@ def get_recommendations(request):
             'price_range': request.GET.get('price', ''),
             'location': request.GET.get('location', '')
         }
+        try:
+            filters['open_at'] = _open_at_param(request)
+        except ValueError:
+            return JsonResponse({'error': 'Invalid open_at, expected YYYY-MM-DDTHH:MM'}, status=400)
         
-        restaurants = RecommendationService.get_recommendations(filters, request.user)
-        
-        results = [{
-            'id': restaurant.id,
-            'name': restaurant.name,
-            'cuisine_type': restaurant.cuisine_type,
-            'price_range': restaurant.price_range,
-            'rating': float(restaurant.rating),
-            'address': restaurant.address,
-            'atmosphere': restaurant.atmosphere,
-            'dietary_options': restaurant.dietary_options
-        } for restaurant in restaurants]
-        
-        return JsonResponse({'recommendations': results})
+        def recommend():
+            restaurants = RecommendationService.get_recommendations(filters, request.user)
+
+            return [{
+                'id': restaurant.id,
+                'name': restaurant.name,
+                'cuisine_type': restaurant.cuisine_type,
+                'price_range': restaurant.price_range,
+                'rating': float(restaurant.rating),
+                'address': restaurant.address,
+                'atmosphere': restaurant.atmosphere,
+                'dietary_options': restaurant.dietary_options
+            } for restaurant in restaurants]
+
+        # Personalised by booking history, so per user and for a shorter time
+        user_id = request.user.pk if request.user.is_authenticated else None
+        params = {**_cache_params(filters), 'user': user_id}
+        results = RestaurantCatalogService.cached_result(
+            'recommendations', params, recommend,
+            timeout=getattr(settings, 'RECOMMENDATION_CACHE_SECONDS', 120))
+        # Booking history can change the results under the same catalog version,
+        # so this tag also covers the results; a match still skips serializing them
+        etag = catalog_etag('recommendations', {**params, 'results': results})
+        unchanged = not_modified(request, etag, 'recommendations', cache_control='private, no-cache')
+        if unchanged:
+            return unchanged
+        return catalog_response({'recommendations': results}, etag, cache_control='private, no-cache')
     except Exception as e:
         logger.error(f"Error in get_recommendations: {str(e)}")
         return JsonResponse({'error': str(e)}, status=500)
@@ -0,0 +1,79 @@
+"""
+Warm-up run once per server before it accepts traffic.
+
+Under gunicorn with preload_app the master imports the project and calls
+warm() before forking, so every worker starts with these modules imported
+and these caches filled (shared copy-on-write) instead of paying for them on
+its first requests.
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+def _import_views():
+    # Pulls in the services and the URL conf
+    from django.urls import get_resolver
+    get_resolver().url_patterns
+
+
+def _llm_client():
+    # openai is imported lazily; load it here so workers inherit it
+    from .utils import get_client
+    get_client()
+
+
+def _hours_index():
+    from .hours import hours_index
+    hours_index.open_mask(timezone.now())
+
+
+def _known_cuisines():
+    from .fallback import _known_cuisines
+    _known_cuisines()
+
+
+def _context_rows():
+    from .context import row_cache
+    from .models import Restaurant
+    limit = getattr(settings, 'CONTEXT_ROW_CACHE_SIZE', 10000)
+    for restaurant in Restaurant.objects.order_by('-rating')[:limit].iterator(chunk_size=1000):
+        row_cache.get(restaurant)
+
+
+def _gates():
+    from .admission import get_controller
+    from .circuit import get_breaker
+    get_controller()
+    get_breaker()
+
+
+STEPS = [
+    ('import_views', _import_views),
+    ('llm_client', _llm_client),
+    ('hours_index', _hours_index),
+    ('known_cuisines', _known_cuisines),
+    ('context_rows', _context_rows),
+    ('llm_gates', _gates),
+]
+
+
+def warm():
+    """Run every warm-up step; failures are logged and skipped. Returns {step: seconds}."""
+    timings = {}
+    for name, step in STEPS:
+        started = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            logger.warning(f"Warm-up step {name} failed: {str(e)}")
+        timings[name] = time.perf_counter() - started
+    # Connections opened here must not be shared with forked workers
+    connections.close_all()
+    logger.info("Warm-up done: " + ', '.join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in timings.items()))
+    return timings
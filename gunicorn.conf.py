@@ -0,0 +1,50 @@
+"""
+Gunicorn settings for the two production roles, picked with SERVER_ROLE:
+
+  api     preforked sync workers running the WSGI app (catalog, booking, pages)
+  stream  uvicorn workers running the ASGI app, for long-lived chat streams
+
+    SERVER_ROLE=api gunicorn          # reads this file from the working directory
+    SERVER_ROLE=stream gunicorn
+
+The app is preloaded and warmed (core.warmup) in the master before workers
+fork. Workers are recycled after a jittered number of requests and get
+graceful_timeout seconds to finish in-flight requests on reload or shutdown.
+"""
+import multiprocessing
+import os
+
+role = os.getenv('SERVER_ROLE', 'api')
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+preload_app = True
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '2000'))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', '200'))
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-') or None
+
+if role == 'stream':
+    wsgi_app = 'restaurant.asgi:application'
+    worker_class = 'uvicorn_worker.UvicornWorker'
+    workers = int(os.getenv('WEB_CONCURRENCY', '2'))
+    # A chat stream may legitimately stay open for minutes
+    timeout = int(os.getenv('GUNICORN_TIMEOUT', '300'))
+    keepalive = 75
+else:
+    wsgi_app = 'restaurant.wsgi:application'
+    worker_class = 'sync'
+    workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+    timeout = int(os.getenv('GUNICORN_TIMEOUT', '30'))
+    keepalive = 2
+
+
+def when_ready(server):
+    # The app is already imported (preload_app); fill caches once in the master
+    from core.warmup import warm
+    warm()
+
+
+def post_fork(server, worker):
+    # Never reuse a database connection inherited from the master
+    from django.db import connections
+    connections.close_all()
@@ -32,10 +32,16 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # Serves collected static files when DEBUG is off (gunicorn has no static handler)
+    'whitenoise.middleware.WhiteNoiseMiddleware',
+    # gzip/brotli for /api/ responses, above the app middleware so it sees final bodies (see core.httpcache)
+    'core.httpcache.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # Opt-in per-request SQL/LLM/service timing (see core.profiling)
+    'core.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -65,8 +71,76 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Keep connections open between requests (seconds; 0 closes after each)
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '60')),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # Take the write lock when a transaction starts, so two writers
+            # wait on busy_timeout instead of deadlocking on lock upgrade
+            'transaction_mode': 'IMMEDIATE',
+        },
+        # A file rather than the in-memory default so threaded tests see real locking
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+    }
+}
+
+# Read-only connections to the same file for catalog reads (see core.db)
+CATALOG_DATABASE = 'catalog'
+DATABASES[CATALOG_DATABASE] = {
+    **DATABASES['default'],
+    'OPTIONS': {},
+    'TEST': {'MIRROR': 'default'},
+}
+DATABASE_ROUTERS = ['core.db.CatalogRouter']
+
+# Applied to every new SQLite connection by core.db.configure_sqlite
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000')),
+    'synchronous': 'NORMAL',
+    'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024))),
+    # Negative means KiB rather than pages
+    'cache_size': -int(os.getenv('SQLITE_CACHE_SIZE_KB', '65536')),
+    'temp_store': 'MEMORY',
+}
+
+# One SQLite file shared by every worker on the host (see core.sharedcache):
+# bounded by MAX_SIZE bytes and MAX_ENTRIES entries with LRU eviction, and
+# pickles from COMPRESS_MIN_SIZE bytes up are zlib-compressed
+CACHES = {
+    'default': {
+        'BACKEND': 'core.sharedcache.SQLiteCache',
+        'LOCATION': os.getenv('CACHE_LOCATION', str(BASE_DIR / 'cache.sqlite3')),
+        'TIMEOUT': int(os.getenv('CACHE_TIMEOUT', '300')),
+        'OPTIONS': {
+            'MAX_SIZE': int(os.getenv('CACHE_MAX_SIZE', str(256 * 1024 * 1024))),
+            'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', '200000')),
+            'COMPRESS_MIN_SIZE': int(os.getenv('CACHE_COMPRESS_MIN_SIZE', '1024')),
+        },
     }
 }
+# How long catalog results (search, nearby), recommendations and
+# deterministic LLM responses are cached, in seconds. Catalog entries are
+# also dropped as soon as a restaurant changes.
+CATALOG_CACHE_SECONDS = int(os.getenv('CATALOG_CACHE_SECONDS', '300'))
+RECOMMENDATION_CACHE_SECONDS = int(os.getenv('RECOMMENDATION_CACHE_SECONDS', '120'))
+LLM_RESPONSE_CACHE_SECONDS = int(os.getenv('LLM_RESPONSE_CACHE_SECONDS', '86400'))
+
+# Compression of /api/ responses: bodies smaller than API_COMPRESSION_MIN_SIZE
+# bytes are sent as is; brotli is used when installed and accepted
+API_COMPRESSION_MIN_SIZE = int(os.getenv('API_COMPRESSION_MIN_SIZE', '1024'))
+API_GZIP_LEVEL = int(os.getenv('API_GZIP_LEVEL', '6'))
+API_BROTLI_QUALITY = int(os.getenv('API_BROTLI_QUALITY', '5'))
+
+# Memory-mapped catalog snapshot written by `manage.py snapshot_catalog` and
+# shared by every worker (see core.snapshot); how often (seconds) workers
+# look for a newly published one
+CATALOG_SNAPSHOT_PATH = os.getenv('CATALOG_SNAPSHOT_PATH', str(BASE_DIR / 'catalog.snapshot'))
+CATALOG_SNAPSHOT_CHECK_INTERVAL = float(os.getenv('CATALOG_SNAPSHOT_CHECK_INTERVAL', '1.0'))
+
+# Longest restaurant id list an "open at" filter sends to the database; past
+# it, SQLite tests the compiled hours bitmaps in the query instead
+HOURS_FILTER_MAX_IDS = int(os.getenv('HOURS_FILTER_MAX_IDS', '5000'))
 
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
@@ -108,6 +182,101 @@ LOGIN_URL = 'core:login'  # Update to use the namespaced URL
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 if not OPENAI_API_KEY:
     raise ValueError("No OpenAI API key found. Please set the OPENAI_API_KEY environment variable.")
+# Optional alternative endpoint, e.g. the local mock from `manage.py mock_llm_server`
+OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL') or None
+
+# LLM gateway: retry policy for transient upstream errors and prices in USD
+# per million (input, output) tokens, matched by model-name prefix
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '2'))
+LLM_RETRY_BACKOFF = float(os.getenv('LLM_RETRY_BACKOFF', '0.5'))
+# Share one upstream call between identical requests that are in flight together
+LLM_COALESCE = os.getenv('LLM_COALESCE', 'True') == 'True'
+# Admission control for outbound LLM calls: concurrent calls, token budget per
+# minute, callers allowed to wait (overall and per client) and the longest wait
+# in seconds before a call is shed to the catalog-only answer
+LLM_ADMISSION_ENABLED = os.getenv('LLM_ADMISSION_ENABLED', 'True') == 'True'
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '8'))
+LLM_TOKENS_PER_MINUTE = int(os.getenv('LLM_TOKENS_PER_MINUTE', '90000'))
+LLM_ADMISSION_QUEUE_SIZE = int(os.getenv('LLM_ADMISSION_QUEUE_SIZE', '32'))
+LLM_ADMISSION_QUEUE_PER_CLIENT = int(os.getenv('LLM_ADMISSION_QUEUE_PER_CLIENT', '4'))
+LLM_ADMISSION_TIMEOUT = float(os.getenv('LLM_ADMISSION_TIMEOUT', '2.0'))
+# Per-attempt upstream timeout in seconds
+LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', '20'))
+# Circuit breaker: over a rolling window (seconds, minimum calls), trip when the
+# error share or the share of calls slower than LLM_CIRCUIT_SLOW_CALL seconds
+# reaches its threshold; probe again after LLM_CIRCUIT_OPEN_SECONDS
+LLM_CIRCUIT_ENABLED = os.getenv('LLM_CIRCUIT_ENABLED', 'True') == 'True'
+LLM_CIRCUIT_WINDOW = float(os.getenv('LLM_CIRCUIT_WINDOW', '30'))
+LLM_CIRCUIT_MIN_CALLS = int(os.getenv('LLM_CIRCUIT_MIN_CALLS', '10'))
+LLM_CIRCUIT_ERROR_THRESHOLD = float(os.getenv('LLM_CIRCUIT_ERROR_THRESHOLD', '0.5'))
+LLM_CIRCUIT_SLOW_CALL = float(os.getenv('LLM_CIRCUIT_SLOW_CALL', '10'))
+LLM_CIRCUIT_SLOW_THRESHOLD = float(os.getenv('LLM_CIRCUIT_SLOW_THRESHOLD', '0.5'))
+LLM_CIRCUIT_OPEN_SECONDS = float(os.getenv('LLM_CIRCUIT_OPEN_SECONDS', '30'))
+LLM_PRICING = {
+    'gpt-3.5-turbo': (0.50, 1.50),
+    'gpt-4o-mini': (0.15, 0.60),
+    'gpt-4o': (2.50, 10.00),
+    'gpt-4': (30.00, 60.00),
+}
+
+# /metrics/ is open to staff users and to scrapers that send
+# "Authorization: Bearer <METRICS_TOKEN>"; with no token set only staff get in
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Retrieval context for generate_restaurant_response: prompt token budget for
+# the restaurant table, rows considered per query, and encoded rows cached
+CONTEXT_TOKEN_BUDGET = int(os.getenv('CONTEXT_TOKEN_BUDGET', '600'))
+CONTEXT_MAX_CANDIDATES = int(os.getenv('CONTEXT_MAX_CANDIDATES', '200'))
+CONTEXT_ROW_CACHE_SIZE = int(os.getenv('CONTEXT_ROW_CACHE_SIZE', '10000'))
+
+# Chat tool calling: pool size for concurrent tool execution and the maximum
+# number of model/tool round trips per user message
+TOOL_CALL_MAX_WORKERS = int(os.getenv('TOOL_CALL_MAX_WORKERS', '4'))
+TOOL_CALL_MAX_ROUNDS = int(os.getenv('TOOL_CALL_MAX_ROUNDS', '3'))
+
+# Background catalog enrichment: worker threads per process (0 leaves jobs to
+# `manage.py run_enrichment_worker`), retries before a job is marked failed and
+# the seconds a claimed job may run before it counts as abandoned by a dead
+# worker and is claimed again
+ENRICHMENT_WORKERS = int(os.getenv('ENRICHMENT_WORKERS', '1'))
+ENRICHMENT_MAX_ATTEMPTS = int(os.getenv('ENRICHMENT_MAX_ATTEMPTS', '3'))
+ENRICHMENT_LEASE_SECONDS = int(os.getenv('ENRICHMENT_LEASE_SECONDS', '300'))
+
+# Reservation availability: size in minutes of the buckets seatings are counted
+# in (run `manage.py rebuild_occupancy` after changing it), the longest date
+# range the availability grid API will compute and the restaurants a
+# "find me a table" search checks
+AVAILABILITY_SLOT_MINUTES = int(os.getenv('AVAILABILITY_SLOT_MINUTES', '15'))
+AVAILABILITY_GRID_MAX_DAYS = int(os.getenv('AVAILABILITY_GRID_MAX_DAYS', '31'))
+AVAILABILITY_SEARCH_MAX_CANDIDATES = int(os.getenv('AVAILABILITY_SEARCH_MAX_CANDIDATES', '200'))
+
+# Reservation history: page size, how long per-user upcoming/past counts are
+# cached (seconds), and the age in days after which `manage.py
+# archive_reservations` moves completed and cancelled bookings to the archive
+RESERVATION_HISTORY_PAGE_SIZE = int(os.getenv('RESERVATION_HISTORY_PAGE_SIZE', '20'))
+RESERVATION_COUNTS_CACHE_SECONDS = int(os.getenv('RESERVATION_COUNTS_CACHE_SECONDS', '300'))
+RESERVATION_ARCHIVE_DAYS = int(os.getenv('RESERVATION_ARCHIVE_DAYS', '90'))
+
+# Request profiling: share of requests profiled without an X-Profile header,
+# the sampling interval (seconds) of "X-Profile: stack" and how many of the
+# slowest profiles /debug/profiles/ keeps
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', '0'))
+PROFILING_STACK_INTERVAL = float(os.getenv('PROFILING_STACK_INTERVAL', '0.005'))
+PROFILING_KEEP_SLOWEST = int(os.getenv('PROFILING_KEEP_SLOWEST', '50'))
+
+# Cold start: the most django.setup() plus importing the URL conf may take, in
+# milliseconds (checked by the test suite and `manage.py profile_startup`)
+STARTUP_IMPORT_BUDGET_MS = float(os.getenv('STARTUP_IMPORT_BUDGET_MS', '1000'))
+
+# Service benchmark baseline written by `manage.py bench_services --save` and
+# checked by `--compare`
+BENCHMARK_BASELINE = os.getenv('BENCHMARK_BASELINE', str(BASE_DIR / 'benchmarks' / 'services.json'))
+
+# Server-sent events: coalesce tokens into one frame per window (seconds) or
+# size (characters), and send a heartbeat comment after this many idle seconds
+SSE_FLUSH_INTERVAL = float(os.getenv('SSE_FLUSH_INTERVAL', '0.05'))
+SSE_FLUSH_SIZE = int(os.getenv('SSE_FLUSH_SIZE', '256'))
+SSE_HEARTBEAT_INTERVAL = float(os.getenv('SSE_HEARTBEAT_INTERVAL', '15'))
 
 # Logging Configuration
 LOGGING = {